@@ -9,8 +9,18 @@ setup(
         "ollama>=0.3.3",
         "chromadb>=0.4.22",
         "flask>=2.0.1",
+        "click>=8.0",
+        "python-dotenv>=1.0.0",
     ],
+    entry_points={
+        "console_scripts": [
+            "qbot=qbot.cli:main",
+        ],
+    },
     extras_require={
+        "local": [
+            "sentence-transformers>=2.2.0",
+        ],
         "dev": [
             "pytest>=7.4.0",
             "black>=23.7.0",
@@ -5,7 +5,7 @@ QBot - AI-Powered Q&A Bot using Ollama and Vector Store
 import logging
 from logging.handlers import RotatingFileHandler
 import os
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
 # Version information
 __version__ = "0.1.0"
@@ -18,7 +18,8 @@ def setup_logging(
         log_level: str = "INFO",
         log_file: str = "qbot.log",
         max_bytes: int = 10485760,  # 10MB
-        backup_count: int = 5
+        backup_count: int = 5,
+        log_dir: Optional[str] = None
 ) -> logging.Logger:
     """
     Configure logging for QBot.
@@ -28,12 +29,13 @@ def setup_logging(
         log_file: Path to log file
         max_bytes: Maximum size of log file before rotation
         backup_count: Number of backup files to keep
+        log_dir: Directory for the log file (default: $QBOT_LOG_DIR, or "logs")
 
     Returns:
         logging.Logger: Configured logger instance
     """
     # Create logs directory if it doesn't exist
-    log_dir = "logs"
+    log_dir = log_dir or os.getenv("QBOT_LOG_DIR", "logs")
     if not os.path.exists(log_dir):
         os.makedirs(log_dir)
 
@@ -117,6 +119,16 @@ class VectorStoreError(QBotException):
     pass
 
 
+class TenantNotFoundError(QBotException):
+    """Raised when a request names a tenant that has no knowledge base."""
+    pass
+
+
+class OverloadedError(QBotException):
+    """Raised when a model call is shed because it could not be admitted before its deadline."""
+    pass
+
+
 # Import main components for easier access
 from .models.vector_store import VectorStore
 from .utils.helpers import format_response, validate_prompt
@@ -132,5 +144,7 @@ __all__ = [
     'ModelNotFoundError',
     'ConfigurationError',
     'VectorStoreError',
+    'TenantNotFoundError',
+    'OverloadedError',
     'logger'
 ]
\ No newline at end of file
@@ -0,0 +1,118 @@
+import logging
+import os
+
+import click
+
+from qbot.config import INGEST_BATCH_SIZE, INGEST_WORKERS, VECTOR_STORE_PATH
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+
+@click.group()
+def cli():
+    """QBot command line tools"""
+
+
+@cli.command()
+@click.argument('source', type=click.Path(exists=True))
+@click.option('--index-path', default=VECTOR_STORE_PATH, required=VECTOR_STORE_PATH is None,
+              help='Persistent vector index directory (defaults to VECTOR_STORE_PATH)')
+@click.option('--tenant', default=None, help='Tenant whose collection to ingest into (default tenant if omitted)')
+@click.option('--batch-size', default=INGEST_BATCH_SIZE, show_default=True, help='Documents per embedding call')
+@click.option('--workers', default=INGEST_WORKERS, show_default=True, help='Embedding batches in flight')
+@click.option('--checkpoint', 'checkpoint_path', default=None,
+              help='Checkpoint file (defaults to <index-path>/ingest_checkpoint_<collection>.json)')
+def ingest(source, index_path, tenant, batch_size, workers, checkpoint_path):
+    """Stream JSONL/text documents from SOURCE into the persistent index"""
+    from qbot.config import DEFAULT_TENANT
+    from qbot.models.tenants import tenant_collection_name, validate_tenant
+    from qbot.utils.ingestion import BulkIngester
+
+    ingester = BulkIngester(
+        index_path,
+        collection_name=tenant_collection_name(validate_tenant(tenant or DEFAULT_TENANT)),
+        batch_size=batch_size,
+        workers=workers,
+        checkpoint_path=checkpoint_path
+    )
+    stats = ingester.ingest(source)
+    click.echo(
+        f"Ingested {stats['ingested']} documents from {stats['files']} files "
+        f"({stats['duplicates']} duplicates and {stats['near_duplicates']} near-duplicates skipped, "
+        f"{stats['files_skipped']} files already done)"
+    )
+
+
+@cli.group()
+def snapshot():
+    """Export and check portable index snapshots"""
+
+
+@snapshot.command('export')
+@click.option('--index-path', default=VECTOR_STORE_PATH, required=VECTOR_STORE_PATH is None,
+              help='Persistent vector index directory (defaults to VECTOR_STORE_PATH)')
+@click.option('--tenant', default=None, help='Tenant whose collection to export (default tenant if omitted)')
+@click.option('--output', default=None,
+              help='Snapshot file (defaults to <SNAPSHOT_PATH>/<collection>.qbs)')
+@click.option('--model', default=None,
+              help='Embedding model the collection was built with, for collections that do not record it')
+def snapshot_export(index_path, tenant, output, model):
+    """Write a persistent collection, vectors included, to a snapshot file"""
+    import chromadb
+    from qbot.config import DEFAULT_TENANT, SNAPSHOT_PATH
+    from qbot.models.memory import OffloadStore
+    from qbot.models.snapshot import snapshot_file, write_snapshot
+    from qbot.models.tenants import tenant_collection_name, validate_tenant
+    from qbot.models.vector_store import offload_path, snapshot_batches
+
+    collection_name = tenant_collection_name(validate_tenant(tenant or DEFAULT_TENANT))
+    if output is None:
+        if not SNAPSHOT_PATH:
+            raise click.UsageError('Pass --output or set SNAPSHOT_PATH')
+        output = snapshot_file(SNAPSHOT_PATH, collection_name)
+
+    collection = chromadb.PersistentClient(path=index_path).get_collection(name=collection_name)
+    metadata = collection.metadata or {}
+    # The snapshot is labelled with the model that actually built the collection, not the configured one
+    model = metadata.get('embedding_model') or model
+    if not model:
+        raise click.ClickException(f"Collection '{collection_name}' does not record its embedding model; pass --model")
+    backend = metadata.get('embedding_backend') or None
+    dimension = metadata.get('embedding_dimension')
+    if dimension is None:
+        page = collection.get(limit=1, include=['embeddings'])
+        if not page['ids']:
+            raise click.ClickException(f"Collection '{collection_name}' is empty")
+        dimension = len(page['embeddings'][0])
+
+    offload_directory = offload_path(index_path, collection_name)
+    offload_store = OffloadStore(offload_directory, dimension) if os.path.isdir(offload_directory) else None
+    header = write_snapshot(output, snapshot_batches(collection, offload_store), model=model,
+                            dimension=dimension, collection_name=collection_name, backend=backend)
+    click.echo(f"Exported {header['count']} documents ({dimension} dimensions, {model}) to {output}")
+
+
+@snapshot.command('verify')
+@click.argument('path', type=click.Path(exists=True))
+def snapshot_verify(path):
+    """Check a snapshot's header and checksums"""
+    from qbot import VectorStoreError
+    from qbot.models.snapshot import Snapshot
+
+    try:
+        loaded = Snapshot(path, verify=True)
+    except VectorStoreError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"OK: {loaded.count} documents, {loaded.dimension} dimensions, model {loaded.model}, "
+               f"taken {loaded.header['created_at']}")
+
+
+def main():
+    cli()
+
+
+if __name__ == '__main__':
+    main()
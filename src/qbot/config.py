@@ -7,4 +7,101 @@ load_dotenv()
 OLLAMA_HOST = os.getenv('OLLAMA_HOST', 'localhost')
 OLLAMA_PORT = os.getenv('OLLAMA_PORT', '11434')
 DEFAULT_MODEL = os.getenv('DEFAULT_MODEL', 'llama3.2')
-EMBEDDING_MODEL = os.getenv('EMBEDDING_MODEL', 'mxbai-embed-large')
\ No newline at end of file
+EMBEDDING_MODEL = os.getenv('EMBEDDING_MODEL', 'mxbai-embed-large')
+
+# Ollama endpoint pools: comma-separated hosts for embedding and generation
+# traffic, each defaulting to OLLAMA_HOST:OLLAMA_PORT. Requests go to the
+# endpoint with the lowest expected latency (EWMA latency x outstanding
+# requests), fail over on connection errors, and unhealthy endpoints are
+# re-probed every OLLAMA_HEALTH_INTERVAL seconds. Slow interactive single-text
+# embedding calls are hedged to a second endpoint after OLLAMA_HEDGE_AFTER_MS
+# (0 = 3x the pool's EWMA per-item latency).
+_OLLAMA_DEFAULT_HOST = f"http://{OLLAMA_HOST}:{OLLAMA_PORT}"
+OLLAMA_EMBED_HOSTS = [h.strip() for h in os.getenv('OLLAMA_EMBED_HOSTS', _OLLAMA_DEFAULT_HOST).split(',') if h.strip()]
+OLLAMA_GENERATE_HOSTS = [h.strip() for h in os.getenv('OLLAMA_GENERATE_HOSTS', _OLLAMA_DEFAULT_HOST).split(',')
+                         if h.strip()]
+OLLAMA_TIMEOUT = float(os.getenv('OLLAMA_TIMEOUT', '120'))
+OLLAMA_HEALTH_INTERVAL = float(os.getenv('OLLAMA_HEALTH_INTERVAL', '10'))
+OLLAMA_EMBED_HEDGING = os.getenv('OLLAMA_EMBED_HEDGING', 'true').lower() in ('1', 'true', 'yes')
+OLLAMA_HEDGE_AFTER_MS = float(os.getenv('OLLAMA_HEDGE_AFTER_MS', '0'))
+
+# Model backends: 'ollama', or 'sentence-transformers' for in-process CPU embeddings
+EMBEDDING_BACKEND = os.getenv('EMBEDDING_BACKEND', 'ollama')
+GENERATION_BACKEND = os.getenv('GENERATION_BACKEND', 'ollama')
+LOCAL_EMBEDDING_DEVICE = os.getenv('LOCAL_EMBEDDING_DEVICE', 'cpu')
+LOCAL_EMBEDDING_BATCH_SIZE = int(os.getenv('LOCAL_EMBEDDING_BATCH_SIZE', '32'))
+
+# Structured (/ask-json) generation: Ollama's JSON mode, capped at
+# STRUCTURED_NUM_PREDICT tokens and cut at any of the '|'-separated stop sequences
+# (runs of raw newlines only appear as padding after the object in JSON mode)
+STRUCTURED_NUM_PREDICT = int(os.getenv('STRUCTURED_NUM_PREDICT', '512'))
+STRUCTURED_STOP = [s for s in os.getenv('STRUCTURED_STOP', '\n\n\n').encode().decode('unicode_escape').split('|') if s]
+
+# Admission control for model server calls. Interactive requests may use up to
+# SCHEDULER_INTERACTIVE_CONCURRENCY slots (0 = all of them) and are shed with a
+# 503 if not admitted within SCHEDULER_INTERACTIVE_DEADLINE seconds; batch work
+# (ingestion, index builds) gets at most SCHEDULER_BATCH_CONCURRENCY slots and
+# only when no interactive call is waiting.
+SCHEDULER_MAX_CONCURRENCY = int(os.getenv('SCHEDULER_MAX_CONCURRENCY', '4'))
+SCHEDULER_INTERACTIVE_CONCURRENCY = int(os.getenv('SCHEDULER_INTERACTIVE_CONCURRENCY', '0'))
+SCHEDULER_BATCH_CONCURRENCY = int(os.getenv('SCHEDULER_BATCH_CONCURRENCY', '2'))
+SCHEDULER_INTERACTIVE_DEADLINE = float(os.getenv('SCHEDULER_INTERACTIVE_DEADLINE', '10'))
+
+# Persistent vector index; leave unset to rebuild an in-memory index on startup
+VECTOR_STORE_PATH = os.getenv('VECTOR_STORE_PATH')
+
+# Index snapshots: <SNAPSHOT_PATH>/<collection>.qbs bootstraps an empty index on
+# startup so only documents added since the snapshot are embedded
+SNAPSHOT_PATH = os.getenv('SNAPSHOT_PATH')
+SNAPSHOT_VERIFY = os.getenv('SNAPSHOT_VERIFY', 'true').lower() in ('1', 'true', 'yes')
+
+# Expected embedding dimension; unset means "whatever the embedding model produces"
+EMBEDDING_DIMENSION = int(os.getenv('EMBEDDING_DIMENSION')) if os.getenv('EMBEDDING_DIMENSION') else None
+
+# Memory bounds for the resident index. When exceeded, the least recently
+# retrieved documents are offloaded to an on-disk collection ('offload') or
+# dropped from search ('evict'). 0 disables a limit.
+VECTOR_STORE_MEMORY_BUDGET_MB = int(os.getenv('VECTOR_STORE_MEMORY_BUDGET_MB', '1024'))
+VECTOR_STORE_MAX_DOCUMENTS = int(os.getenv('VECTOR_STORE_MAX_DOCUMENTS', '10000'))
+VECTOR_STORE_EVICTION_POLICY = os.getenv('VECTOR_STORE_EVICTION_POLICY', 'offload')
+VECTOR_STORE_OFFLOAD_PATH = os.getenv('VECTOR_STORE_OFFLOAD_PATH')
+
+# Filtered searches matching at most this many resident documents are scored
+# exactly over just those documents; broader filters use a widened ANN search
+FILTER_EXACT_SEARCH_LIMIT = int(os.getenv('FILTER_EXACT_SEARCH_LIMIT', '5000'))
+
+# Retrieved chunks farther than this squared L2 distance from the question are
+# left out of the prompt (Ollama embeddings are unit length, so distances run
+# from 0 to 4). 0 keeps every retrieved chunk.
+RELEVANCE_MAX_DISTANCE = float(os.getenv('RELEVANCE_MAX_DISTANCE', '0'))
+
+# Near-duplicate detection at ingestion: documents whose estimated Jaccard
+# similarity to one already stored reaches DEDUP_THRESHOLD are skipped, or with
+# DEDUP_POLICY=merge have their metadata folded into the stored copy.
+# DEDUP_THRESHOLD=0 disables the check.
+DEDUP_THRESHOLD = float(os.getenv('DEDUP_THRESHOLD', '0.85'))
+DEDUP_POLICY = os.getenv('DEDUP_POLICY', 'skip')
+DEDUP_NUM_PERM = int(os.getenv('DEDUP_NUM_PERM', '128'))
+DEDUP_SHINGLE_SIZE = int(os.getenv('DEDUP_SHINGLE_SIZE', '3'))
+
+# Multi-tenancy: per-tenant documents live in TENANT_DOCUMENTS_DIR/<tenant>.json
+# and are indexed lazily, with idle tenants unloaded least-recently-used first.
+# TENANT_MEMORY_BUDGET_MB bounds the resident indexes of all loaded tenants
+# together (tenants are unloaded while it is exceeded); it defaults to one
+# store's VECTOR_STORE_MEMORY_BUDGET_MB, and 0 disables it.
+DEFAULT_TENANT = os.getenv('DEFAULT_TENANT', 'default')
+TENANT_DOCUMENTS_DIR = os.getenv('TENANT_DOCUMENTS_DIR')
+TENANT_MAX_LOADED = int(os.getenv('TENANT_MAX_LOADED', '64'))
+TENANT_IDLE_SECONDS = int(os.getenv('TENANT_IDLE_SECONDS', '900'))
+TENANT_MEMORY_BUDGET_MB = int(os.getenv('TENANT_MEMORY_BUDGET_MB', str(VECTOR_STORE_MEMORY_BUDGET_MB)))
+
+# /ask-batch: prompts are embedded and retrieved ASK_BATCH_SIZE at a time, with
+# up to ASK_BATCH_WORKERS generations in flight (still subject to the scheduler's
+# batch limit)
+ASK_BATCH_SIZE = int(os.getenv('ASK_BATCH_SIZE', '64'))
+ASK_BATCH_WORKERS = int(os.getenv('ASK_BATCH_WORKERS', '4'))
+ASK_BATCH_MAX_PROMPTS = int(os.getenv('ASK_BATCH_MAX_PROMPTS', '50000'))
+
+# Bulk ingestion
+INGEST_BATCH_SIZE = int(os.getenv('INGEST_BATCH_SIZE', '64'))
+INGEST_WORKERS = int(os.getenv('INGEST_WORKERS', '4'))
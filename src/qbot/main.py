@@ -1,8 +1,14 @@
-from flask import Flask, request, jsonify, render_template
-from qbot.models.vector_store import VectorStore
-from qbot.utils.document_manager import DocumentManager
+from flask import Flask, Response, request, jsonify, render_template, stream_with_context
+from qbot import OverloadedError, TenantNotFoundError
+from qbot.models import ModelRegistry
+from qbot.config import ASK_BATCH_MAX_PROMPTS, ASK_BATCH_WORKERS, SNAPSHOT_PATH
+from qbot.models.metadata_index import validate_filter, validate_metadata
+from qbot.models.snapshot import snapshot_file
+from qbot.models.tenants import TenantManager
+from qbot.utils.helpers import normalize_document
+import json
 import logging
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Iterator, Optional
 import time
 
 # Configure logging
@@ -13,8 +19,7 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
-vector_store = VectorStore()
-document_manager = DocumentManager()
+tenants = TenantManager()
 
 # Add route for web interface
 @app.route('/')
@@ -28,18 +33,35 @@ def handle_error(error: Exception) -> Dict[str, Any]:
 
     if isinstance(error, FileNotFoundError):
         return {"error": "Document file not found"}, 404
+    elif isinstance(error, TenantNotFoundError):
+        return {"error": str(error)}, 404
+    elif isinstance(error, OverloadedError):
+        return {"error": str(error)}, 503, {"Retry-After": "1"}
     elif isinstance(error, ValueError):
         return {"error": str(error)}, 400
     else:
         return {"error": "Internal server error"}, 500
 
 
+def get_filter(data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Optional metadata filter from a request body, validated up front"""
+    where = data.get('filter')
+    return validate_filter(where) if where is not None else None
+
+
+def get_tenant_key(data: Optional[Dict[str, Any]] = None) -> Optional[str]:
+    """Tenant named by the X-Tenant-ID header, a ?tenant= parameter or a "tenant" body field"""
+    return (request.headers.get('X-Tenant-ID')
+            or request.args.get('tenant')
+            or (data or {}).get('tenant'))
+
+
 @app.route('/health', methods=['GET'])
 def health_check() -> Dict[str, str]:
     """Health check endpoint"""
     try:
-        # Verify vector store is initialized
-        if vector_store.collection is None:
+        # Verify the default tenant's vector store is initialized
+        if tenants.get_store().collection is None:
             raise Exception("Vector store not initialized")
         return {"status": "healthy"}
     except Exception as e:
@@ -64,7 +86,9 @@ def ask() -> Dict[str, Any]:
         logger.info(f"Received prompt: {prompt}")
 
         # Generate response
-        response = vector_store.generate_response(prompt)
+        where = get_filter(data)
+        with tenants.lease(get_tenant_key(data)) as store:
+            response = store.generate_response(prompt, where=where)
 
         # Calculate processing time
         processing_time = time.time() - start_time
@@ -96,8 +120,17 @@ def ask_structured() -> Dict[str, Any]:
 
         logger.info(f"Received prompt: {prompt}")
 
+        tenant = tenants.tenant(get_tenant_key(data))
+        where = get_filter(data)
+        if data.get('stream'):
+            return Response(
+                stream_with_context(stream_structured(tenant.name, prompt, where, start_time)),
+                mimetype='application/x-ndjson'
+            )
+
         # Generate structured response
-        response_data = vector_store.generate_structured_response(prompt)
+        with tenants.lease(tenant.name) as store:
+            response_data = store.generate_structured_response(prompt, where=where)
 
         # Calculate processing time
         processing_time = time.time() - start_time
@@ -115,11 +148,82 @@ def ask_structured() -> Dict[str, Any]:
     except Exception as e:
         return handle_error(e)
 
+def stream_structured(tenant: str, prompt: str, where: Optional[Dict[str, Any]], start_time: float) -> Iterator[str]:
+    """NDJSON lines: {"answer_delta": ...} as the answer is generated, then the final {"status", "data"}"""
+    try:
+        # Leased inside the stream so the store stays open until the last line is sent
+        with tenants.lease(tenant) as store:
+            for event in store.stream_structured_response(prompt, where=where):
+                if 'answer_delta' in event:
+                    yield json.dumps(event) + '\n'
+                else:
+                    processing_time = time.time() - start_time
+                    logger.info(f"Generated response in {processing_time:.2f} seconds")
+                    yield json.dumps({
+                        "status": "success",
+                        "data": {**event['result'], "processing_time": f"{processing_time:.2f}s"}
+                    }) + '\n'
+    except Exception as e:
+        # Headers are already sent, so report the failure in-band
+        body, status = handle_error(e)[:2]
+        yield json.dumps({"status": "error", "code": status, **body}) + '\n'
+
+@app.route('/ask-batch', methods=['POST'])
+def ask_batch() -> Any:
+    """Answer a list of prompts, streaming one NDJSON result per prompt as each completes"""
+    start_time = time.time()
+
+    try:
+        data = request.json
+        if not data:
+            raise ValueError("No data provided")
+
+        prompts = data.get('prompts')
+        if not prompts or not isinstance(prompts, list):
+            raise ValueError("Prompts must be provided as a non-empty list")
+        if not all(isinstance(prompt, str) and prompt.strip() for prompt in prompts):
+            raise ValueError("Prompts must be non-empty strings")
+        if len(prompts) > ASK_BATCH_MAX_PROMPTS:
+            raise ValueError(f"At most {ASK_BATCH_MAX_PROMPTS} prompts per batch")
+        workers = data.get('workers', ASK_BATCH_WORKERS)
+        if not isinstance(workers, int) or not 1 <= workers <= 4 * ASK_BATCH_WORKERS:
+            raise ValueError(f"Workers must be an integer between 1 and {4 * ASK_BATCH_WORKERS}")
+
+        tenant = tenants.tenant(get_tenant_key(data))
+        where = get_filter(data)
+        logger.info(f"Received batch of {len(prompts)} prompts")
+
+        def generate() -> Iterator[str]:
+            errors = 0
+            try:
+                # Leased for the whole stream so the store cannot be closed between answers
+                with tenants.lease(tenant.name) as store:
+                    for item in store.answer_batch(prompts, where=where, workers=workers):
+                        errors += 'error' in item
+                        yield json.dumps(item) + '\n'
+            except Exception as e:
+                body, status = handle_error(e)[:2]
+                yield json.dumps({"status": "error", "code": status, **body}) + '\n'
+                return
+            processing_time = time.time() - start_time
+            logger.info(f"Answered {len(prompts)} prompts in {processing_time:.2f} seconds")
+            yield json.dumps({
+                "status": "complete",
+                "count": len(prompts),
+                "errors": errors,
+                "processing_time": f"{processing_time:.2f}s"
+            }) + '\n'
+
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+    except Exception as e:
+        return handle_error(e)
+
 @app.route('/documents', methods=['GET'])
 def get_documents() -> Dict[str, Any]:
     """Get all documents in the knowledge base"""
     try:
-        documents = document_manager.get_documents()
+        documents = tenants.tenant(get_tenant_key()).document_manager.get_documents()
         return {
             "count": len(documents),
             "documents": documents
@@ -143,17 +247,29 @@ def add_documents() -> Dict[str, Any]:
         if not isinstance(documents, list):
             raise ValueError("Documents must be provided as a list")
 
-        logger.info(f"Adding {len(documents)} new documents")
-
-        # Add documents
-        success = document_manager.add_documents(documents)
-        if success:
-            # Reinitialize vector store with new documents
-            global vector_store
-            vector_store = VectorStore()
+        for document in documents:
+            text, metadata = normalize_document(document)
+            if not text.strip():
+                raise ValueError("Documents must not be empty")
+            validate_metadata(metadata)
+
+        tenant = tenants.tenant(get_tenant_key(data), create=True)
+        logger.info(f"Adding {len(documents)} new documents for tenant '{tenant.name}'")
+
+        with tenants.lease(tenant.name) as store:
+            # Add documents, dropping near-duplicates (checked against the store's index) before they are embedded
+            report = tenant.document_manager.add_unique_documents(
+                documents, near_duplicates=store.near_duplicate_index()
+            )
+            # Embed only the new documents into the live index (at batch priority, using spare model capacity)
+            if report is not None and report['changed']:
+                store.index_documents(report['changed'], positions=report['positions'])
+        if report is not None:
             return {
                 "message": "Documents added successfully",
-                "count": len(documents)
+                "count": report['added'],
+                "near_duplicates_skipped": report['skipped'],
+                "near_duplicates_merged": report['merged']
             }
         else:
             raise Exception("Failed to add documents")
@@ -166,11 +282,11 @@ def add_documents() -> Dict[str, Any]:
 def clear_documents() -> Dict[str, Any]:
     """Clear all documents from the knowledge base"""
     try:
-        success = document_manager.clear_documents()
+        tenant = tenants.tenant(get_tenant_key())
+        success = tenant.document_manager.clear_documents()
         if success:
-            # Reinitialize vector store with empty collection
-            global vector_store
-            vector_store = VectorStore()
+            # Drop the tenant's index (persisted collection included) and start from an empty one
+            tenants.clear(tenant.name)
             return {"message": "All documents cleared successfully"}
         else:
             raise Exception("Failed to clear documents")
@@ -183,22 +299,66 @@ def clear_documents() -> Dict[str, Any]:
 def get_stats() -> Dict[str, Any]:
     """Get statistics about the knowledge base"""
     try:
-        documents = document_manager.get_documents()
+        tenant = tenants.tenant(get_tenant_key())
+        store = tenant.vector_store
+        documents = tenant.document_manager.get_documents()
         return {
+            "tenant": tenant.name,
             "total_documents": len(documents),
-            "average_document_length": sum(len(d) for d in documents) / len(documents) if documents else 0,
+            "average_document_length": (sum(len(normalize_document(d)[0]) for d in documents) / len(documents)
+                                        if documents else 0),
+            "memory": store.memory_stats() if store is not None else None,
             "status": "operational"
         }
     except Exception as e:
         return handle_error(e)
 
 
+@app.route('/snapshot', methods=['POST'])
+def export_snapshot() -> Dict[str, Any]:
+    """Write the tenant's built index to SNAPSHOT_PATH so new replicas can start from it"""
+    try:
+        if not SNAPSHOT_PATH:
+            raise ValueError("SNAPSHOT_PATH is not configured")
+        tenant = tenants.tenant(get_tenant_key())
+        with tenants.lease(tenant.name) as store:
+            header = store.export_snapshot(snapshot_file(SNAPSHOT_PATH, tenant.collection_name))
+        return {
+            "message": "Snapshot written",
+            "tenant": tenant.name,
+            "count": header['count'],
+            "model": header['model'],
+            "dimension": header['dimension'],
+            "created_at": header['created_at']
+        }
+    except Exception as e:
+        return handle_error(e)
+
+
+@app.route('/tenants', methods=['GET'])
+def get_tenants() -> Dict[str, Any]:
+    """Get per-tenant statistics for every tenant known to this process"""
+    try:
+        return tenants.stats()
+    except Exception as e:
+        return handle_error(e)
+
+
+@app.route('/models', methods=['GET'])
+def get_models() -> Dict[str, Any]:
+    """Get the configured models, their dimensions and measured throughput"""
+    try:
+        return ModelRegistry.report()
+    except Exception as e:
+        return handle_error(e)
+
+
 def initialize_app() -> None:
     """Initialize the application"""
     try:
         logger.info("Initializing application...")
-        global vector_store
-        vector_store = VectorStore()
+        # Load the default tenant eagerly; others are loaded on first request
+        tenants.get_store()
         logger.info("Application initialized successfully")
     except Exception as e:
         logger.error(f"Failed to initialize application: {str(e)}")
@@ -2,44 +2,114 @@
 QBot models module containing vector store and model management components.
 """
 
+import time
 from typing import List, Optional, Dict, Any
 
+from qbot.config import (
+    DEFAULT_MODEL,
+    EMBEDDING_DIMENSION,
+    EMBEDDING_MODEL,
+    VECTOR_STORE_EVICTION_POLICY,
+    VECTOR_STORE_MAX_DOCUMENTS,
+    VECTOR_STORE_MEMORY_BUDGET_MB
+)
+from qbot.utils.scheduler import model_scheduler
+from .ollama_pool import get_pool
+from .backends import Embedder, Generator, get_embedder, get_generator, loaded_backends
 from .vector_store import VectorStore
+from .tenants import TenantManager
 
-__all__ = ['VectorStore']
+__all__ = [
+    'VectorStore',
+    'TenantManager',
+    'Embedder',
+    'Generator',
+    'get_embedder',
+    'get_generator',
+    'ModelRegistry'
+]
 
 # Model configuration
 DEFAULT_MODELS = {
-    'embedding': 'mxbai-embed-large',
-    'completion': 'llama3.2'
+    'embedding': EMBEDDING_MODEL,
+    'completion': DEFAULT_MODEL
 }
 
-# Vector store settings
+# Vector store settings (embedding_dimension None means "as produced by the embedding model")
 VECTOR_STORE_SETTINGS = {
     'collection_name': 'docs',
-    'embedding_dimension': 384,
-    'metric': 'cosine',
-    'max_documents': 10000
+    'embedding_dimension': EMBEDDING_DIMENSION,
+    'metric': 'l2',
+    'max_documents': VECTOR_STORE_MAX_DOCUMENTS,
+    'memory_budget_mb': VECTOR_STORE_MEMORY_BUDGET_MB,
+    'eviction_policy': VECTOR_STORE_EVICTION_POLICY
 }
 
 
 class ModelRegistry:
     """Registry for managing model availability and versions."""
 
+    @classmethod
+    def _ollama_models(cls) -> List[str]:
+        """Models pulled into the Ollama servers of both pools; unreachable pools contribute nothing."""
+        models = []
+        for kind in ('embed', 'generate'):
+            try:
+                listed = get_pool(kind).call(lambda client: client.list())
+            except Exception:
+                continue
+            models.extend(m['name'] for m in listed.get('models', []) if m['name'] not in models)
+        return models
+
     @classmethod
     def list_available_models(cls) -> List[str]:
         """List all available models."""
-        # Implementation would check Ollama's available models
-        pass
+        models = cls._ollama_models()
+        for backend in loaded_backends():
+            if backend.backend != 'ollama' and backend.model not in models:
+                models.append(backend.model)
+        return models
 
     @classmethod
     def verify_model(cls, model_name: str) -> bool:
         """Verify if a model is available."""
-        # Implementation would verify model availability
-        pass
+        for available in cls.list_available_models():
+            # Ollama reports "llama3.2:latest" for a model pulled as "llama3.2"
+            if available == model_name or available.split(':')[0] == model_name:
+                return True
+        return False
 
     @classmethod
     def get_model_info(cls, model_name: str) -> Dict[str, Any]:
         """Get information about a specific model."""
-        # Implementation would return model details
-        pass
\ No newline at end of file
+        for backend in loaded_backends():
+            if backend.model == model_name:
+                return {**backend.info(), 'available': cls.verify_model(model_name)}
+        return {'name': model_name, 'available': cls.verify_model(model_name)}
+
+    @classmethod
+    def measure_throughput(cls, embedder: Optional[Embedder] = None, batch_size: int = 32) -> Dict[str, Any]:
+        """Time one synthetic batch through an embedder and report its dimension and texts/second."""
+        embedder = embedder or get_embedder()
+        texts = [f"Throughput probe sentence number {i} about llamas." for i in range(batch_size)]
+        start = time.perf_counter()
+        embeddings = embedder.embed(texts)
+        elapsed = time.perf_counter() - start
+        return {
+            'name': embedder.model,
+            'backend': embedder.backend,
+            'dimension': len(embeddings[0]),
+            'batch_size': batch_size,
+            'texts_per_second': batch_size / elapsed if elapsed else None
+        }
+
+    @classmethod
+    def report(cls) -> Dict[str, Any]:
+        """Configured models, their dimensions, throughput measured from live traffic and scheduler load."""
+        return {
+            'available': cls.list_available_models(),
+            'embedding': get_embedder().info(),
+            'completion': get_generator().info(),
+            'scheduler': model_scheduler.stats(),
+            'pools': {kind: get_pool(kind).stats() for kind in ('embed', 'generate')}
+        }
@@ -0,0 +1,247 @@
+"""
+Pluggable embedding and generation backends.
+
+VectorStore and the ingestion pipeline talk to these interfaces instead of
+calling Ollama directly, so the model (and where it runs) is a config choice.
+"""
+
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from qbot.config import (
+    DEFAULT_MODEL,
+    EMBEDDING_BACKEND,
+    EMBEDDING_MODEL,
+    GENERATION_BACKEND,
+    LOCAL_EMBEDDING_BATCH_SIZE,
+    LOCAL_EMBEDDING_DEVICE
+)
+from qbot.utils.scheduler import INTERACTIVE, model_scheduler
+from .ollama_pool import OllamaPool, get_pool
+
+
+class _ThroughputMeter:
+    """Accumulates work done and wall time spent so backends can report real throughput"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.items = 0
+        self.seconds = 0.0
+        self.calls = 0
+
+    def record(self, items: int, seconds: float) -> None:
+        with self._lock:
+            self.items += items
+            self.seconds += seconds
+            self.calls += 1
+
+    @property
+    def per_second(self) -> Optional[float]:
+        return self.items / self.seconds if self.seconds else None
+
+
+class Embedder(ABC):
+    """Turns texts into embedding vectors"""
+
+    backend = 'base'
+
+    def __init__(self, model: str):
+        self.model = model
+        self.meter = _ThroughputMeter()
+        self._dimension: Optional[int] = None
+
+    @abstractmethod
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """Embed a batch of texts; implemented by each backend"""
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """Embed a batch of texts, recording throughput"""
+        if not texts:
+            return []
+        start = time.perf_counter()
+        embeddings = self._embed_batch(texts)
+        self.meter.record(len(texts), time.perf_counter() - start)
+        if self._dimension is None and embeddings:
+            self._dimension = len(embeddings[0])
+        return embeddings
+
+    def embed_one(self, text: str) -> List[float]:
+        return self.embed([text])[0]
+
+    @property
+    def dimension(self) -> int:
+        """Embedding dimension, probed with a single call if nothing was embedded yet"""
+        if self._dimension is None:
+            self.embed_one("dimension probe")
+        return self._dimension
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            'name': self.model,
+            'kind': 'embedding',
+            'backend': self.backend,
+            'dimension': self._dimension,
+            'throughput_per_second': self.meter.per_second,
+            'calls': self.meter.calls
+        }
+
+
+class OllamaEmbedder(Embedder):
+    """Embeddings from the pool of Ollama embedding servers"""
+
+    backend = 'ollama'
+
+    def __init__(self, model: str, pool: Optional[OllamaPool] = None):
+        super().__init__(model)
+        self.pool = pool or get_pool('embed')
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        # One /api/embed request (and one scheduler slot) per batch; queries go through the same
+        # endpoint so they get the same unit-length vectors as the documents they are compared to.
+        # Only interactive single-text calls are hedged: duplicating ingestion batches would double their load
+        hedge = len(texts) == 1 and model_scheduler.current_priority() == INTERACTIVE
+        with model_scheduler.slot():
+            return self.pool.call(lambda client: client.embed(model=self.model, input=texts)["embeddings"],
+                                  hedge=hedge, items=len(texts))
+
+
+class SentenceTransformerEmbedder(Embedder):
+    """In-process CPU embeddings using a sentence-transformers model, batched without an HTTP hop"""
+
+    backend = 'sentence-transformers'
+
+    def __init__(self, model: str, device: str = LOCAL_EMBEDDING_DEVICE,
+                 batch_size: int = LOCAL_EMBEDDING_BATCH_SIZE):
+        super().__init__(model)
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            from qbot import ConfigurationError
+            raise ConfigurationError(
+                "EMBEDDING_BACKEND=sentence-transformers requires the 'local' extra: pip install qbot[local]"
+            )
+        self.batch_size = batch_size
+        self._model = SentenceTransformer(model, device=device)
+        self._dimension = self._model.get_sentence_embedding_dimension()
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        vectors = self._model.encode(texts, batch_size=self.batch_size, convert_to_numpy=True)
+        return vectors.tolist()
+
+
+class Generator(ABC):
+    """Produces completions for prompts"""
+
+    backend = 'base'
+
+    def __init__(self, model: str):
+        self.model = model
+        self.meter = _ThroughputMeter()
+
+    @abstractmethod
+    def generate(self, prompt: str, format: str = '', **options) -> str:
+        """Generate a completion for the prompt; format='json' constrains it to a JSON value"""
+
+    def stream(self, prompt: str, format: str = '', **options) -> Iterator[str]:
+        """Yield the completion in chunks; closing the iterator early stops generation"""
+        yield self.generate(prompt, format=format, **options)
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            'name': self.model,
+            'kind': 'completion',
+            'backend': self.backend,
+            'tokens_per_second': self.meter.per_second,
+            'calls': self.meter.calls
+        }
+
+
+class OllamaGenerator(Generator):
+    """Completions from the pool of Ollama generation servers"""
+
+    backend = 'ollama'
+
+    def __init__(self, model: str, pool: Optional[OllamaPool] = None):
+        super().__init__(model)
+        self.pool = pool or get_pool('generate')
+
+    def generate(self, prompt: str, format: str = '', **options) -> str:
+        with model_scheduler.slot():
+            output = self.pool.call(lambda client: client.generate(
+                model=self.model, prompt=prompt, format=format, options=options or None
+            ))
+        # Ollama reports generation time in nanoseconds
+        if output.get('eval_count') and output.get('eval_duration'):
+            self.meter.record(output['eval_count'], output['eval_duration'] / 1e9)
+        return output['response']
+
+    def stream(self, prompt: str, format: str = '', **options) -> Iterator[str]:
+        with model_scheduler.slot():
+            chunks = self.pool.stream(lambda client: client.generate(
+                model=self.model, prompt=prompt, format=format, options=options or None, stream=True
+            ))
+            start = time.perf_counter()
+            tokens = 0
+            try:
+                for chunk in chunks:
+                    if chunk.get('done') and chunk.get('eval_count') and chunk.get('eval_duration'):
+                        self.meter.record(chunk['eval_count'], chunk['eval_duration'] / 1e9)
+                        tokens = None
+                    if chunk.get('response'):
+                        if tokens is not None:
+                            tokens += 1
+                        yield chunk['response']
+            finally:
+                # Stopped early: the server never sent its totals, so count streamed chunks (~1 token each)
+                if tokens:
+                    self.meter.record(tokens, time.perf_counter() - start)
+                # Dropping the HTTP response makes Ollama abort the rest of the generation
+                close = getattr(chunks, 'close', None)
+                if close is not None:
+                    close()
+
+
+EMBEDDER_BACKENDS = {
+    'ollama': OllamaEmbedder,
+    'sentence-transformers': SentenceTransformerEmbedder
+}
+
+GENERATOR_BACKENDS = {
+    'ollama': OllamaGenerator
+}
+
+# Backends are shared process-wide: local models are expensive to load, and
+# the registry reports throughput measured across every caller.
+_instances: Dict[Tuple[str, str, str], Any] = {}
+_instances_lock = threading.Lock()
+
+
+def _get_instance(kind: str, backends: Dict[str, type], backend: str, model: str):
+    if backend not in backends:
+        from qbot import ConfigurationError
+        raise ConfigurationError(f"Unknown {kind} backend '{backend}', expected one of {sorted(backends)}")
+    key = (kind, backend, model)
+    with _instances_lock:
+        if key not in _instances:
+            logging.info(f"Loading {kind} model {model} ({backend})")
+            _instances[key] = backends[backend](model)
+        return _instances[key]
+
+
+def get_embedder(backend: Optional[str] = None, model: Optional[str] = None) -> Embedder:
+    """Return the configured embedder (EMBEDDING_BACKEND / EMBEDDING_MODEL by default)"""
+    return _get_instance('embedding', EMBEDDER_BACKENDS, backend or EMBEDDING_BACKEND, model or EMBEDDING_MODEL)
+
+
+def get_generator(backend: Optional[str] = None, model: Optional[str] = None) -> Generator:
+    """Return the configured generator (GENERATION_BACKEND / DEFAULT_MODEL by default)"""
+    return _get_instance('completion', GENERATOR_BACKENDS, backend or GENERATION_BACKEND, model or DEFAULT_MODEL)
+
+
+def loaded_backends() -> List[Any]:
+    """All embedder and generator instances created so far"""
+    with _instances_lock:
+        return list(_instances.values())
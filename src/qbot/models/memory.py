@@ -0,0 +1,390 @@
+"""
+Memory accounting for the vector store.
+
+Chroma keeps every vector (plus its HNSW links) and document resident, so the
+footprint grows linearly with the corpus. MemoryTracker estimates that footprint
+per document and keeps documents in least-recently-retrieved order so the
+coldest ones can be evicted or offloaded when a budget is exceeded. A
+document's near-duplicate signature and metadata index entries stay in memory
+after it is offloaded, so those bytes remain counted against the budget.
+ResidentVectors keeps a second, contiguous copy of the resident vectors for
+exact scoring of filtered searches, and OffloadStore is the on-disk tier cold
+documents are offloaded to.
+"""
+
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+
+from qbot.config import DEDUP_NUM_PERM, DEDUP_THRESHOLD
+
+# float32 storage per vector component
+BYTES_PER_DIMENSION = 4
+# Each resident vector is held by Chroma and by ResidentVectors
+RESIDENT_VECTOR_COPIES = 2
+# HNSW neighbour lists, id mappings and metadata per entry (rough, M=16)
+INDEX_OVERHEAD_BYTES = 256
+# MinHash signature in the near-duplicate index (uint32 slots), when near-duplicate detection is on
+SIGNATURE_BYTES = DEDUP_NUM_PERM * 4 if DEDUP_THRESHOLD else 0
+# One posting-set entry of the inverted metadata index (rough)
+POSTING_BYTES = 64
+
+
+def estimate_retained_bytes(metadata: Optional[Dict[str, Any]] = None) -> int:
+    """Estimated bytes a document keeps in the near-duplicate and metadata indexes, even once offloaded"""
+    if not metadata:
+        return SIGNATURE_BYTES
+    postings = sum(len(value) if isinstance(value, list) else 1 for value in metadata.values())
+    return SIGNATURE_BYTES + len(json.dumps(metadata)) + postings * POSTING_BYTES
+
+
+def estimate_document_bytes(document: str, dimension: int, metadata: Optional[Dict[str, Any]] = None) -> int:
+    """Estimated resident bytes for one indexed document"""
+    vector_bytes = RESIDENT_VECTOR_COPIES * dimension * BYTES_PER_DIMENSION
+    return (vector_bytes + len(document.encode('utf-8')) + INDEX_OVERHEAD_BYTES
+            + estimate_retained_bytes(metadata))
+
+
+class MemoryTracker:
+    """Tracks per-document memory and recency of the resident (hot) index"""
+
+    def __init__(self, budget_bytes: Optional[int] = None, max_documents: Optional[int] = None):
+        self.budget_bytes = budget_bytes or None
+        self.max_documents = max_documents or None
+        # doc id -> (estimated bytes, of which retained after offloading)
+        self._entries: "OrderedDict[str, Tuple[int, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.total_bytes = 0
+        self.vector_bytes = 0
+        # Index bytes still held for offloaded documents; part of total_bytes
+        self.retained_bytes = 0
+        self.evicted = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._entries
+
+    def add(self, doc_id: str, document: str, dimension: int, metadata: Optional[Dict[str, Any]] = None) -> None:
+        """Record a newly indexed document as the most recently used"""
+        size = estimate_document_bytes(document, dimension, metadata)
+        with self._lock:
+            if doc_id in self._entries:
+                self._entries.move_to_end(doc_id)
+                return
+            self._entries[doc_id] = (size, estimate_retained_bytes(metadata))
+            self.total_bytes += size
+            self.vector_bytes += dimension * BYTES_PER_DIMENSION
+
+    def add_retained(self, metadata: Optional[Dict[str, Any]] = None) -> None:
+        """Account for the index entries of a document that is already offloaded"""
+        size = estimate_retained_bytes(metadata)
+        with self._lock:
+            self.retained_bytes += size
+            self.total_bytes += size
+
+    def touch(self, doc_ids: Iterable[str]) -> None:
+        """Mark documents as just retrieved"""
+        with self._lock:
+            for doc_id in doc_ids:
+                if doc_id in self._entries:
+                    self._entries.move_to_end(doc_id)
+
+    def remove(self, doc_ids: Iterable[str], dimension: int, retain: bool = False) -> None:
+        """Forget documents; retain=True keeps counting the index entries they leave behind (offloading)"""
+        with self._lock:
+            for doc_id in doc_ids:
+                entry = self._entries.pop(doc_id, None)
+                if entry is None:
+                    continue
+                size, retained = entry
+                self.vector_bytes -= dimension * BYTES_PER_DIMENSION
+                if retain:
+                    self.total_bytes -= size - retained
+                    self.retained_bytes += retained
+                else:
+                    self.total_bytes -= size
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+            self.vector_bytes = 0
+            self.retained_bytes = 0
+
+    def over_budget(self) -> bool:
+        if self.budget_bytes and self.total_bytes > self.budget_bytes:
+            return True
+        return bool(self.max_documents and len(self._entries) > self.max_documents)
+
+    def coldest(self, retain: bool = False) -> List[str]:
+        """
+        Least recently used documents that must leave the hot index to get back under budget;
+        retain=True when they will be offloaded and so keep their index entries
+        """
+        with self._lock:
+            victims = []
+            remaining_bytes = self.total_bytes
+            remaining_docs = len(self._entries)
+            for doc_id, (size, retained) in self._entries.items():
+                within_bytes = not self.budget_bytes or remaining_bytes <= self.budget_bytes
+                within_docs = not self.max_documents or remaining_docs <= self.max_documents
+                if within_bytes and within_docs:
+                    break
+                victims.append(doc_id)
+                remaining_bytes -= size - retained if retain else size
+                remaining_docs -= 1
+            return victims
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'resident_documents': len(self._entries),
+            'estimated_bytes': self.total_bytes,
+            'vector_bytes': self.vector_bytes,
+            'retained_bytes': self.retained_bytes,
+            'budget_bytes': self.budget_bytes,
+            'max_documents': self.max_documents,
+            'evicted_documents': self.evicted
+        }
+
+
+class ResidentVectors:
+    """Vectors of the resident documents in one growable float32 matrix, addressable by id"""
+
+    def __init__(self, dimension: int, capacity: int = 1024):
+        self.dimension = dimension
+        self._matrix = np.empty((capacity, dimension), dtype=np.float32)
+        self._rows: Dict[str, int] = {}
+        self._ids: List[str] = []
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._rows
+
+    def add(self, ids: List[str], vectors: Any) -> None:
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(ids), self.dimension)
+        with self._lock:
+            needed = len(self._ids) + len(ids)
+            if needed > len(self._matrix):
+                grown = np.empty((max(needed, 2 * len(self._matrix)), self.dimension), dtype=np.float32)
+                grown[:len(self._ids)] = self._matrix[:len(self._ids)]
+                self._matrix = grown
+            for doc_id, vector in zip(ids, vectors):
+                row = self._rows.get(doc_id)
+                if row is None:
+                    row = self._rows[doc_id] = len(self._ids)
+                    self._ids.append(doc_id)
+                self._matrix[row] = vector
+
+    def remove(self, ids: Iterable[str]) -> None:
+        """Drop rows, moving the last row into each gap so the matrix stays contiguous"""
+        with self._lock:
+            for doc_id in ids:
+                row = self._rows.pop(doc_id, None)
+                if row is None:
+                    continue
+                last_id = self._ids.pop()
+                if last_id != doc_id:
+                    self._matrix[row] = self._matrix[len(self._ids)]
+                    self._ids[row] = last_id
+                    self._rows[last_id] = row
+
+    def take(self, ids: Iterable[str]) -> Tuple[List[str], np.ndarray]:
+        """(ids found, their vectors as a fresh matrix in that order)"""
+        with self._lock:
+            found = [doc_id for doc_id in ids if doc_id in self._rows]
+            rows = np.fromiter((self._rows[doc_id] for doc_id in found), dtype=np.int64, count=len(found))
+            return found, self._matrix[rows]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._rows.clear()
+            self._ids.clear()
+            self._matrix = np.empty((0, self.dimension), dtype=np.float32)
+
+
+class OffloadStore:
+    """
+    Append-only on-disk tier for documents offloaded from the resident index.
+
+    Vectors live in a raw float32 file that is memory-mapped and scanned in
+    chunks at query time, so they sit in reclaimable page cache rather than on
+    the heap. Documents and metadata are read from disk only for hits. Metadata
+    updated after offloading (e.g. merged near-duplicates) is appended to a
+    small overrides file instead of rewriting the entries.
+    """
+
+    SCAN_ROWS = 8192
+
+    def __init__(self, path: str, dimension: int):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.dimension = dimension
+        self.vectors_path = os.path.join(path, 'vectors.f32')
+        self.entries_path = os.path.join(path, 'entries.jsonl')
+        self.metadata_path = os.path.join(path, 'metadata.jsonl')
+        self._lock = threading.Lock()
+        self.ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._offsets: List[int] = []
+        self._metadata: Dict[str, Dict[str, Any]] = {}
+        self._load_index()
+
+    def _load_index(self) -> None:
+        if os.path.exists(self.metadata_path):
+            with open(self.metadata_path, 'rb') as f:
+                for line in f:
+                    entry = json.loads(line)
+                    self._metadata[entry['id']] = entry['metadata']
+        if not os.path.exists(self.entries_path):
+            return
+        with open(self.entries_path, 'rb') as f:
+            offset = f.tell()
+            for line in iter(f.readline, b''):
+                doc_id = json.loads(line)['id']
+                self._rows[doc_id] = len(self.ids)
+                self.ids.append(doc_id)
+                self._offsets.append(offset)
+                offset = f.tell()
+        # A crash between the two appends can leave extra vectors; trust the entries file
+        expected = len(self.ids) * self.dimension * BYTES_PER_DIMENSION
+        if os.path.exists(self.vectors_path) and os.path.getsize(self.vectors_path) > expected:
+            with open(self.vectors_path, 'r+b') as f:
+                f.truncate(expected)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._rows
+
+    def clear(self) -> None:
+        with self._lock:
+            for path in (self.vectors_path, self.entries_path, self.metadata_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            self.ids = []
+            self._rows = {}
+            self._offsets = []
+            self._metadata = {}
+
+    def add(self, ids: List[str], embeddings: List[List[float]], documents: List[str],
+            metadatas: List[Dict[str, Any]]) -> None:
+        vectors = np.asarray(embeddings, dtype=np.float32).reshape(len(ids), self.dimension)
+        with self._lock:
+            with open(self.vectors_path, 'ab') as f:
+                f.write(vectors.tobytes())
+            with open(self.entries_path, 'ab') as f:
+                for doc_id, document, metadata in zip(ids, documents, metadatas):
+                    self._offsets.append(f.tell())
+                    f.write(json.dumps({'id': doc_id, 'document': document, 'metadata': metadata}).encode('utf-8'))
+                    f.write(b'\n')
+                    self._rows[doc_id] = len(self.ids)
+                    self.ids.append(doc_id)
+
+    def metadata(self, doc_id: str) -> Dict[str, Any]:
+        """Current stored metadata of an offloaded document"""
+        if doc_id in self._metadata:
+            return self._metadata[doc_id]
+        return self._read_entry(self._rows[doc_id])['metadata']
+
+    def update_metadata(self, ids: List[str], metadatas: List[Dict[str, Any]]) -> None:
+        """Replace the stored metadata of offloaded documents"""
+        with self._lock:
+            with open(self.metadata_path, 'ab') as f:
+                for doc_id, metadata in zip(ids, metadatas):
+                    f.write(json.dumps({'id': doc_id, 'metadata': metadata}).encode('utf-8') + b'\n')
+                    self._metadata[doc_id] = metadata
+
+    def iter_entries(self) -> Iterator[Tuple[str, str, Dict[str, Any]]]:
+        """(id, document, metadata) for every offloaded document"""
+        if not os.path.exists(self.entries_path):
+            return
+        with open(self.entries_path, 'rb') as f:
+            for line in f:
+                entry = json.loads(line)
+                yield entry['id'], entry['document'], self._metadata.get(entry['id'], entry['metadata'])
+
+    def iter_batches(self, batch_size: int = 1000) -> Iterator[Tuple[List[str], np.ndarray, List[str], List[Any]]]:
+        """(ids, vectors, documents, metadatas) for every offloaded document, batch_size rows at a time"""
+        count = len(self.ids)
+        if not count:
+            return
+        vectors = np.memmap(self.vectors_path, dtype=np.float32, mode='r', shape=(count, self.dimension))
+        with open(self.entries_path, 'rb') as f:
+            for start in range(0, count, batch_size):
+                entries = [json.loads(f.readline()) for _ in range(min(batch_size, count - start))]
+                yield ([e['id'] for e in entries], np.array(vectors[start:start + len(entries)]),
+                       [e['document'] for e in entries],
+                       [self._metadata.get(e['id'], e['metadata']) for e in entries])
+
+    def _read_entry(self, row: int) -> Dict[str, Any]:
+        with open(self.entries_path, 'rb') as f:
+            f.seek(self._offsets[row])
+            entry = json.loads(f.readline())
+        entry['metadata'] = self._metadata.get(entry['id'], entry['metadata'])
+        return entry
+
+    def query(self, query_embeddings: Any, n_results: int,
+              candidate_ids: Optional[Set[str]] = None) -> Dict[str, List[List[Any]]]:
+        """
+        Exact squared-L2 search (Chroma's default metric) over the offloaded vectors for a (queries x dimension)
+        matrix, in one pass over the file keeping each query's running top n; results hold one list per query.
+        With candidate_ids, only those rows are read and scored.
+        """
+        queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        results: Dict[str, List[List[Any]]] = {key: [[] for _ in queries]
+                                               for key in ('ids', 'documents', 'metadatas', 'distances')}
+        count = len(self.ids)
+        if not count or n_results <= 0 or not len(queries):
+            return results
+
+        vectors = np.memmap(self.vectors_path, dtype=np.float32, mode='r', shape=(count, self.dimension))
+        if candidate_ids is None:
+            rows = np.arange(count)
+        else:
+            rows = np.array(sorted(row for row in map(self._rows.get, candidate_ids)
+                                   if row is not None and row < count), dtype=np.int64)
+            if not len(rows):
+                return results
+
+        k = min(n_results, len(rows))
+        query_norms = (queries ** 2).sum(axis=1)[:, None]
+        best_distances = np.empty((len(queries), 0), dtype=np.float32)
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        for start in range(0, len(rows), self.SCAN_ROWS):
+            chunk_rows = rows[start:start + self.SCAN_ROWS]
+            if candidate_ids is None:
+                chunk = np.asarray(vectors[chunk_rows[0]:chunk_rows[-1] + 1])
+            else:
+                chunk = vectors[chunk_rows]
+            # ||q - v||^2 = ||q||^2 - 2 q.v + ||v||^2, for every query against the chunk at once
+            distances = query_norms - 2 * (queries @ chunk.T) + (chunk ** 2).sum(axis=1)[None, :]
+            np.maximum(distances, 0, out=distances)
+            best_distances = np.hstack([best_distances, distances])
+            best_rows = np.hstack([best_rows, np.broadcast_to(chunk_rows, distances.shape)])
+            if best_distances.shape[1] > k:
+                keep = np.argpartition(best_distances, k - 1, axis=1)[:, :k]
+                best_distances = np.take_along_axis(best_distances, keep, axis=1)
+                best_rows = np.take_along_axis(best_rows, keep, axis=1)
+
+        order = np.argsort(best_distances, axis=1)
+        best_distances = np.take_along_axis(best_distances, order, axis=1)
+        best_rows = np.take_along_axis(best_rows, order, axis=1)
+        # Queries often share hits; read each entry once
+        entries = {row: self._read_entry(row) for row in map(int, np.unique(best_rows))}
+        for q in range(len(queries)):
+            hits = [entries[int(row)] for row in best_rows[q]]
+            results['ids'][q] = [e['id'] for e in hits]
+            results['documents'][q] = [e['document'] for e in hits]
+            results['metadatas'][q] = [e['metadata'] for e in hits]
+            results['distances'][q] = [float(d) for d in best_distances[q]]
+        return results
@@ -0,0 +1,212 @@
+"""
+Inverted metadata index for filtered retrieval.
+
+Documents carry arbitrary metadata (source, tags, date, ...). MetadataIndex
+keeps a posting set of document ids per (field, value) and a sorted value list
+per field, so a filter expression resolves to its candidate ids up front and
+the vector search only ever scores documents that match.
+
+Filters use the same operator syntax as Chroma's `where` clauses:
+
+    {"source": "wiki"}                                  equality (or list membership)
+    {"tags": {"$in": ["llama", "alpaca"]}}              $eq $ne $in $nin
+    {"date": {"$gte": "2024-01-01", "$lt": "2025-01-01"}}  $gt $gte $lt $lte
+    {"$or": [{"source": "wiki"}, {"tags": "faq"}]}       $and $or
+"""
+
+import json
+import threading
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+SCALAR_TYPES = (str, int, float, bool)
+COMPARISON_OPERATORS = ('$eq', '$ne', '$in', '$nin', '$gt', '$gte', '$lt', '$lte')
+LOGICAL_OPERATORS = ('$and', '$or')
+
+# Chroma metadata values must be scalars, so user metadata is stored as one JSON field
+METADATA_FIELD = 'metadata'
+
+
+def validate_metadata(metadata: Any) -> Dict[str, Any]:
+    """Check document metadata is a flat mapping of scalars or lists of scalars"""
+    if metadata is None:
+        return {}
+    if not isinstance(metadata, dict):
+        raise ValueError("Document metadata must be an object")
+    for key, value in metadata.items():
+        if not isinstance(key, str) or key.startswith('$'):
+            raise ValueError(f"Invalid metadata key: {key!r}")
+        values = value if isinstance(value, list) else [value]
+        if not all(isinstance(v, SCALAR_TYPES) for v in values):
+            raise ValueError(f"Metadata '{key}' must be a string, number, boolean or a list of those")
+    return metadata
+
+
+def encode_metadata(base: Dict[str, Any], metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """Chroma metadata for a document: system fields plus the user metadata as JSON"""
+    if not metadata:
+        return dict(base)
+    return {**base, METADATA_FIELD: json.dumps(metadata)}
+
+
+def decode_metadata(stored: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """User metadata back out of a stored Chroma metadata dict"""
+    if not stored or METADATA_FIELD not in stored:
+        return {}
+    return json.loads(stored[METADATA_FIELD])
+
+
+def validate_filter(where: Any) -> Dict[str, Any]:
+    """Check a filter expression is well formed before it reaches the search"""
+    if not isinstance(where, dict):
+        raise ValueError("Filter must be an object")
+    for key, condition in where.items():
+        if key in LOGICAL_OPERATORS:
+            if not isinstance(condition, list) or not condition:
+                raise ValueError(f"{key} expects a non-empty list of filters")
+            for part in condition:
+                validate_filter(part)
+        elif key.startswith('$'):
+            raise ValueError(f"Unsupported filter operator '{key}', expected one of {LOGICAL_OPERATORS}")
+        elif isinstance(condition, dict):
+            for operator, operand in condition.items():
+                if operator not in COMPARISON_OPERATORS:
+                    raise ValueError(
+                        f"Unsupported filter operator '{operator}', expected one of {COMPARISON_OPERATORS}"
+                    )
+                if operator in ('$in', '$nin'):
+                    if not isinstance(operand, list) or not all(isinstance(v, SCALAR_TYPES) for v in operand):
+                        raise ValueError(f"{operator} expects a list of values")
+                elif not isinstance(operand, SCALAR_TYPES):
+                    raise ValueError(f"{operator} expects a string, number or boolean")
+        elif not isinstance(condition, SCALAR_TYPES):
+            raise ValueError(f"Filter on '{key}' must be a value or an operator object")
+    return where
+
+
+def _sort_key(value: Any) -> Tuple[str, Any]:
+    # Group values by type so mixed-type fields still sort; ranges compare like with like
+    if isinstance(value, bool):
+        return ('bool', value)
+    if isinstance(value, (int, float)):
+        return ('number', value)
+    return ('str', value)
+
+
+class MetadataIndex:
+    """Inverted index from metadata values to document ids"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._postings: Dict[str, Dict[Any, Set[str]]] = defaultdict(lambda: defaultdict(set))
+        self._documents: Dict[str, Dict[str, Any]] = {}
+        self._sorted: Dict[str, Tuple[List[Tuple[str, Any]], List[str]]] = {}
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    @property
+    def all_ids(self) -> Set[str]:
+        return set(self._documents)
+
+    def add(self, doc_id: str, metadata: Dict[str, Any]) -> None:
+        with self._lock:
+            if doc_id in self._documents:
+                self.remove([doc_id])
+            self._documents[doc_id] = metadata
+            for field, value in metadata.items():
+                for v in (value if isinstance(value, list) else [value]):
+                    self._postings[field][v].add(doc_id)
+                self._sorted.pop(field, None)
+
+    def remove(self, doc_ids: Iterable[str]) -> None:
+        with self._lock:
+            for doc_id in doc_ids:
+                metadata = self._documents.pop(doc_id, None)
+                if metadata is None:
+                    continue
+                for field, value in metadata.items():
+                    for v in (value if isinstance(value, list) else [value]):
+                        self._postings[field][v].discard(doc_id)
+                    self._sorted.pop(field, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._postings.clear()
+            self._documents.clear()
+            self._sorted.clear()
+
+    def _sorted_values(self, field: str) -> Tuple[List[Tuple[str, Any]], List[str]]:
+        """Sorted value keys and their doc ids for a field, rebuilt lazily after writes"""
+        if field not in self._sorted:
+            pairs = sorted(
+                (_sort_key(value), doc_id)
+                for value, ids in self._postings.get(field, {}).items()
+                for doc_id in ids
+            )
+            self._sorted[field] = ([key for key, _ in pairs], [doc_id for _, doc_id in pairs])
+        return self._sorted[field]
+
+    def _range(self, field: str, operator: str, operand: Any) -> Set[str]:
+        keys, doc_ids = self._sorted_values(field)
+        key = _sort_key(operand)
+        # Only compare against values of the operand's type
+        type_start = bisect_left(keys, (key[0],))
+        type_end = bisect_left(keys, (key[0] + '\x7f',))
+        if operator == '$gt':
+            start, end = bisect_right(keys, key, type_start, type_end), type_end
+        elif operator == '$gte':
+            start, end = bisect_left(keys, key, type_start, type_end), type_end
+        elif operator == '$lt':
+            start, end = type_start, bisect_left(keys, key, type_start, type_end)
+        else:
+            start, end = type_start, bisect_right(keys, key, type_start, type_end)
+        return set(doc_ids[start:end])
+
+    def _match(self, field: str, condition: Any) -> Set[str]:
+        postings = self._postings.get(field, {})
+        if isinstance(condition, list):
+            raise ValueError(f"Use {{'$in': [...]}} to match '{field}' against several values")
+        if not isinstance(condition, dict):
+            return set(postings.get(condition, ()))
+
+        result: Optional[Set[str]] = None
+        for operator, operand in condition.items():
+            if operator == '$eq':
+                ids = set(postings.get(operand, ()))
+            elif operator in ('$in', '$nin'):
+                if not isinstance(operand, list):
+                    raise ValueError(f"{operator} expects a list")
+                ids = set().union(*(postings.get(v, ()) for v in operand))
+                if operator == '$nin':
+                    ids = self.all_ids - ids
+            elif operator == '$ne':
+                ids = self.all_ids - postings.get(operand, set())
+            elif operator in ('$gt', '$gte', '$lt', '$lte'):
+                ids = self._range(field, operator, operand)
+            else:
+                raise ValueError(f"Unsupported filter operator '{operator}', expected one of {COMPARISON_OPERATORS}")
+            result = ids if result is None else result & ids
+        return result if result is not None else self.all_ids
+
+    def resolve(self, where: Dict[str, Any]) -> Set[str]:
+        """Ids of documents matching a filter expression"""
+        if not isinstance(where, dict):
+            raise ValueError("Filter must be an object")
+        with self._lock:
+            result: Optional[Set[str]] = None
+            for key, condition in where.items():
+                if key in LOGICAL_OPERATORS:
+                    if not isinstance(condition, list) or not condition:
+                        raise ValueError(f"{key} expects a non-empty list of filters")
+                    parts = [self.resolve(part) for part in condition]
+                    ids = set.intersection(*parts) if key == '$and' else set.union(*parts)
+                elif key.startswith('$'):
+                    raise ValueError(f"Unsupported filter operator '{key}', expected one of {LOGICAL_OPERATORS}")
+                else:
+                    ids = self._match(key, condition)
+                result = ids if result is None else result & ids
+                if not result:
+                    break
+            return result if result is not None else self.all_ids
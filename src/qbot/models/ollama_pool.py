@@ -0,0 +1,325 @@
+"""
+Client pools over several Ollama endpoints.
+
+Embedding and generation traffic each get their own pool. A pool routes every
+call to the endpoint with the lowest expected latency (its EWMA latency times
+its outstanding requests plus one), fails over to the next endpoint on
+connection errors and server errors, and keeps endpoints that failed out of
+rotation until a health check sees them answer again. Embedding calls can be
+hedged: if the first endpoint has not answered within the hedge delay, the same
+request is sent to a second one and whichever answers first wins. Latency is
+tracked per item so batch calls do not inflate the delay, and the duplicate
+takes its own model scheduler slot, held until both requests have finished.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set
+
+import httpx
+import ollama
+
+from qbot.config import (
+    OLLAMA_EMBED_HEDGING,
+    OLLAMA_EMBED_HOSTS,
+    OLLAMA_GENERATE_HOSTS,
+    OLLAMA_HEALTH_INTERVAL,
+    OLLAMA_HEDGE_AFTER_MS,
+    OLLAMA_TIMEOUT
+)
+from qbot.utils.scheduler import model_scheduler
+
+HEALTH_CHECK_TIMEOUT = 2.0
+EWMA_WEIGHT = 0.2
+MIN_HEDGE_SECONDS = 0.02
+
+
+def is_retryable(error: Exception) -> bool:
+    """Whether a failed call may succeed on another endpoint (unlike e.g. an unknown model)"""
+    if isinstance(error, httpx.TransportError):
+        return True
+    return isinstance(error, ollama.ResponseError) and error.status_code >= 500
+
+
+class Endpoint:
+    """One Ollama server and its live routing statistics"""
+
+    def __init__(self, host: str, timeout: float = OLLAMA_TIMEOUT):
+        self.host = host
+        self.client = ollama.Client(host=host, timeout=timeout)
+        self._probe = ollama.Client(host=host, timeout=HEALTH_CHECK_TIMEOUT)
+        self.healthy = True
+        self.outstanding = 0
+        # EWMA seconds per item (a batch call of n texts counts as n items)
+        self.latency: Optional[float] = None
+        self.requests = 0
+        self.failures = 0
+
+    def expected_latency(self) -> float:
+        # Unmeasured endpoints look free, so each one is tried early on
+        return (self.latency or 0.0) * (self.outstanding + 1)
+
+    def record(self, seconds: float) -> None:
+        self.latency = seconds if self.latency is None else (1 - EWMA_WEIGHT) * self.latency + EWMA_WEIGHT * seconds
+
+    def probe(self) -> bool:
+        try:
+            self._probe.list()
+            return True
+        except Exception:
+            return False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'host': self.host,
+            'healthy': self.healthy,
+            'outstanding': self.outstanding,
+            'latency_ms': round(self.latency * 1000, 1) if self.latency is not None else None,
+            'requests': self.requests,
+            'failures': self.failures
+        }
+
+
+class OllamaPool:
+    """Latency-aware, failing-over client pool over a set of Ollama endpoints"""
+
+    def __init__(
+            self,
+            hosts: List[str],
+            name: str = 'ollama',
+            hedging: bool = False,
+            hedge_after_ms: float = OLLAMA_HEDGE_AFTER_MS,
+            health_interval: float = OLLAMA_HEALTH_INTERVAL,
+            timeout: float = OLLAMA_TIMEOUT
+    ):
+        if not hosts:
+            from qbot import ConfigurationError
+            raise ConfigurationError(f"The {name} pool needs at least one Ollama host")
+        self.name = name
+        self.endpoints = [Endpoint(host, timeout) for host in hosts]
+        self.hedging = hedging
+        self.hedge_after = hedge_after_ms / 1000 if hedge_after_ms else None
+        self.hedges = 0
+        self.hedge_wins = 0
+        # Hedged calls whose duplicate request (and extra scheduler slot) has not finished yet
+        self.hedges_in_flight = 0
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._stop = threading.Event()
+        if health_interval and health_interval > 0:
+            threading.Thread(target=self._health_loop, args=(health_interval,), daemon=True,
+                             name=f'{name}-health').start()
+
+    def _acquire(self, exclude: Set[Endpoint]) -> Optional[Endpoint]:
+        """Reserve the endpoint with the lowest expected latency, preferring healthy ones"""
+        with self._lock:
+            candidates = [e for e in self.endpoints if e not in exclude]
+            healthy = [e for e in candidates if e.healthy]
+            # With nothing healthy left, still try the rest rather than fail outright
+            pool = healthy or candidates
+            if not pool:
+                return None
+            endpoint = min(pool, key=lambda e: (e.expected_latency(), e.outstanding, e.requests))
+            endpoint.outstanding += 1
+            endpoint.requests += 1
+            return endpoint
+
+    def _release(self, endpoint: Endpoint, seconds: Optional[float], error: Optional[Exception] = None) -> None:
+        with self._lock:
+            endpoint.outstanding -= 1
+            if seconds is not None:
+                endpoint.record(seconds)
+            if error is not None and is_retryable(error):
+                endpoint.failures += 1
+                if endpoint.healthy:
+                    logging.warning(f"Ollama endpoint {endpoint.host} ({self.name}) marked unhealthy: {error}")
+                endpoint.healthy = False
+
+    def _attempt(self, endpoint: Endpoint, fn: Callable[[ollama.Client], Any], items: int = 1) -> Any:
+        start = time.monotonic()
+        try:
+            result = fn(endpoint.client)
+        except Exception as e:
+            self._release(endpoint, None, e)
+            raise
+        self._release(endpoint, (time.monotonic() - start) / max(1, items))
+        return result
+
+    def _call(self, fn: Callable[[ollama.Client], Any], exclude: Set[Endpoint], items: int = 1) -> Any:
+        last_error: Optional[Exception] = None
+        while True:
+            endpoint = self._acquire(exclude)
+            if endpoint is None:
+                raise last_error or ConnectionError(f"No Ollama endpoints available in the {self.name} pool")
+            try:
+                return self._attempt(endpoint, fn, items)
+            except Exception as e:
+                if not is_retryable(e):
+                    raise
+                last_error = e
+                exclude.add(endpoint)
+
+    def call(self, fn: Callable[[ollama.Client], Any], hedge: bool = False, items: int = 1) -> Any:
+        """
+        Run fn(client) on the best endpoint, failing over (and, with hedge=True, hedging) as needed.
+        items is how many texts the call carries, so its latency is recorded per item.
+        """
+        if hedge and self.hedging and sum(e.healthy for e in self.endpoints) > 1:
+            return self._hedged_call(fn, items)
+        return self._call(fn, set(), items)
+
+    def _hedge_delay(self, items: int = 1) -> Optional[float]:
+        if self.hedge_after:
+            return self.hedge_after
+        with self._lock:
+            latencies = [e.latency for e in self.endpoints if e.healthy and e.latency is not None]
+        # Without a latency estimate there is nothing to call "slow" yet
+        return max(MIN_HEDGE_SECONDS, 3 * items * sum(latencies) / len(latencies)) if latencies else None
+
+    def _hedged_call(self, fn: Callable[[ollama.Client], Any], items: int = 1) -> Any:
+        delay = self._hedge_delay(items)
+        primary = self._acquire(set()) if delay is not None else None
+        if primary is None:
+            return self._call(fn, set(), items)
+
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=8 * len(self.endpoints),
+                                                    thread_name_prefix=f'{self.name}-hedge')
+        futures = {self._executor.submit(self._attempt, primary, fn, items): primary}
+        done, _ = wait(futures, timeout=delay)
+        if not done:
+            self._hedge(futures, fn, items)
+
+        pending = set(futures)
+        last_error: Optional[Exception] = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if futures[future] is not primary:
+                        with self._lock:
+                            self.hedge_wins += 1
+                    # The losing request is left to finish; its endpoint and the hedge's
+                    # scheduler slot are released when it does
+                    return future.result()
+                last_error = future.exception()
+                if not is_retryable(last_error):
+                    raise last_error
+        return self._call(fn, set(futures.values()), items)
+
+    def _hedge(self, futures: Dict[Any, Endpoint], fn: Callable[[ollama.Client], Any], items: int) -> None:
+        """Send a duplicate of the pending primary request, if a second endpoint and a scheduler slot are free"""
+        priority = model_scheduler.current_priority()
+        # The caller's slot covers one request; without spare capacity for a second, don't hedge
+        if not model_scheduler.try_acquire(priority):
+            return
+        backup = self._acquire(set(futures.values()))
+        if backup is None:
+            model_scheduler.release(priority, 0.0)
+            return
+        with self._lock:
+            self.hedges += 1
+            self.hedges_in_flight += 1
+        start = time.monotonic()
+        futures[self._executor.submit(self._attempt, backup, fn, items)] = backup
+        remaining = [len(futures)]
+
+        def finished(_future) -> None:
+            with self._lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+                self.hedges_in_flight -= 1
+            model_scheduler.release(priority, time.monotonic() - start)
+
+        for future in list(futures):
+            future.add_done_callback(finished)
+
+    def stream(self, fn: Callable[[ollama.Client], Iterator[Any]]) -> Iterator[Any]:
+        """Iterate fn(client)'s stream from the best endpoint; fails over only before the first chunk"""
+        exclude: Set[Endpoint] = set()
+        last_error: Optional[Exception] = None
+        while True:
+            endpoint = self._acquire(exclude)
+            if endpoint is None:
+                raise last_error or ConnectionError(f"No Ollama endpoints available in the {self.name} pool")
+            start = time.monotonic()
+            try:
+                chunks = fn(endpoint.client)
+                first = next(chunks, None)
+            except Exception as e:
+                self._release(endpoint, None, e)
+                if not is_retryable(e):
+                    raise
+                last_error = e
+                exclude.add(endpoint)
+                continue
+            break
+
+        # Time to first chunk is the routing signal for streamed generation
+        latency = time.monotonic() - start
+        error: Optional[Exception] = None
+        try:
+            if first is not None:
+                yield first
+            yield from chunks
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            close = getattr(chunks, 'close', None)
+            if close is not None:
+                close()
+            self._release(endpoint, latency, error)
+
+    def check_health(self) -> None:
+        """Probe every endpoint, returning recovered ones to rotation and taking dead ones out"""
+        for endpoint in self.endpoints:
+            healthy = endpoint.probe()
+            with self._lock:
+                if healthy != endpoint.healthy:
+                    logging.info(f"Ollama endpoint {endpoint.host} ({self.name}) is "
+                                 f"{'healthy' if healthy else 'unhealthy'}")
+                endpoint.healthy = healthy
+
+    def _health_loop(self, interval: float) -> None:
+        while not self._stop.wait(interval):
+            try:
+                self.check_health()
+            except Exception as e:
+                logging.error(f"Health check of the {self.name} pool failed: {str(e)}")
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'hedging': self.hedging,
+                'hedges': self.hedges,
+                'hedge_wins': self.hedge_wins,
+                'hedges_in_flight': self.hedges_in_flight,
+                'endpoints': [endpoint.stats() for endpoint in self.endpoints]
+            }
+
+
+_pools: Dict[str, OllamaPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(kind: str) -> OllamaPool:
+    """The process-wide 'embed' or 'generate' pool, built from OLLAMA_EMBED_HOSTS / OLLAMA_GENERATE_HOSTS"""
+    with _pools_lock:
+        if kind not in _pools:
+            if kind == 'embed':
+                _pools[kind] = OllamaPool(OLLAMA_EMBED_HOSTS, name='embed', hedging=OLLAMA_EMBED_HEDGING)
+            elif kind == 'generate':
+                _pools[kind] = OllamaPool(OLLAMA_GENERATE_HOSTS, name='generate')
+            else:
+                raise ValueError(f"Unknown Ollama pool '{kind}', expected 'embed' or 'generate'")
+        return _pools[kind]
@@ -0,0 +1,213 @@
+"""
+Portable, versioned snapshots of a built vector index.
+
+A snapshot lets a new replica start serving without re-embedding its corpus:
+the vectors, documents and metadata of a collection are written to one binary
+file that is memory-mapped on load and bulk-inserted into the index, and only
+documents added since the snapshot was taken need embedding. Checksums are
+verified once per file per process, so tenants reloaded after an unload do not
+re-hash it.
+
+File layout (all integers little-endian):
+
+    b'QBOTSNAP'                      magic
+    uint32                           format version
+    uint32                           header length
+    header                           UTF-8 JSON: model, dimension, count, section offsets/lengths/sha256
+    32 bytes                         sha256 of the header
+    zero padding                     to a 64-byte boundary, where the data sections start
+    vectors                          count x dimension float32, row-major
+    records                          JSON lines: {"id", "document", "metadata"}, in vector order
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import struct
+import tempfile
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+
+from qbot import VectorStoreError
+
+MAGIC = b'QBOTSNAP'
+SNAPSHOT_VERSION = 1
+SNAPSHOT_EXTENSION = '.qbs'
+ALIGNMENT = 64
+_PREAMBLE = struct.Struct('<8sII')
+_VECTOR_DTYPE = np.dtype('<f4')
+_HASH_CHUNK = 1 << 20
+
+# One batch of entries: (ids, vectors, documents, metadatas)
+Batch = Tuple[List[str], Any, List[str], List[Any]]
+
+# (path, inode, size, mtime) of snapshot files whose checksums this process has already verified
+_verified: Set[Tuple[str, int, int, int]] = set()
+_verified_lock = threading.Lock()
+
+
+def snapshot_file(directory: str, collection_name: str) -> str:
+    """Snapshot location for a collection inside a snapshot directory"""
+    return os.path.join(directory, f'{collection_name}{SNAPSHOT_EXTENSION}')
+
+
+def remove_snapshot(path: str) -> bool:
+    """Delete a snapshot file if it exists; returns whether one was removed"""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        return False
+    logging.info(f"Removed snapshot {path}")
+    return True
+
+
+def _file_sha256(f, offset: int, length: int) -> str:
+    digest = hashlib.sha256()
+    f.seek(offset)
+    remaining = length
+    while remaining:
+        chunk = f.read(min(_HASH_CHUNK, remaining))
+        if not chunk:
+            break
+        digest.update(chunk)
+        remaining -= len(chunk)
+    return digest.hexdigest()
+
+
+def write_snapshot(path: str, batches: Iterable[Batch], model: str, dimension: int,
+                   collection_name: str, backend: Optional[str] = None) -> Dict[str, Any]:
+    """Stream batches of entries into a snapshot file, atomically replacing any existing one; returns its header"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    count = 0
+    # Sections are spooled to temporary files first since the header (written
+    # first) needs their lengths and checksums
+    with tempfile.TemporaryFile(dir=directory) as vectors_file, \
+            tempfile.TemporaryFile(dir=directory) as records_file:
+        vectors_hash, records_hash = hashlib.sha256(), hashlib.sha256()
+        for ids, vectors, documents, metadatas in batches:
+            block = np.ascontiguousarray(vectors, dtype=_VECTOR_DTYPE).reshape(len(ids), dimension).tobytes()
+            vectors_file.write(block)
+            vectors_hash.update(block)
+            for doc_id, document, metadata in zip(ids, documents, metadatas):
+                line = json.dumps({'id': doc_id, 'document': document, 'metadata': metadata}).encode('utf-8') + b'\n'
+                records_file.write(line)
+                records_hash.update(line)
+            count += len(ids)
+
+        vectors_length, records_length = vectors_file.tell(), records_file.tell()
+        header = {
+            'version': SNAPSHOT_VERSION,
+            'model': model,
+            'backend': backend,
+            'dimension': dimension,
+            'count': count,
+            'collection': collection_name,
+            'created_at': datetime.now().isoformat(),
+            'vectors': {'offset': 0, 'length': vectors_length, 'sha256': vectors_hash.hexdigest()},
+            'records': {'offset': vectors_length, 'length': records_length, 'sha256': records_hash.hexdigest()}
+        }
+        header_bytes = json.dumps(header).encode('utf-8')
+        preamble_length = _PREAMBLE.size + len(header_bytes) + 32
+        padding = -preamble_length % ALIGNMENT
+
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(_PREAMBLE.pack(MAGIC, SNAPSHOT_VERSION, len(header_bytes)))
+            f.write(header_bytes)
+            f.write(hashlib.sha256(header_bytes).digest())
+            f.write(b'\0' * padding)
+            for section in (vectors_file, records_file):
+                section.seek(0)
+                shutil.copyfileobj(section, f)
+        os.replace(tmp_path, path)
+
+    logging.info(f"Wrote snapshot of {count} documents to {path}")
+    return header
+
+
+class Snapshot:
+    """A snapshot file opened for reading, with its vectors memory-mapped"""
+
+    def __init__(self, path: str, verify: bool = True):
+        self.path = path
+        with open(path, 'rb') as f:
+            preamble = f.read(_PREAMBLE.size)
+            if len(preamble) < _PREAMBLE.size:
+                raise VectorStoreError(f"{path} is not a QBot snapshot")
+            magic, version, header_length = _PREAMBLE.unpack(preamble)
+            if magic != MAGIC:
+                raise VectorStoreError(f"{path} is not a QBot snapshot")
+            if version != SNAPSHOT_VERSION:
+                raise VectorStoreError(
+                    f"Snapshot {path} has format version {version}, this QBot reads version {SNAPSHOT_VERSION}"
+                )
+            header_bytes = f.read(header_length)
+            if hashlib.sha256(header_bytes).digest() != f.read(32):
+                raise VectorStoreError(f"Snapshot {path} has a corrupt header")
+        self.header: Dict[str, Any] = json.loads(header_bytes)
+        preamble_length = _PREAMBLE.size + header_length + 32
+        self.data_offset = preamble_length + (-preamble_length % ALIGNMENT)
+
+        expected = self.data_offset + self.header['vectors']['length'] + self.header['records']['length']
+        if os.path.getsize(path) != expected:
+            raise VectorStoreError(f"Snapshot {path} is truncated or has trailing data")
+        if self.header['vectors']['length'] != self.count * self.dimension * _VECTOR_DTYPE.itemsize:
+            raise VectorStoreError(f"Snapshot {path} vector section does not match its header")
+        if verify:
+            self.verify()
+
+    @property
+    def model(self) -> str:
+        return self.header['model']
+
+    @property
+    def dimension(self) -> int:
+        return self.header['dimension']
+
+    @property
+    def count(self) -> int:
+        return self.header['count']
+
+    def verify(self, force: bool = False) -> None:
+        """Check both data sections against their recorded sha256, once per file version unless forced"""
+        stat = os.stat(self.path)
+        key = (os.path.realpath(self.path), stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        with _verified_lock:
+            if key in _verified and not force:
+                return
+        with open(self.path, 'rb') as f:
+            for name in ('vectors', 'records'):
+                section = self.header[name]
+                if _file_sha256(f, self.data_offset + section['offset'], section['length']) != section['sha256']:
+                    raise VectorStoreError(f"Snapshot {self.path} failed its {name} checksum")
+        with _verified_lock:
+            _verified.add(key)
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """All vectors, memory-mapped read-only rather than read into memory"""
+        if not self.count:
+            return np.empty((0, self.dimension), dtype=_VECTOR_DTYPE)
+        return np.memmap(self.path, dtype=_VECTOR_DTYPE, mode='r', shape=(self.count, self.dimension),
+                         offset=self.data_offset + self.header['vectors']['offset'])
+
+    def iter_records(self) -> Iterator[Dict[str, Any]]:
+        with open(self.path, 'rb') as f:
+            f.seek(self.data_offset + self.header['records']['offset'])
+            for _ in range(self.count):
+                yield json.loads(f.readline())
+
+    def iter_batches(self, batch_size: int = 1000) -> Iterator[Batch]:
+        """(ids, vectors, documents, metadatas) batch_size entries at a time, in file order"""
+        vectors = self.vectors
+        records = self.iter_records()
+        for start in range(0, self.count, batch_size):
+            batch = [next(records) for _ in range(min(batch_size, self.count - start))]
+            yield ([r['id'] for r in batch], vectors[start:start + len(batch)],
+                   [r['document'] for r in batch], [r['metadata'] for r in batch])
@@ -0,0 +1,323 @@
+"""
+Multi-tenant knowledge bases.
+
+Each tenant has its own documents file and vector collection. Collections are
+built on first use and unloaded least-recently-used when too many are loaded,
+when their resident indexes together exceed TENANT_MEMORY_BUDGET_MB, or after
+sitting idle, so one process can serve many small knowledge bases within
+bounded memory.
+Requests lease the store they use; a store that is unloaded or rebuilt while
+leased is only closed once its last request has finished with it.
+"""
+
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import chromadb
+
+from qbot import TenantNotFoundError
+from qbot.config import (
+    DEFAULT_TENANT,
+    SNAPSHOT_PATH,
+    TENANT_DOCUMENTS_DIR,
+    TENANT_IDLE_SECONDS,
+    TENANT_MAX_LOADED,
+    TENANT_MEMORY_BUDGET_MB,
+    VECTOR_STORE_PATH
+)
+from qbot.utils.document_manager import DocumentManager
+from .snapshot import remove_snapshot, snapshot_file
+from .vector_store import VectorStore, purge_persisted
+
+# Tenant keys end up in file and collection names, so keep them to a safe alphabet
+TENANT_KEY_PATTERN = re.compile(r'^[A-Za-z0-9](?:[A-Za-z0-9_-]{0,46}[A-Za-z0-9])?$')
+
+
+def validate_tenant(tenant: str) -> str:
+    if not isinstance(tenant, str) or not TENANT_KEY_PATTERN.match(tenant):
+        raise ValueError("Tenant must be 1-48 letters, digits, '-' or '_', starting and ending alphanumerically")
+    return tenant
+
+
+def tenant_collection_name(tenant: str) -> str:
+    """Vector collection backing a tenant; the default tenant keeps the original 'docs'"""
+    return 'docs' if tenant == DEFAULT_TENANT else f'docs_{tenant}'
+
+
+def tenant_documents_path(tenant: str) -> Optional[str]:
+    """Documents file for a tenant; None means DocumentManager's default documents.json"""
+    if tenant == DEFAULT_TENANT:
+        return None
+    documents_dir = TENANT_DOCUMENTS_DIR or str(Path(__file__).parent.parent / 'documents' / 'tenants')
+    return os.path.join(documents_dir, f'{tenant}.json')
+
+
+class Tenant:
+    """A tenant's documents and, while loaded, its vector store"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.collection_name = tenant_collection_name(name)
+        self.documents_path = tenant_documents_path(name)
+        self.document_manager = DocumentManager(self.documents_path)
+        self.vector_store: Optional[VectorStore] = None
+        # Cleared once the documents are rebuilt from scratch, so the snapshot cannot resurrect them
+        self.use_snapshot = True
+        self.lock = threading.Lock()
+        # Requests in flight per store, and replaced stores waiting for theirs to finish
+        self.leases: Dict[VectorStore, int] = {}
+        self.retired: List[VectorStore] = []
+        self.active_requests = 0
+        self.requests = 0
+        self.loads = 0
+        self.last_used = time.monotonic()
+        self.last_load_seconds: Optional[float] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self.vector_store is not None
+
+    def resident_bytes(self) -> int:
+        """Estimated memory of the loaded vector store's resident index"""
+        store = self.vector_store
+        return store.memory_stats().get('estimated_bytes', 0) if store is not None else 0
+
+    def stats(self) -> Dict[str, Any]:
+        documents = self.document_manager.get_documents()
+        stats = {
+            'tenant': self.name,
+            'loaded': self.loaded,
+            'total_documents': len(documents),
+            'requests': self.requests,
+            'active_requests': self.active_requests,
+            'loads': self.loads,
+            'last_load_seconds': self.last_load_seconds,
+            'idle_seconds': round(time.monotonic() - self.last_used, 1)
+        }
+        if self.vector_store is not None:
+            stats['memory'] = self.vector_store.memory_stats()
+        return stats
+
+
+class TenantManager:
+    """Routes requests to per-tenant vector stores, loading lazily and evicting LRU"""
+
+    def __init__(
+            self,
+            max_loaded: int = TENANT_MAX_LOADED,
+            idle_seconds: int = TENANT_IDLE_SECONDS,
+            store_factory: Optional[Callable[[Tenant], VectorStore]] = None,
+            memory_budget_bytes: int = TENANT_MEMORY_BUDGET_MB * 1024 * 1024
+    ):
+        self.max_loaded = max(1, max_loaded)
+        self.idle_seconds = idle_seconds
+        self.memory_budget_bytes = memory_budget_bytes or None
+        self.store_factory = store_factory or self._build_store
+        self._tenants: Dict[str, Tenant] = {}
+        self._loaded: "OrderedDict[str, Tenant]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    @staticmethod
+    def _build_store(tenant: Tenant) -> VectorStore:
+        use_snapshot = SNAPSHOT_PATH and tenant.use_snapshot
+        return VectorStore(
+            documents_path=tenant.documents_path,
+            collection_name=tenant.collection_name,
+            allow_empty=tenant.name != DEFAULT_TENANT,
+            snapshot_path=snapshot_file(SNAPSHOT_PATH, tenant.collection_name) if use_snapshot else None
+        )
+
+    def _exists(self, name: str) -> bool:
+        """Whether a tenant has a knowledge base, either as a documents file or a persisted collection"""
+        if name == DEFAULT_TENANT or name in self._tenants:
+            return True
+        if os.path.exists(tenant_documents_path(name)):
+            return True
+        if VECTOR_STORE_PATH:
+            try:
+                chromadb.PersistentClient(path=VECTOR_STORE_PATH).get_collection(name=tenant_collection_name(name))
+                return True
+            except Exception:
+                return False
+        return False
+
+    def tenant(self, name: Optional[str] = None, create: bool = False) -> Tenant:
+        """Look up a tenant; create=True registers a new one (e.g. on its first upload)"""
+        name = validate_tenant(name or DEFAULT_TENANT)
+        with self._lock:
+            tenant = self._tenants.get(name)
+            if tenant is None:
+                if not create and not self._exists(name):
+                    raise TenantNotFoundError(f"Unknown tenant '{name}'")
+                tenant = self._tenants[name] = Tenant(name)
+            return tenant
+
+    def get_store(self, name: Optional[str] = None) -> VectorStore:
+        """
+        The tenant's vector store, building it on first use. The store is not leased, so it may be
+        closed at any time; requests that search it should use lease() instead.
+        """
+        tenant = self.tenant(name)
+        with tenant.lock:
+            if tenant.vector_store is None:
+                self._load(tenant)
+            store = tenant.vector_store
+            tenant.requests += 1
+        self._touch(tenant)
+        return store
+
+    @contextmanager
+    def lease(self, name: Optional[str] = None) -> Iterator[VectorStore]:
+        """The tenant's vector store, kept open until the block exits even if the tenant is unloaded or rebuilt"""
+        tenant = self.tenant(name)
+        with tenant.lock:
+            if tenant.vector_store is None:
+                self._load(tenant)
+            store = tenant.vector_store
+            tenant.requests += 1
+            tenant.leases[store] = tenant.leases.get(store, 0) + 1
+            tenant.active_requests += 1
+        self._touch(tenant)
+        try:
+            yield store
+        finally:
+            self._release(tenant, store)
+            # The request may have grown the index (e.g. new documents), or freed a tenant that was held over
+            self._evict(keep=tenant.name)
+
+    def _release(self, tenant: Tenant, store: VectorStore) -> None:
+        with tenant.lock:
+            tenant.active_requests -= 1
+            tenant.leases[store] -= 1
+            if tenant.leases[store]:
+                return
+            del tenant.leases[store]
+            # Idle time counts from the end of the last request, not its start
+            tenant.last_used = time.monotonic()
+            if store in tenant.retired:
+                tenant.retired.remove(store)
+                store.close()
+
+    def _retire(self, tenant: Tenant, store: VectorStore) -> None:
+        """Close a store the tenant no longer serves, or once its last lease ends; call with tenant.lock held"""
+        if tenant.leases.get(store):
+            tenant.retired.append(store)
+        else:
+            store.close()
+
+    def reload(self, name: Optional[str] = None) -> VectorStore:
+        """Rebuild a tenant's vector store after its documents changed"""
+        return self._rebuild(self.tenant(name, create=True), purge=False)
+
+    def clear(self, name: Optional[str] = None) -> VectorStore:
+        """Delete everything indexed for a tenant, on disk too, and rebuild from its documents file"""
+        return self._rebuild(self.tenant(name), purge=True)
+
+    def _rebuild(self, tenant: Tenant, purge: bool) -> VectorStore:
+        with tenant.lock:
+            old_store = tenant.vector_store
+            if purge:
+                persist_directory = old_store.persist_directory if old_store is not None else VECTOR_STORE_PATH
+                if persist_directory:
+                    purge_persisted(persist_directory, tenant.collection_name)
+                if SNAPSHOT_PATH:
+                    # Otherwise a restarted replica would bootstrap the cleared documents back from it
+                    remove_snapshot(snapshot_file(SNAPSHOT_PATH, tenant.collection_name))
+            if old_store is not None:
+                # Requests already using the old store finish on it; new ones get the rebuilt store
+                tenant.vector_store = None
+                self._retire(tenant, old_store)
+            tenant.use_snapshot = False
+            self._load(tenant)
+            store = tenant.vector_store
+        self._touch(tenant)
+        return store
+
+    def _load(self, tenant: Tenant) -> None:
+        start = time.perf_counter()
+        logging.info(f"Loading knowledge base for tenant '{tenant.name}'")
+        tenant.vector_store = self.store_factory(tenant)
+        tenant.loads += 1
+        tenant.last_load_seconds = round(time.perf_counter() - start, 3)
+
+    def _touch(self, tenant: Tenant) -> None:
+        with self._lock:
+            tenant.last_used = time.monotonic()
+            self._loaded[tenant.name] = tenant
+            self._loaded.move_to_end(tenant.name)
+        self._evict(keep=tenant.name)
+
+    def _evict(self, keep: str) -> None:
+        with self._lock:
+            victims = self._select_victims(keep)
+        for victim in victims:
+            self._unload(victim)
+
+    def _select_victims(self, keep: str) -> List[Tenant]:
+        """
+        Loaded tenants past the capacity limit or idle for too long, then any more needed to bring
+        the loaded indexes back under the shared memory budget, least recently used first
+        """
+        now = time.monotonic()
+        victims = []
+        for name, tenant in list(self._loaded.items()):
+            over_capacity = len(self._loaded) > self.max_loaded
+            idle = self.idle_seconds and now - tenant.last_used > self.idle_seconds
+            # Tenants with requests in flight are never idle, and are only unloaded once those finish
+            if name == keep or tenant.active_requests or not (over_capacity or idle):
+                continue
+            del self._loaded[name]
+            victims.append(tenant)
+
+        if self.memory_budget_bytes:
+            resident = {name: tenant.resident_bytes() for name, tenant in self._loaded.items()}
+            total = sum(resident.values())
+            for name, tenant in list(self._loaded.items()):
+                if total <= self.memory_budget_bytes:
+                    break
+                if name == keep or tenant.active_requests:
+                    continue
+                del self._loaded[name]
+                victims.append(tenant)
+                total -= resident[name]
+        return victims
+
+    def _unload(self, tenant: Tenant) -> None:
+        with tenant.lock:
+            if tenant.vector_store is None:
+                return
+            self._retire(tenant, tenant.vector_store)
+            tenant.vector_store = None
+        self.evictions += 1
+        logging.info(f"Unloaded idle tenant '{tenant.name}'")
+
+    def unload(self, name: Optional[str] = None) -> None:
+        tenant = self.tenant(name)
+        with self._lock:
+            self._loaded.pop(tenant.name, None)
+        self._unload(tenant)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            tenants = list(self._tenants.values())
+            loaded = len(self._loaded)
+        return {
+            'known_tenants': len(tenants),
+            'loaded_tenants': loaded,
+            'max_loaded': self.max_loaded,
+            'idle_seconds': self.idle_seconds,
+            'memory_budget_bytes': self.memory_budget_bytes,
+            'resident_bytes': sum(tenant.resident_bytes() for tenant in tenants),
+            'evictions': self.evictions,
+            'timestamp': datetime.now().isoformat(),
+            'tenants': [tenant.stats() for tenant in tenants]
+        }
@@ -1,18 +1,218 @@
-import ollama
 import chromadb
 import json
+import math
 import os
 import logging
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
 from datetime import datetime
-from typing import List, Optional, Dict
+from contextlib import closing
+from typing import Any, Iterator, List, Optional, Dict, Set
 from pathlib import Path
 
+import numpy as np
+
+from qbot import OverloadedError, VectorStoreError
+from qbot.config import (
+    ASK_BATCH_SIZE,
+    ASK_BATCH_WORKERS,
+    DEDUP_THRESHOLD,
+    EMBEDDING_DIMENSION,
+    FILTER_EXACT_SEARCH_LIMIT,
+    INGEST_BATCH_SIZE,
+    RELEVANCE_MAX_DISTANCE,
+    SNAPSHOT_VERIFY,
+    STRUCTURED_NUM_PREDICT,
+    STRUCTURED_STOP,
+    TENANT_MEMORY_BUDGET_MB,
+    VECTOR_STORE_EVICTION_POLICY,
+    VECTOR_STORE_MAX_DOCUMENTS,
+    VECTOR_STORE_MEMORY_BUDGET_MB,
+    VECTOR_STORE_OFFLOAD_PATH,
+    VECTOR_STORE_PATH
+)
+from qbot.utils.dedup import NearDuplicateIndex
+from qbot.utils.helpers import content_hash, normalize_document
+from qbot.utils.json_stream import IncrementalJSONParser
+from qbot.utils.scheduler import BATCH, model_scheduler
+from .backends import Embedder, Generator, get_embedder, get_generator
+from .memory import MemoryTracker, OffloadStore, ResidentVectors
+from .metadata_index import METADATA_FIELD, MetadataIndex, decode_metadata, encode_metadata
+from .snapshot import Snapshot, write_snapshot
+
 logging.basicConfig(level=logging.INFO)
 
+EVICTION_POLICIES = ('offload', 'evict')
+
+QUERY_RESULT_KEYS = ('ids', 'documents', 'metadatas', 'distances')
+
+# Entries per collection.add() when bulk-loading a snapshot (capped at the client's max batch size)
+SNAPSHOT_LOAD_BATCH_SIZE = 5000
+
+# Shape of /ask-json answers; "answer" comes first so it can be streamed as it is generated
+STRUCTURED_RESPONSE_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'answer': {'type': 'string'},
+        'source': {'type': 'string'},
+        'confidence': {'type': 'number', 'minimum': 0, 'maximum': 1}
+    },
+    'required': ['answer', 'source', 'confidence']
+}
+
+
+def validate_embeddings(embeddings: List[List[float]], dimension: int) -> None:
+    """Reject embeddings whose dimension does not match the index"""
+    for embedding in embeddings:
+        if len(embedding) != dimension:
+            raise VectorStoreError(
+                f"Embedding dimension {len(embedding)} does not match the index dimension {dimension}"
+            )
+
+
+def iter_collection(collection, include: List[str], page_size: int = 1000):
+    """Page through every entry of a collection, yielding one get() page at a time"""
+    offset = 0
+    while True:
+        page = collection.get(include=include, limit=page_size, offset=offset)
+        if not page['ids']:
+            break
+        yield page
+        offset += len(page['ids'])
+
+
+def open_collection(client, name: str, dimension: int, model: Optional[str] = None,
+                    backend: Optional[str] = None):
+    """Get or create a collection pinned to an embedding dimension, recording the model that embeds into it"""
+    recorded = {'embedding_dimension': dimension}
+    if model:
+        recorded.update({'embedding_model': model, 'embedding_backend': backend or ''})
+    try:
+        collection = client.get_collection(name=name)
+    except Exception:
+        return client.create_collection(name=name, metadata=recorded)
+
+    metadata = collection.metadata or {}
+    stored = metadata.get('embedding_dimension')
+    if stored is not None and stored != dimension:
+        raise VectorStoreError(
+            f"Collection '{name}' holds {stored}-dimensional embeddings but the embedding model "
+            f"produces {dimension}-dimensional ones; re-ingest or switch EMBEDDING_MODEL back"
+        )
+    stored_model = metadata.get('embedding_model')
+    if model and stored_model is None:
+        # Collections created before the model was recorded
+        collection.modify(metadata={**metadata, **recorded})
+    elif model and stored_model != model:
+        logging.warning(f"Collection '{name}' was embedded with {stored_model} but the embedding model is {model}")
+    return collection
+
+
+def offload_path(persist_directory: Optional[str], collection_name: str) -> Optional[str]:
+    """Directory of a collection's offloaded tier; None when it only lives in a temporary directory"""
+    if VECTOR_STORE_OFFLOAD_PATH:
+        return os.path.join(VECTOR_STORE_OFFLOAD_PATH, collection_name)
+    if persist_directory:
+        return os.path.join(persist_directory, 'offload', collection_name)
+    return None
+
+
+def ingest_checkpoint_path(index_path: str, collection_name: str) -> str:
+    """Default resume checkpoint of `qbot ingest` for a collection"""
+    return os.path.join(index_path, f'ingest_checkpoint_{collection_name}.json')
+
+
+def evicted_ids_path(persist_directory: str, collection_name: str) -> str:
+    """Record of the documents the 'evict' policy dropped from a persistent collection"""
+    return os.path.join(persist_directory, f'evicted_{collection_name}.txt')
+
+
+def load_evicted_ids(persist_directory: str, collection_name: str) -> Set[str]:
+    """Ids the 'evict' policy dropped from a persistent collection"""
+    path = evicted_ids_path(persist_directory, collection_name)
+    if not os.path.exists(path):
+        return set()
+    with open(path, 'r') as f:
+        return {line.strip() for line in f if line.strip()}
+
+
+def purge_persisted(persist_directory: str, collection_name: str) -> None:
+    """Delete a persistent collection together with its offloaded tier and ingest checkpoint"""
+    try:
+        chromadb.PersistentClient(path=persist_directory).delete_collection(name=collection_name)
+    except ValueError:
+        pass  # Never created
+    path = offload_path(persist_directory, collection_name)
+    if path is not None:
+        shutil.rmtree(path, ignore_errors=True)
+    for path in (ingest_checkpoint_path(persist_directory, collection_name),
+                 evicted_ids_path(persist_directory, collection_name)):
+        if os.path.exists(path):
+            os.remove(path)
+    logging.info(f"Purged persistent collection '{collection_name}'")
+
+
+def snapshot_batches(collection, offload_store: Optional[OffloadStore] = None) -> Iterator[tuple]:
+    """(ids, vectors, documents, metadatas) batches covering a collection and its offloaded tier"""
+    for page in iter_collection(collection, ['embeddings', 'documents', 'metadatas']):
+        yield page['ids'], page['embeddings'], page['documents'], page['metadatas']
+    if offload_store is not None:
+        yield from offload_store.iter_batches()
+
 
 class VectorStore:
-    def __init__(self, documents_path: Optional[str] = None):
-        self.client = chromadb.Client()
+    def __init__(
+            self,
+            documents_path: Optional[str] = None,
+            persist_directory: Optional[str] = None,
+            embedder: Optional[Embedder] = None,
+            generator: Optional[Generator] = None,
+            collection_name: str = "docs",
+            allow_empty: bool = False,
+            snapshot_path: Optional[str] = None
+    ):
+        self.collection_name = collection_name
+        self.allow_empty = allow_empty
+        self.snapshot_path = snapshot_path
+        self.snapshot_loaded = 0
+        self.embedder = embedder or get_embedder()
+        self.generator = generator or get_generator()
+        self.dimension = self.embedder.dimension
+        if EMBEDDING_DIMENSION and self.dimension != EMBEDDING_DIMENSION:
+            raise VectorStoreError(
+                f"Embedding model {self.embedder.model} produces {self.dimension}-dimensional vectors, "
+                f"but EMBEDDING_DIMENSION is {EMBEDDING_DIMENSION}"
+            )
+        if VECTOR_STORE_EVICTION_POLICY not in EVICTION_POLICIES:
+            raise VectorStoreError(f"VECTOR_STORE_EVICTION_POLICY must be one of {EVICTION_POLICIES}")
+        # One store never gets more than the budget shared by all loaded tenants
+        budget_mb = min((b for b in (VECTOR_STORE_MEMORY_BUDGET_MB, TENANT_MEMORY_BUDGET_MB) if b), default=0)
+        self.memory = MemoryTracker(
+            budget_bytes=budget_mb * 1024 * 1024,
+            max_documents=VECTOR_STORE_MAX_DOCUMENTS
+        )
+        self.offload_store: Optional[OffloadStore] = None
+        # Documents dropped under the 'evict' policy, so they are not embedded again on the next load
+        self.evicted_ids: Set[str] = set()
+        self.metadata_index = MetadataIndex()
+        self.vectors = ResidentVectors(self.dimension)
+        # Near-duplicate index over every stored document, built on first use and kept up to date
+        self._near_duplicates: Optional[NearDuplicateIndex] = None
+        self._near_duplicates_lock = threading.Lock()
+        self.near_duplicates_dropped = 0
+        self.persist_directory = persist_directory or VECTOR_STORE_PATH
+        if self.persist_directory:
+            self.client = chromadb.PersistentClient(path=self.persist_directory)
+        else:
+            self.client = chromadb.Client()
+        # In-memory collections share one process-wide client, so each store gets its own
+        # collection and a rebuilt store can coexist with the one it replaces
+        self.index_name = (collection_name if self.persist_directory
+                           else f'{collection_name}-{uuid.uuid4().hex[:8]}')
         self.documents_path = documents_path or self._get_default_documents_path()
         self.collection = self._initialize_collection()
 
@@ -21,43 +221,178 @@ class VectorStore:
         current_dir = Path(__file__).parent.parent
         return str(current_dir / 'documents' / 'documents.json')
 
-    def _load_documents(self) -> List[str]:
+    def _load_documents(self) -> List[Any]:
         """Load documents from JSON file"""
         try:
             with open(self.documents_path, 'r') as f:
                 data = json.load(f)
                 return data.get('documents', [])
         except FileNotFoundError:
+            if self.allow_empty:
+                return []
             raise Exception(f"Documents file not found at {self.documents_path}")
         except json.JSONDecodeError:
             raise Exception(f"Invalid JSON format in documents file at {self.documents_path}")
 
+    def _open_offload_store(self) -> OffloadStore:
+        """Open the on-disk tier cold documents are offloaded to"""
+        path = offload_path(self.persist_directory, self.index_name)
+        if path is None:
+            path = tempfile.mkdtemp(prefix=f'qbot-offload-{self.collection_name}-')
+        store = OffloadStore(path, self.dimension)
+        if not self.persist_directory:
+            # The in-memory index is rebuilt from scratch, so is its cold tier
+            store.clear()
+        return store
+
+    def _record_evicted(self, ids: List[str]) -> None:
+        self.evicted_ids.update(ids)
+        if self.persist_directory:
+            with open(evicted_ids_path(self.persist_directory, self.collection_name), 'a') as f:
+                f.writelines(f'{doc_id}\n' for doc_id in ids)
+
+    def _track_existing(self) -> None:
+        """Account for and index the metadata of documents already in a persistent collection"""
+        for page in iter_collection(self.collection, ['embeddings', 'documents', 'metadatas']):
+            self.vectors.add(page['ids'], page['embeddings'])
+            for doc_id, document, metadata in zip(page['ids'], page['documents'], page['metadatas']):
+                metadata = decode_metadata(metadata)
+                self.memory.add(doc_id, document or '', self.dimension, metadata)
+                self.metadata_index.add(doc_id, metadata)
+        for doc_id, _, metadata in self.offload_store.iter_entries():
+            metadata = decode_metadata(metadata)
+            self.memory.add_retained(metadata)
+            self.metadata_index.add(doc_id, metadata)
+
+    def _enforce_memory_budget(self) -> None:
+        """Move the least recently retrieved documents out of the resident index while over budget"""
+        if not self.memory.over_budget():
+            return
+        offload = VECTOR_STORE_EVICTION_POLICY == 'offload'
+        victims = self.memory.coldest(retain=offload)
+        if offload:
+            ids, vectors = self.vectors.take(victims)
+            data = self.collection.get(ids=ids, include=['documents', 'metadatas'])
+            position = {doc_id: i for i, doc_id in enumerate(data['ids'])}
+            self.offload_store.add(ids, vectors, [data['documents'][position[doc_id]] for doc_id in ids],
+                                   [data['metadatas'][position[doc_id]] for doc_id in ids])
+        else:
+            self.metadata_index.remove(victims)
+            self._record_evicted(victims)
+            if self._near_duplicates is not None:
+                for doc_id in victims:
+                    self._near_duplicates.remove(doc_id)
+        self.collection.delete(ids=victims)
+        self.vectors.remove(victims)
+        self.memory.remove(victims, self.dimension, retain=offload)
+        self.memory.evicted += len(victims)
+        logging.info(f"Memory budget exceeded: {VECTOR_STORE_EVICTION_POLICY} {len(victims)} cold documents")
+
+    def _add_to_index(self, ids: List[str], embeddings: Any, documents: List[str],
+                      metadatas: List[Dict[str, Any]], validate: bool = True) -> None:
+        """Validate, add and account for a batch of embedded documents (embeddings as lists or a matrix)"""
+        if validate:
+            validate_embeddings(embeddings, self.dimension)
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        self.collection.add(ids=ids, embeddings=vectors.tolist(), documents=documents, metadatas=metadatas)
+        self.vectors.add(ids, vectors)
+        for doc_id, document, metadata in zip(ids, documents, metadatas):
+            metadata = decode_metadata(metadata)
+            self.memory.add(doc_id, document, self.dimension, metadata)
+            self.metadata_index.add(doc_id, metadata)
+            if self._near_duplicates is not None and doc_id not in self._near_duplicates:
+                self._near_duplicates.add(doc_id, document)
+        self._enforce_memory_budget()
+
+    @staticmethod
+    def _changed_metadata(ids: List[str], stored: List[Optional[Dict[str, Any]]],
+                          metadata_by_id: Dict[str, Dict[str, Any]]) -> tuple:
+        """(ids, new stored metadatas) of the documents whose user metadata differs from metadata_by_id"""
+        changed_ids, changed_metadatas = [], []
+        for doc_id, current in zip(ids, stored):
+            metadata = metadata_by_id.get(doc_id) or {}
+            if metadata and decode_metadata(current) != metadata:
+                changed_ids.append(doc_id)
+                changed_metadatas.append(encode_metadata(
+                    {k: v for k, v in (current or {}).items() if k != METADATA_FIELD}, metadata
+                ))
+        return changed_ids, changed_metadatas
+
+    def _refresh_metadata(self, stored: dict, metadata_by_id: Dict[str, Dict[str, Any]]) -> None:
+        """
+        Update indexed documents whose metadata changed in the documents file (e.g. merged near-duplicates),
+        whether they are resident (stored is their collection.get() result) or offloaded
+        """
+        changed_ids, changed_metadatas = self._changed_metadata(stored['ids'], stored['metadatas'], metadata_by_id)
+        if changed_ids:
+            self.collection.update(ids=changed_ids, metadatas=changed_metadatas)
+
+        offloaded = [doc_id for doc_id, metadata in metadata_by_id.items()
+                     if metadata and doc_id in self.offload_store]
+        offloaded_ids, offloaded_metadatas = self._changed_metadata(
+            offloaded, [self.offload_store.metadata(doc_id) for doc_id in offloaded], metadata_by_id
+        )
+        if offloaded_ids:
+            self.offload_store.update_metadata(offloaded_ids, offloaded_metadatas)
+
+        for doc_id, metadata in zip(changed_ids + offloaded_ids, changed_metadatas + offloaded_metadatas):
+            self.metadata_index.add(doc_id, decode_metadata(metadata))
+
+    def near_duplicate_index(self) -> Optional[NearDuplicateIndex]:
+        """
+        The near-duplicate index over resident and offloaded documents, built on first use; None when
+        near-duplicate detection is off. The tenant's DocumentManager checks uploads against it too.
+        """
+        if not DEDUP_THRESHOLD:
+            return None
+        with self._near_duplicates_lock:
+            if self._near_duplicates is None:
+                index = NearDuplicateIndex(DEDUP_THRESHOLD)
+                for page in iter_collection(self.collection, ['documents']):
+                    for doc_id, document in zip(page['ids'], page['documents']):
+                        index.add(doc_id, document or '')
+                for doc_id, document, _ in self.offload_store.iter_entries():
+                    index.add(doc_id, document)
+                self._near_duplicates = index
+            return self._near_duplicates
+
+    def _drop_near_duplicates(self, pending: List[tuple]) -> List[tuple]:
+        """Skip pending documents that near-duplicate an indexed one (or each other) before embedding them"""
+        if not DEDUP_THRESHOLD or not pending:
+            return pending
+        near_duplicates = self.near_duplicate_index()
+        kept = [entry for entry in pending if near_duplicates.check_and_add(entry[1], entry[2]) is None]
+        dropped = len(pending) - len(kept)
+        if dropped:
+            logging.info(f"Skipped {dropped} near-duplicate documents")
+        self.near_duplicates_dropped += dropped
+        return kept
+
     def _initialize_collection(self):
         """Initialize and populate the vector database"""
         try:
             documents = self._load_documents()
-            if not documents:
-                raise Exception("No documents found in the documents file")
 
-            try:
-                self.client.delete_collection(name="docs")
-            except:
-                pass
-
-            collection = self.client.create_collection(name="docs")
+            # A persistent collection keeps what is already indexed (e.g. by `qbot ingest`)
+            # and only documents.json entries that are missing from it are embedded
+            collection = open_collection(self.client, self.index_name, self.dimension,
+                                         model=self.embedder.model, backend=self.embedder.backend)
+            self.collection = collection
+            self.offload_store = self._open_offload_store()
+            if self.persist_directory:
+                self.evicted_ids = load_evicted_ids(self.persist_directory, self.collection_name)
+            self._track_existing()
+            self._enforce_memory_budget()
+
+            if self.snapshot_path and collection.count() == 0 and not len(self.offload_store):
+                self.snapshot_loaded = self._load_snapshot(self.snapshot_path)
+
+            empty = collection.count() == 0 and not len(self.offload_store)
+            if not documents and empty and not self.allow_empty:
+                raise Exception("No documents found in the documents file")
 
             logging.info(f"Initializing vector database with {len(documents)} documents...")
-            for i, doc in enumerate(documents):
-                response = ollama.embeddings(model="mxbai-embed-large", prompt=doc)
-                embedding = response["embedding"]
-                collection.add(
-                    ids=[str(i)],
-                    embeddings=[embedding],
-                    documents=[doc],
-                    metadatas=[{'timestamp': datetime.now().isoformat(), 'source_index': i}]
-                )
-                logging.info(f"Processed document {i + 1}/{len(documents)}")
-
+            self.index_documents(documents)
             logging.info("Vector database initialization complete!")
             return collection
 
@@ -65,21 +400,218 @@ class VectorStore:
             logging.error(f"Error initializing vector database: {str(e)}")
             raise
 
-    def retrieve_chunks(self, query_embedding: list, n_results: int = 3) -> dict:
-        """Retrieve relevant chunks from the vector database"""
-        return self.collection.query(
-            query_embeddings=[query_embedding],
-            n_results=n_results
+    def _load_snapshot(self, path: str) -> int:
+        """
+        Bootstrap an empty store from a snapshot instead of re-embedding; returns documents loaded.
+        The memory-mapped vectors are inserted in large batches without per-vector validation (the
+        header already pins the dimension), and the memory budget applies as they go in.
+        """
+        if not os.path.exists(path):
+            logging.info(f"No snapshot at {path}, building the index from documents")
+            return 0
+        snapshot = Snapshot(path, verify=SNAPSHOT_VERIFY)
+        if snapshot.model != self.embedder.model or snapshot.dimension != self.dimension:
+            logging.warning(
+                f"Ignoring snapshot {path}: built with {snapshot.model} ({snapshot.dimension} dimensions), "
+                f"but the embedding model is {self.embedder.model} ({self.dimension} dimensions)"
+            )
+            return 0
+        batch_size = min(SNAPSHOT_LOAD_BATCH_SIZE, getattr(self.client, 'max_batch_size', SNAPSHOT_LOAD_BATCH_SIZE))
+        for ids, vectors, documents, metadatas in snapshot.iter_batches(batch_size):
+            self._add_to_index(ids, vectors, documents, metadatas, validate=False)
+        logging.info(f"Loaded {snapshot.count} documents from snapshot {path} "
+                     f"(taken {snapshot.header['created_at']})")
+        return snapshot.count
+
+    def export_snapshot(self, path: str) -> Dict[str, Any]:
+        """Write the resident and offloaded index to a snapshot file; returns its header"""
+        return write_snapshot(
+            path,
+            snapshot_batches(self.collection, self.offload_store),
+            model=self.embedder.model,
+            dimension=self.dimension,
+            collection_name=self.collection_name,
+            backend=self.embedder.backend
         )
 
-    def filter_relevant_chunks(self, chunks: dict, threshold: float = 0.7) -> list:
-        """Filter chunks based on similarity score"""
+    def index_documents(self, documents: List[Any], positions: Optional[List[int]] = None) -> int:
+        """
+        Embed and index documents missing from the collection, at batch priority, and refresh the
+        metadata of ones already indexed. positions are the documents' indexes in the documents file
+        (recorded as source_index), 0..n-1 by default. Returns how many documents were embedded.
+        """
+        entries = [normalize_document(entry) for entry in documents]
+        ids = [content_hash(text) for text, _ in entries]
+        existing = set()
+        if ids:
+            stored = self.collection.get(ids=ids, include=['metadatas'])
+            existing.update(stored['ids'])
+            self._refresh_metadata(stored, dict(zip(ids, (metadata for _, metadata in entries))))
+        existing.update(self.offload_store.ids)
+        existing.update(self.evicted_ids)
+
+        pending = []
+        if positions is None:
+            positions = list(range(len(entries)))
+        for i, doc_id, (text, metadata) in zip(positions, ids, entries):
+            if doc_id not in existing:
+                existing.add(doc_id)
+                pending.append((i, doc_id, text, metadata))
+        pending = self._drop_near_duplicates(pending)
+
+        indexed = 0
+        try:
+            with model_scheduler.priority(BATCH):
+                for start in range(0, len(pending), INGEST_BATCH_SIZE):
+                    batch = pending[start:start + INGEST_BATCH_SIZE]
+                    embeddings = self.embedder.embed([text for _, _, text, _ in batch])
+                    timestamp = datetime.now().isoformat()
+                    self._add_to_index(
+                        ids=[doc_id for _, doc_id, _, _ in batch],
+                        embeddings=embeddings,
+                        documents=[text for _, _, text, _ in batch],
+                        metadatas=[encode_metadata({'timestamp': timestamp, 'source_index': i}, metadata)
+                                   for i, _, _, metadata in batch]
+                    )
+                    indexed += len(batch)
+                    logging.info(f"Processed document {indexed}/{len(pending)}")
+        except Exception:
+            # Documents that never made it into the index must not block their own retry as near-duplicates
+            if self._near_duplicates is not None:
+                for _, doc_id, _, _ in pending[indexed:]:
+                    self._near_duplicates.remove(doc_id)
+            raise
+        return len(pending)
+
+    def retrieve_chunks(self, query_embedding: list, n_results: int = 3,
+                        where: Optional[Dict[str, Any]] = None) -> dict:
+        """
+        Retrieve relevant chunks from the vector database, including offloaded documents.
+        A metadata filter is resolved to candidate ids first, so only matching documents are searched.
+        """
+        return self.retrieve_chunks_batch([query_embedding], n_results=n_results, where=where)
+
+    def retrieve_chunks_batch(self, query_embeddings: List[list], n_results: int = 3,
+                              where: Optional[Dict[str, Any]] = None) -> dict:
+        """Retrieve chunks for several queries at once; results hold one list per query, as in Chroma"""
+        if not query_embeddings:
+            return {key: [] for key in QUERY_RESULT_KEYS}
+        candidates = self.metadata_index.resolve(where) if where else None
+        if candidates is None:
+            results = self.collection.query(
+                query_embeddings=query_embeddings,
+                n_results=n_results
+            )
+            results = {key: results[key] for key in QUERY_RESULT_KEYS}
+        else:
+            results = self._filtered_query(query_embeddings, n_results, candidates)
+        self.memory.touch(doc_id for ids in results['ids'] for doc_id in ids)
+
+        if len(self.offload_store):
+            # One scan of the offloaded vectors for the whole batch
+            cold = self.offload_store.query(query_embeddings, n_results, candidate_ids=candidates)
+            for i in range(len(query_embeddings)):
+                merged = sorted(
+                    zip(results['distances'][i] + cold['distances'][i],
+                        results['ids'][i] + cold['ids'][i],
+                        results['documents'][i] + cold['documents'][i],
+                        results['metadatas'][i] + cold['metadatas'][i]),
+                    key=lambda row: row[0]
+                )[:n_results]
+                for key, column in zip(('distances', 'ids', 'documents', 'metadatas'), zip(*merged)):
+                    results[key][i] = list(column)
+
+        return results
+
+    def _filtered_query(self, query_embeddings: List[list], n_results: int, candidates: Set[str]) -> dict:
+        """Nearest neighbours among the resident documents in candidates, for each query"""
+        results = {key: [[] for _ in query_embeddings] for key in QUERY_RESULT_KEYS}
+        resident = [doc_id for doc_id in candidates if doc_id in self.memory]
+        if not resident:
+            return results
+
+        exact = list(range(len(query_embeddings)))
+        if len(resident) > FILTER_EXACT_SEARCH_LIMIT:
+            # Broad filter: widen the ANN search by the filter's selectivity so
+            # enough matching neighbours come back without scoring every match
+            total = len(self.memory)
+            k = min(total, 2 * math.ceil(n_results * total / len(resident)))
+            wide = self.collection.query(query_embeddings=query_embeddings, n_results=k)
+            exact = []
+            for q, ids in enumerate(wide['ids']):
+                keep = [i for i, doc_id in enumerate(ids) if doc_id in candidates][:n_results]
+                if len(keep) < n_results:
+                    exact.append(q)
+                    continue
+                for key in QUERY_RESULT_KEYS:
+                    results[key][q] = [wide[key][q][i] for i in keep]
+            if not exact:
+                return results
+
+        # Selective filter (or too few matches in the widened search): score the matching documents
+        # exactly against their resident vectors, then fetch documents and metadata for the hits only
+        ids, vectors = self.vectors.take(resident)
+        if not ids:
+            return results
+        queries = np.asarray([query_embeddings[q] for q in exact], dtype=np.float32)
+        # Squared L2 for every (query, document) pair as one matrix product
+        distances = ((queries ** 2).sum(axis=1)[:, None] - 2 * queries @ vectors.T + (vectors ** 2).sum(axis=1))
+        np.maximum(distances, 0, out=distances)
+        k = min(n_results, len(ids))
+        top = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        hits = {ids[i] for i in top.ravel()}
+        data = self.collection.get(ids=list(hits), include=['documents', 'metadatas'])
+        found = {doc_id: (document, metadata)
+                 for doc_id, document, metadata in zip(data['ids'], data['documents'], data['metadatas'])}
+        for row, q in enumerate(exact):
+            order = [i for i in top[row][np.argsort(distances[row, top[row]])] if ids[i] in found]
+            results['ids'][q] = [ids[i] for i in order]
+            results['documents'][q] = [found[ids[i]][0] for i in order]
+            results['metadatas'][q] = [found[ids[i]][1] for i in order]
+            results['distances'][q] = [float(distances[row, i]) for i in order]
+        return results
+
+    def close(self) -> None:
+        """Release the resident index; persistent collections stay on disk for the next load"""
+        if not self.persist_directory:
+            try:
+                self.client.delete_collection(name=self.index_name)
+            except Exception:
+                pass
+            if self.offload_store is not None:
+                self.offload_store.clear()
+                shutil.rmtree(self.offload_store.path, ignore_errors=True)
+        self.memory.clear()
+        self.metadata_index.clear()
+        self.vectors.clear()
+        self._near_duplicates = None
+        self.evicted_ids = set()
+
+    def purge(self) -> None:
+        """Delete everything indexed for this collection, including what a persistent index keeps on disk"""
+        if self.persist_directory:
+            purge_persisted(self.persist_directory, self.collection_name)
+        self.close()
+
+    def memory_stats(self) -> Dict[str, Any]:
+        """Memory footprint of the resident index and size of the offloaded tier"""
+        return {
+            **self.memory.stats(),
+            'embedding_dimension': self.dimension,
+            'eviction_policy': VECTOR_STORE_EVICTION_POLICY,
+            'offloaded_documents': len(self.offload_store),
+            'near_duplicates_dropped': self.near_duplicates_dropped,
+            'snapshot_documents_loaded': self.snapshot_loaded
+        }
+
+    def filter_relevant_chunks(self, chunks: dict, max_distance: float = RELEVANCE_MAX_DISTANCE) -> list:
+        """Filter chunks based on their distance to the question"""
         if not chunks['distances'][0]:  # Check if there are any results
             return []
 
         filtered_chunks = [
             doc for doc, dist in zip(chunks['documents'][0], chunks['distances'][0])
-            if dist > threshold
+            if not max_distance or dist <= max_distance
         ]
         return filtered_chunks
 
@@ -137,22 +669,24 @@ class VectorStore:
             logging.error(f"Error in response verification: {str(e)}")
             return response  # Return original response if verification fails
 
-    def add_document(self, document: str) -> bool:
-        """Add a new document to both the JSON file and vector database"""
+    def add_document(self, document: Any) -> bool:
+        """Add a new document (text, or {"text", "metadata"}) to both the JSON file and vector database"""
         try:
+            text, metadata = normalize_document(document)
             documents = self._load_documents()
             documents.append(document)
 
             with open(self.documents_path, 'w') as f:
                 json.dump({'documents': documents}, f, indent=4)
 
-            response = ollama.embeddings(model="mxbai-embed-large", prompt=document)
-            embedding = response["embedding"]
-            self.collection.add(
-                ids=[str(len(documents) - 1)],
+            embedding = self.embedder.embed_one(text)
+            self._add_to_index(
+                ids=[content_hash(text)],
                 embeddings=[embedding],
-                documents=[document],
-                metadatas=[{'timestamp': datetime.now().isoformat(), 'source_index': len(documents) - 1}]
+                documents=[text],
+                metadatas=[encode_metadata(
+                    {'timestamp': datetime.now().isoformat(), 'source_index': len(documents) - 1}, metadata
+                )]
             )
 
             return True
@@ -160,133 +694,226 @@ class VectorStore:
             logging.error(f"Error adding document: {str(e)}")
             return False
 
-    def generate_response(self, prompt: str) -> str:
-        """Generate response for user input with improved context handling"""
-        try:
-            # Generate embedding for the prompt
-            response = ollama.embeddings(
-                prompt=prompt,
-                model="mxbai-embed-large"
-            )
+    def _answer_from_results(self, prompt: str, results: dict) -> str:
+        """Generate and verify an answer from one query's retrieval results"""
+        filtered_chunks = self.filter_relevant_chunks(results)
 
-            # Retrieve and filter chunks
-            results = self.retrieve_chunks(response["embedding"])
-            filtered_chunks = self.filter_relevant_chunks(results)
+        if not filtered_chunks:
+            return "I couldn't find relevant information to answer your question."
 
-            if not filtered_chunks:
-                return "I couldn't find relevant information to answer your question."
+        # Combine filtered chunks into context
+        context = " ".join(filtered_chunks)
 
-            # Combine filtered chunks into context
-            context = " ".join(filtered_chunks)
+        # Format prompt with context
+        formatted_prompt = self.format_prompt(prompt, context)
 
-            # Format prompt with context
-            formatted_prompt = self.format_prompt(prompt, context)
+        # Generate response
+        output = self.generator.generate(formatted_prompt)
 
-            # Generate response
-            output = ollama.generate(
-                model="llama3.2",
-                prompt=formatted_prompt
-            )
+        # Verify response
+        return self.verify_response(output, context)
 
-            # Verify response
-            verified_response = self.verify_response(output['response'], context)
+    def generate_response(self, prompt: str, where: Optional[Dict[str, Any]] = None) -> str:
+        """Generate response for user input with improved context handling"""
+        try:
+            # Generate embedding for the prompt
+            query_embedding = self.embedder.embed_one(prompt)
 
-            return verified_response
+            # Retrieve chunks and answer from them
+            results = self.retrieve_chunks(query_embedding, where=where)
+            return self._answer_from_results(prompt, results)
 
+        except OverloadedError:
+            # Shed requests surface as 503s rather than as an apology answer
+            raise
         except Exception as e:
             logging.error(f"Error generating response: {str(e)}")
             return "I encountered an error while processing your request."
 
-    def generate_structured_response(self, prompt: str) -> dict:
-        """Generate structured JSON response for user input with improved context handling"""
+    def _answer_batch_item(self, index: int, prompt: str, results: dict, shared: Dict[str, float],
+                           queued_at: float) -> Dict[str, Any]:
+        start = time.perf_counter()
+        item = {"index": index, "prompt": prompt}
         try:
-            # Generate embedding for the prompt
-            response = ollama.embeddings(
-                prompt=prompt,
-                model="mxbai-embed-large"
-            )
-
-            # Retrieve and filter chunks
-            results = self.retrieve_chunks(response["embedding"], n_results=3)
-            filtered_chunks = self.filter_relevant_chunks(results)
-
-            if not filtered_chunks:
-                return {
-                    "answer": "I couldn't find relevant information to answer your question.",
-                    "source": "none",
-                    "confidence": 0.0
+            # Executor threads do not inherit the caller's priority
+            with model_scheduler.priority(BATCH):
+                item["response"] = self._answer_from_results(prompt, results)
+        except Exception as e:
+            logging.error(f"Error answering batch prompt {index}: {str(e)}")
+            item["error"] = str(e)
+        item["timings"] = {
+            **shared,
+            "queue_ms": round((start - queued_at) * 1000, 1),
+            "generate_ms": round((time.perf_counter() - start) * 1000, 1)
+        }
+        return item
+
+    def answer_batch(self, prompts: List[str], where: Optional[Dict[str, Any]] = None,
+                     workers: int = ASK_BATCH_WORKERS, batch_size: int = ASK_BATCH_SIZE) -> Iterator[Dict[str, Any]]:
+        """
+        Answer many prompts as batch-priority work, yielding {"index", "prompt", "response" | "error", "timings"}
+        per prompt in completion order. Prompts are embedded and retrieved batch_size at a time (their
+        embed_ms/retrieve_ms are that batch's time split evenly), and up to `workers` generations run at once.
+        """
+        workers = max(1, workers)
+        batch_size = max(1, batch_size)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ask-batch') as executor:
+            in_flight = set()
+            for offset in range(0, len(prompts), batch_size):
+                chunk = prompts[offset:offset + batch_size]
+                start = time.perf_counter()
+                with model_scheduler.priority(BATCH):
+                    embeddings = self.embedder.embed(chunk)
+                embedded = time.perf_counter()
+                results = self.retrieve_chunks_batch(embeddings, where=where)
+                retrieved = time.perf_counter()
+                shared = {
+                    "embed_ms": round((embedded - start) * 1000 / len(chunk), 2),
+                    "retrieve_ms": round((retrieved - embedded) * 1000 / len(chunk), 2)
                 }
 
-            # Combine filtered chunks into context
-            context = " ".join(filtered_chunks)
-
-            # Create an enhanced formatted prompt for structured output
-            formatted_prompt = f"""
-            Based ONLY on the provided context, generate a response in valid JSON format following this exact structure:
-            {{
-                "answer": "<your detailed answer, stating 'Information not found in context' if you can't answer>",
-                "source": "<relevant parts of the context used>",
-                "confidence": <float between 0 and 1, based on how well the context matches the question>
-            }}
+                for i, prompt in enumerate(chunk):
+                    # Keep a bounded queue so completed answers stream out while later batches are prepared
+                    while len(in_flight) >= 2 * workers:
+                        done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            yield future.result()
+                    item_results = {key: [results[key][i]] for key in QUERY_RESULT_KEYS}
+                    in_flight.add(executor.submit(
+                        self._answer_batch_item, offset + i, prompt, item_results, shared, time.perf_counter()
+                    ))
+
+            for future in as_completed(in_flight):
+                yield future.result()
+
+    def format_structured_prompt(self, query: str, context: str) -> str:
+        """Format the prompt for a JSON answer matching STRUCTURED_RESPONSE_SCHEMA"""
+        return f"""
+            Based ONLY on the provided context, answer the question with a single JSON object
+            matching this JSON schema, with the keys in this order:
+            {json.dumps(STRUCTURED_RESPONSE_SCHEMA)}
+
+            "answer" is your detailed answer, stating 'Information not found in context' if you can't answer.
+            "source" quotes the relevant parts of the context used.
+            "confidence" is how well the context matches the question, between 0 and 1.
 
             Context: {context}
-            Question: {prompt}
+            Question: {query}
 
             Guidelines:
             1. Only use information from the provided context
             2. Set confidence to 0.0 if answer cannot be found in context
             3. Include specific quotes or references from the context
-            4. Return ONLY valid JSON, no additional text
-
-            Remember to ONLY return valid JSON.
+            4. Return ONLY the JSON object, no additional text
             """
 
-            # Generate response using retrieved data
-            output = ollama.generate(
-                model="llama3.2",
-                prompt=formatted_prompt
-            )
-
-            try:
-                # Parse and verify the response
-                json_response = json.loads(output['response'])
-
-                # Verify response against context
-                verified_response = self.verify_response(json_response["answer"], context)
-
-                if verified_response != json_response["answer"]:
-                    return {
-                        "answer": verified_response,
-                        "source": json_response.get("source", "Unable to verify source"),
-                        "confidence": 0.3  # Lower confidence for unverified responses
-                    }
-
-                # Ensure all required fields are present with improved validation
-                return {
-                    "answer": json_response.get("answer", ""),
-                    "source": json_response.get("source", ""),
-                    "confidence": min(max(float(json_response.get("confidence", 0.0)), 0.0), 1.0),
-                    "metadata": {
-                        "timestamp": datetime.now().isoformat(),
-                        "num_chunks_retrieved": len(filtered_chunks),
-                        "context_length": len(context)
-                    }
-                }
-
-            except json.JSONDecodeError:
-                logging.error("Failed to parse JSON response from LLM")
-                # Enhanced fallback response
-                return {
-                    "answer": "I encountered an error processing the response. Here's the raw output: " +
-                              output['response'][:200] + "...",  # Truncate long responses
-                    "source": "error_handler",
-                    "confidence": 0.0,
-                    "metadata": {
-                        "error_type": "json_decode_error",
-                        "timestamp": datetime.now().isoformat()
-                    }
+    def stream_structured_response(self, prompt: str,
+                                   where: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Yield {"answer_delta": ...} events as the answer field is generated, then {"result": {...}}.
+        Generation runs in JSON mode and is stopped as soon as the JSON object is complete.
+        """
+        # Generate embedding for the prompt
+        query_embedding = self.embedder.embed_one(prompt)
+
+        # Retrieve and filter chunks
+        results = self.retrieve_chunks(query_embedding, n_results=3, where=where)
+        filtered_chunks = self.filter_relevant_chunks(results)
+
+        if not filtered_chunks:
+            yield {"result": {
+                "answer": "I couldn't find relevant information to answer your question.",
+                "source": "none",
+                "confidence": 0.0
+            }}
+            return
+
+        # Combine filtered chunks into context
+        context = " ".join(filtered_chunks)
+
+        parser = IncrementalJSONParser(stream_field='answer')
+        chunks = 0
+        with closing(self.generator.stream(
+                self.format_structured_prompt(prompt, context),
+                format='json',
+                num_predict=STRUCTURED_NUM_PREDICT,
+                stop=STRUCTURED_STOP
+        )) as output:
+            for chunk in output:
+                chunks += 1
+                delta = parser.feed(chunk)
+                if delta:
+                    yield {"answer_delta": delta}
+                if parser.complete:
+                    break
+
+        generation = {"output_chunks": chunks, "stopped_at_object_end": parser.complete}
+        try:
+            json_response = parser.result()
+        except json.JSONDecodeError:
+            logging.error(f"Incomplete JSON response from LLM after {chunks} chunks")
+            yield {"result": self._incomplete_structured_response(parser.field_value, context, generation)}
+            return
+
+        # Verify response against context
+        answer = str(json_response.get("answer", ""))
+        verified_response = self.verify_response(answer, context)
+
+        if verified_response != answer:
+            yield {"result": {
+                "answer": verified_response,
+                "source": json_response.get("source", "Unable to verify source"),
+                "confidence": 0.3  # Lower confidence for unverified responses
+            }}
+            return
+
+        # Ensure all required fields are present with improved validation
+        yield {"result": {
+            "answer": answer,
+            "source": json_response.get("source", ""),
+            "confidence": min(max(float(json_response.get("confidence", 0.0)), 0.0), 1.0),
+            "metadata": {
+                "timestamp": datetime.now().isoformat(),
+                "num_chunks_retrieved": len(filtered_chunks),
+                "context_length": len(context),
+                **generation
+            }
+        }}
+
+    def _incomplete_structured_response(self, answer: str, context: str, generation: Dict[str, Any]) -> dict:
+        """Salvage whatever answer text streamed before generation hit its token cap"""
+        if answer.strip():
+            return {
+                "answer": self.verify_response(answer, context),
+                "source": "",
+                "confidence": 0.0,
+                "metadata": {
+                    "error_type": "incomplete_json",
+                    "timestamp": datetime.now().isoformat(),
+                    **generation
                 }
+            }
+        return {
+            "answer": "I couldn't produce a complete answer. Please try again.",
+            "source": "error_handler",
+            "confidence": 0.0,
+            "metadata": {
+                "error_type": "json_decode_error",
+                "timestamp": datetime.now().isoformat(),
+                **generation
+            }
+        }
+
+    def generate_structured_response(self, prompt: str, where: Optional[Dict[str, Any]] = None) -> dict:
+        """Generate structured JSON response for user input with improved context handling"""
+        try:
+            result = {}
+            for event in self.stream_structured_response(prompt, where=where):
+                result = event.get("result", result)
+            return result
 
+        except OverloadedError:
+            raise
         except Exception as e:
             logging.error(f"Error in generate_structured_response: {str(e)}")
             return {
@@ -298,4 +925,4 @@ class VectorStore:
                     "error_message": str(e),
                     "timestamp": datetime.now().isoformat()
                 }
-            }
\ No newline at end of file
+            }
@@ -1,4 +1,4 @@
 """QBot utilities module"""
-from .helpers import format_response, validate_prompt, sanitize_input
+from .helpers import format_response, validate_prompt, sanitize_input, content_hash, normalize_document
 
-__all__ = ['format_response', 'validate_prompt', 'sanitize_input']
\ No newline at end of file
+__all__ = ['format_response', 'validate_prompt', 'sanitize_input', 'content_hash', 'normalize_document']
\ No newline at end of file
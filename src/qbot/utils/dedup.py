@@ -0,0 +1,138 @@
+"""
+Near-duplicate detection with MinHash and locality-sensitive hashing.
+
+Each document is reduced to a MinHash signature over its word shingles; the
+fraction of matching signature slots estimates the Jaccard similarity of two
+documents. Signatures are split into bands and bucketed, so a lookup only
+compares against documents that collide in at least one band instead of the
+whole corpus.
+"""
+
+import hashlib
+import re
+import threading
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from qbot.config import DEDUP_NUM_PERM, DEDUP_SHINGLE_SIZE, DEDUP_THRESHOLD
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+_TOKEN_PATTERN = re.compile(r'\w+')
+
+
+def shingles(text: str, size: int = DEDUP_SHINGLE_SIZE) -> Set[str]:
+    """Word n-grams of normalized text; short texts become a single shingle"""
+    tokens = _TOKEN_PATTERN.findall(text.lower())
+    if len(tokens) <= size:
+        return {' '.join(tokens)}
+    return {' '.join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)}
+
+
+def optimal_bands(threshold: float, num_perm: int) -> Tuple[int, int]:
+    """(bands, rows) whose LSH S-curve threshold (1/b)^(1/r) is closest to the target"""
+    best = (num_perm, 1)
+    best_error = float('inf')
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        error = abs((1.0 / bands) ** (1.0 / rows) - threshold)
+        if error < best_error:
+            best, best_error = (bands, rows), error
+    return best
+
+
+class MinHasher:
+    """Computes MinHash signatures with a fixed family of universal hash functions"""
+
+    def __init__(self, num_perm: int = DEDUP_NUM_PERM, seed: int = 1):
+        generator = np.random.RandomState(seed)
+        self.num_perm = num_perm
+        self._a = generator.randint(1, (1 << 32) - 1, size=num_perm, dtype=np.uint64)
+        self._b = generator.randint(0, (1 << 32) - 1, size=num_perm, dtype=np.uint64)
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = np.array(
+            [int.from_bytes(hashlib.blake2b(s.encode('utf-8'), digest_size=4).digest(), 'little')
+             for s in shingles(text)],
+            dtype=np.uint64
+        )
+        # One row per shingle, one column per permutation; uint64 wraparound is intended
+        permuted = ((np.outer(hashes, self._a) + self._b) % _MERSENNE_PRIME) & _MAX_HASH
+        # Values are masked to 32 bits, so the stored signature only needs half the space
+        return permuted.min(axis=0).astype(np.uint32)
+
+
+class NearDuplicateIndex:
+    """LSH index answering "is this text a near-duplicate of one already seen?" """
+
+    def __init__(self, threshold: float = DEDUP_THRESHOLD, num_perm: int = DEDUP_NUM_PERM):
+        if not 0 < threshold <= 1:
+            raise ValueError("Near-duplicate threshold must be in (0, 1]")
+        self.threshold = threshold
+        self.hasher = MinHasher(num_perm)
+        self.bands, self.rows = optimal_bands(threshold, num_perm)
+        self._buckets: List[Dict[bytes, Set[str]]] = [defaultdict(set) for _ in range(self.bands)]
+        self._signatures: Dict[str, np.ndarray] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._signatures
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def _find(self, signature: np.ndarray) -> Optional[Tuple[str, float]]:
+        candidates: Set[str] = set()
+        for band, key in enumerate(self._band_keys(signature)):
+            candidates.update(self._buckets[band].get(key, ()))
+        best = None
+        for doc_id in candidates:
+            similarity = float(np.mean(self._signatures[doc_id] == signature))
+            if similarity >= self.threshold and (best is None or similarity > best[1]):
+                best = (doc_id, similarity)
+        return best
+
+    def add(self, doc_id: str, text: str) -> None:
+        signature = self.hasher.signature(text)
+        with self._lock:
+            self._insert(doc_id, signature)
+
+    def _insert(self, doc_id: str, signature: np.ndarray) -> None:
+        self._signatures[doc_id] = signature
+        for band, key in enumerate(self._band_keys(signature)):
+            self._buckets[band][key].add(doc_id)
+
+    def find(self, text: str) -> Optional[Tuple[str, float]]:
+        """(id, estimated similarity) of the closest indexed near-duplicate, if any"""
+        signature = self.hasher.signature(text)
+        with self._lock:
+            return self._find(signature)
+
+    def check_and_add(self, doc_id: str, text: str) -> Optional[Tuple[str, float]]:
+        """
+        Return the near-duplicate this text matches, or index it as new and return None.
+        A document already indexed under doc_id is not a duplicate of anything else.
+        """
+        if doc_id in self._signatures:
+            return None
+        signature = self.hasher.signature(text)
+        with self._lock:
+            match = self._find(signature)
+            if match is None:
+                self._insert(doc_id, signature)
+            return match
+
+    def remove(self, doc_id: str) -> None:
+        with self._lock:
+            signature = self._signatures.pop(doc_id, None)
+            if signature is None:
+                return
+            for band, key in enumerate(self._band_keys(signature)):
+                self._buckets[band][key].discard(doc_id)
@@ -1,23 +1,53 @@
 import json
+import os
 from pathlib import Path
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
+
+from qbot.config import DEDUP_POLICY, DEDUP_THRESHOLD
+from qbot.utils.dedup import NearDuplicateIndex
+from qbot.utils.helpers import content_hash, normalize_document
+
+DEDUP_POLICIES = ('skip', 'merge')
+
+
+def merge_metadata(existing: Dict[str, Any], incoming: Dict[str, Any]) -> Dict[str, Any]:
+    """Fold a near-duplicate's metadata into the stored copy: lists are unioned, missing keys added"""
+    merged = dict(existing)
+    for key, value in incoming.items():
+        if key not in merged:
+            merged[key] = value
+        elif merged[key] != value:
+            current = merged[key] if isinstance(merged[key], list) else [merged[key]]
+            for item in (value if isinstance(value, list) else [value]):
+                if item not in current:
+                    current = current + [item]
+            merged[key] = current
+    return merged
 
 
 class DocumentManager:
-    def __init__(self, file_path: Optional[str] = None):
+    def __init__(self, file_path: Optional[str] = None, dedup_threshold: float = DEDUP_THRESHOLD,
+                 dedup_policy: str = DEDUP_POLICY):
         self.file_path = file_path or self._get_default_path()
+        if dedup_policy not in DEDUP_POLICIES:
+            raise ValueError(f"DEDUP_POLICY must be one of {DEDUP_POLICIES}")
+        self.dedup_threshold = dedup_threshold
+        self.dedup_policy = dedup_policy
+        self._near_duplicates: Optional[NearDuplicateIndex] = None
+        self._indexed_documents = 0
 
     def _get_default_path(self) -> str:
         """Get the default path for documents.json"""
         current_dir = Path(__file__).parent.parent
         return str(current_dir / 'documents' / 'documents.json')
 
-    def add_documents(self, documents: List[str]) -> bool:
+    def add_documents(self, documents: List[Any]) -> bool:
         """Add multiple documents to the JSON file"""
         try:
             existing_docs = self.get_documents()
             existing_docs.extend(documents)
 
+            os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
             with open(self.file_path, 'w') as f:
                 json.dump({'documents': existing_docs}, f, indent=4)
             return True
@@ -25,7 +55,94 @@ class DocumentManager:
             print(f"Error adding documents: {str(e)}")
             return False
 
-    def get_documents(self) -> List[str]:
+    def _near_duplicate_index(self, documents: List[Any]) -> NearDuplicateIndex:
+        """LSH index over the stored documents, keyed by id; rebuilt if the file changed underneath"""
+        if self._near_duplicates is None or self._indexed_documents != len(documents):
+            self._near_duplicates = NearDuplicateIndex(self.dedup_threshold)
+            for entry in documents:
+                text = normalize_document(entry)[0]
+                self._near_duplicates.add(content_hash(text), text)
+            self._indexed_documents = len(documents)
+        return self._near_duplicates
+
+    def add_unique_documents(self, documents: List[Any],
+                             near_duplicates: Optional[NearDuplicateIndex] = None) -> Optional[Dict[str, Any]]:
+        """
+        Add documents, dropping near-duplicates of stored documents (and of each other)
+        before they are ever embedded. Returns added/skipped/merged counts plus the 'changed'
+        entries (added, or stored copies whose metadata was merged) to index and their 'positions'
+        in the documents file, or None on failure.
+
+        near_duplicates is the tenant's vector store index (keyed by document id), so documents are
+        only shingled once; without it the manager keeps its own index over the documents file.
+        """
+        if not self.dedup_threshold:
+            start = len(self.get_documents())
+            if not self.add_documents(documents):
+                return None
+            return {'added': len(documents), 'skipped': 0, 'merged': 0, 'changed': list(documents),
+                    'positions': list(range(start, start + len(documents)))}
+        index = None
+        added_ids: List[str] = []
+        try:
+            existing_docs = self.get_documents()
+            index = near_duplicates if near_duplicates is not None else self._near_duplicate_index(existing_docs)
+            positions = {content_hash(normalize_document(entry)[0]): i for i, entry in enumerate(existing_docs)}
+            report = {'added': 0, 'skipped': 0, 'merged': 0, 'changed': [], 'positions': []}
+            # Where each position's entry sits in report['changed'], so it is reported only once
+            changed_at: Dict[int, int] = {}
+
+            for document in documents:
+                text, metadata = normalize_document(document)
+                doc_id = content_hash(text)
+                # Exact copies of a stored (or indexed) document match it outright
+                exact = doc_id in positions or doc_id in index
+                match = (doc_id, 1.0) if exact else index.check_and_add(doc_id, text)
+                if match is None:
+                    added_ids.append(doc_id)
+                    positions[doc_id] = len(existing_docs)
+                    changed_at[len(existing_docs)] = len(report['changed'])
+                    report['positions'].append(len(existing_docs))
+                    existing_docs.append(document)
+                    report['added'] += 1
+                    report['changed'].append(document)
+                    continue
+
+                # Documents indexed without being in the file (e.g. bulk-ingested) cannot be merged into
+                position = positions.get(match[0])
+                if self.dedup_policy == 'merge' and metadata and position is not None:
+                    kept_text, kept_metadata = normalize_document(existing_docs[position])
+                    existing_docs[position] = {
+                        'text': kept_text,
+                        'metadata': merge_metadata(kept_metadata, metadata)
+                    }
+                    report['merged'] += 1
+                    if position in changed_at:
+                        # Merged into a document added (or merged into) earlier in this same call
+                        report['changed'][changed_at[position]] = existing_docs[position]
+                    else:
+                        changed_at[position] = len(report['changed'])
+                        report['changed'].append(existing_docs[position])
+                        report['positions'].append(position)
+                else:
+                    report['skipped'] += 1
+
+            os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
+            with open(self.file_path, 'w') as f:
+                json.dump({'documents': existing_docs}, f, indent=4)
+            if index is self._near_duplicates:
+                self._indexed_documents = len(existing_docs)
+            return report
+        except Exception as e:
+            print(f"Error adding documents: {str(e)}")
+            # Documents that never reached the file must not block their own retry as near-duplicates
+            if index is not None:
+                for doc_id in added_ids:
+                    index.remove(doc_id)
+            self._near_duplicates = None
+            return None
+
+    def get_documents(self) -> List[Any]:
         """Get all documents from the JSON file"""
         try:
             with open(self.file_path, 'r') as f:
@@ -39,6 +156,7 @@ class DocumentManager:
         try:
             with open(self.file_path, 'w') as f:
                 json.dump({'documents': []}, f, indent=4)
+            self._near_duplicates = None
             return True
         except Exception as e:
             print(f"Error clearing documents: {str(e)}")
@@ -1,4 +1,5 @@
-from typing import Optional
+import hashlib
+from typing import Any, Dict, Optional, Tuple
 
 
 def format_response(response: str) -> str:
@@ -28,4 +29,21 @@ def sanitize_input(prompt: str) -> Optional[str]:
     if len(cleaned) > 1000:  # Maximum length
         cleaned = cleaned[:1000]
 
-    return cleaned
\ No newline at end of file
+    return cleaned
+
+
+def content_hash(document: str) -> str:
+    """Return a stable content hash for a document, used as its vector store id."""
+    return hashlib.sha256(document.strip().encode('utf-8')).hexdigest()
+
+
+def normalize_document(entry: Any) -> Tuple[str, Dict[str, Any]]:
+    """
+    Split a stored document into its text and metadata.
+    Documents are either plain strings or {"text": ..., "metadata": {...}} objects.
+    """
+    if isinstance(entry, str):
+        return entry, {}
+    if isinstance(entry, dict) and isinstance(entry.get('text'), str):
+        return entry['text'], entry.get('metadata') or {}
+    raise ValueError("Each document must be a string or an object with a 'text' field")
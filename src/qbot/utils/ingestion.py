@@ -0,0 +1,266 @@
+import json
+import logging
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import chromadb
+
+from qbot.config import DEDUP_THRESHOLD, INGEST_BATCH_SIZE, INGEST_WORKERS
+from qbot.models.backends import Embedder, get_embedder
+from qbot.models.metadata_index import encode_metadata, validate_metadata
+from qbot.models.memory import OffloadStore
+from qbot.models.vector_store import (
+    ingest_checkpoint_path,
+    iter_collection,
+    load_evicted_ids,
+    offload_path,
+    open_collection,
+    validate_embeddings
+)
+from qbot.utils.dedup import NearDuplicateIndex
+from qbot.utils.helpers import content_hash
+from qbot.utils.scheduler import BATCH, model_scheduler
+
+SUPPORTED_EXTENSIONS = ('.jsonl', '.txt')
+
+
+def iter_source_files(source: str) -> List[Path]:
+    """List ingestible files under a directory (or the file itself), in a stable order"""
+    path = Path(source)
+    if path.is_file():
+        return [path]
+    if not path.is_dir():
+        raise FileNotFoundError(f"Ingestion source not found at {source}")
+    return sorted(p for p in path.rglob('*') if p.is_file() and p.suffix in SUPPORTED_EXTENSIONS)
+
+
+def iter_records(path: Path) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Stream (text, metadata) documents from a file without loading it whole.
+
+    JSONL lines may be a plain string or an object with a "text" (or "document")
+    field and an optional "metadata" object. Text files are split into
+    documents on blank lines.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        if path.suffix == '.jsonl':
+            for line_number, line in enumerate(f, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    logging.warning(f"Skipping invalid JSON at {path}:{line_number}")
+                    continue
+                metadata = {}
+                if isinstance(record, dict):
+                    try:
+                        metadata = validate_metadata(record.get('metadata'))
+                    except ValueError as e:
+                        logging.warning(f"Skipping record with invalid metadata at {path}:{line_number}: {e}")
+                        continue
+                    record = record.get('text') or record.get('document')
+                if isinstance(record, str) and record.strip():
+                    yield record.strip(), metadata
+        else:
+            paragraph: List[str] = []
+            for line in f:
+                if line.strip():
+                    paragraph.append(line.strip())
+                elif paragraph:
+                    yield ' '.join(paragraph), {}
+                    paragraph = []
+            if paragraph:
+                yield ' '.join(paragraph), {}
+
+
+class IngestCheckpoint:
+    """Per-file progress of a bulk ingestion, persisted so killed jobs can resume"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.state: Dict[str, Any] = {'files': {}}
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                self.state = json.load(f)
+
+    def position(self, file_key: str) -> int:
+        """Number of records of the file already written to the index"""
+        return self.state['files'].get(file_key, {}).get('position', 0)
+
+    def is_complete(self, file_key: str) -> bool:
+        return self.state['files'].get(file_key, {}).get('complete', False)
+
+    def update(self, file_key: str, position: int, complete: bool = False) -> None:
+        self.state['files'][file_key] = {
+            'position': position,
+            'complete': complete,
+            'updated_at': datetime.now().isoformat()
+        }
+        self.save()
+
+    def save(self) -> None:
+        """Write the checkpoint atomically so a kill never leaves it half-written"""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.state, f, indent=4)
+        os.replace(tmp_path, self.path)
+
+
+class BulkIngester:
+    """Streams documents from disk into the persistent vector index in parallel batches"""
+
+    def __init__(
+            self,
+            index_path: str,
+            collection_name: str = 'docs',
+            embedder: Optional[Embedder] = None,
+            batch_size: int = INGEST_BATCH_SIZE,
+            workers: int = INGEST_WORKERS,
+            checkpoint_path: Optional[str] = None,
+            dedup_threshold: float = DEDUP_THRESHOLD
+    ):
+        os.makedirs(index_path, exist_ok=True)
+        self.client = chromadb.PersistentClient(path=index_path)
+        self.embedder = embedder or get_embedder()
+        self.collection = open_collection(self.client, collection_name, self.embedder.dimension,
+                                          model=self.embedder.model, backend=self.embedder.backend)
+        self.batch_size = max(1, batch_size)
+        self.workers = max(1, workers)
+        self.checkpoint = IngestCheckpoint(checkpoint_path or ingest_checkpoint_path(index_path, collection_name))
+        # Documents the server moved out of the collection (offloaded or evicted) are still indexed
+        offload_directory = offload_path(index_path, collection_name)
+        self.offload_store = (OffloadStore(offload_directory, self.embedder.dimension)
+                              if os.path.isdir(offload_directory) else None)
+        self._stored_elsewhere = load_evicted_ids(index_path, collection_name)
+        if self.offload_store is not None:
+            self._stored_elsewhere.update(self.offload_store.ids)
+        self._seen_hashes = set()
+        self.dedup_threshold = dedup_threshold
+        self._near_duplicates: Optional[NearDuplicateIndex] = None
+        self.stats = {
+            'files': 0, 'files_skipped': 0, 'read': 0, 'duplicates': 0, 'near_duplicates': 0, 'ingested': 0
+        }
+
+    def _embed_batch(self, documents: List[str]) -> List[List[float]]:
+        """Embed a batch with the configured embedder (the same one queries use), at batch priority"""
+        # Runs in an executor thread, which does not inherit the caller's context
+        with model_scheduler.priority(BATCH):
+            embeddings = self.embedder.embed(documents)
+        validate_embeddings(embeddings, self.embedder.dimension)
+        return embeddings
+
+    def _deduplicate(
+            self,
+            batch: List[Tuple[int, str, Dict[str, Any]]]
+    ) -> List[Tuple[int, str, Dict[str, Any], str]]:
+        """Drop exact and near-duplicates of documents seen in this run or already in the index"""
+        candidates = []
+        for index, document, metadata in batch:
+            doc_id = content_hash(document)
+            if doc_id in self._seen_hashes:
+                self.stats['duplicates'] += 1
+                continue
+            self._seen_hashes.add(doc_id)
+            candidates.append((index, document, metadata, doc_id))
+
+        if not candidates:
+            return []
+
+        existing = set(self.collection.get(ids=[c[3] for c in candidates])['ids'])
+        existing.update(c[3] for c in candidates if c[3] in self._stored_elsewhere)
+        self.stats['duplicates'] += len(existing)
+        candidates = [c for c in candidates if c[3] not in existing]
+
+        if self._near_duplicates is not None:
+            unique = [c for c in candidates if self._near_duplicates.check_and_add(c[3], c[1]) is None]
+            self.stats['near_duplicates'] += len(candidates) - len(unique)
+            candidates = unique
+        return candidates
+
+    def _write_batch(self, source: str, batch: List[Tuple[int, str, Dict[str, Any], str]],
+                     embeddings: List[List[float]]) -> None:
+        timestamp = datetime.now().isoformat()
+        self.collection.add(
+            ids=[doc_id for _, _, _, doc_id in batch],
+            embeddings=embeddings,
+            documents=[document for _, document, _, _ in batch],
+            # The source file goes into the user metadata, which is what filters are resolved against
+            metadatas=[encode_metadata({'timestamp': timestamp, 'source_index': index}, {'source': source, **metadata})
+                       for index, _, metadata, _ in batch]
+        )
+        self.stats['ingested'] += len(batch)
+
+    def _iter_batches(self, path: Path, start: int) -> Iterator[Tuple[int, List[Tuple[int, str, Dict[str, Any]]]]]:
+        """Yield (position after batch, batch) pairs, skipping records before start"""
+        batch: List[Tuple[int, str, Dict[str, Any]]] = []
+        position = 0
+        for position, (document, metadata) in enumerate(iter_records(path), start=1):
+            if position <= start:
+                continue
+            self.stats['read'] += 1
+            batch.append((position - 1, document, metadata))
+            if len(batch) >= self.batch_size:
+                yield position, batch
+                batch = []
+        if batch:
+            yield position, batch
+
+    def ingest_file(self, path: Path, executor: ThreadPoolExecutor) -> None:
+        """Ingest one file, keeping up to `workers` embedding batches in flight"""
+        file_key = str(path.resolve())
+        if self.checkpoint.is_complete(file_key):
+            logging.info(f"Skipping {path}, already ingested")
+            self.stats['files_skipped'] += 1
+            return
+
+        start = self.checkpoint.position(file_key)
+        if start:
+            logging.info(f"Resuming {path} from record {start}")
+
+        # Batches are written back in submission order so the checkpoint only
+        # ever advances past records that are actually in the index.
+        in_flight = deque()
+        for position, batch in self._iter_batches(path, start):
+            batch = self._deduplicate(batch)
+            future = executor.submit(self._embed_batch, [c[1] for c in batch]) if batch else None
+            in_flight.append((position, batch, future))
+            if len(in_flight) >= self.workers:
+                self._drain_one(file_key, path, in_flight)
+
+        while in_flight:
+            self._drain_one(file_key, path, in_flight)
+
+        self.checkpoint.update(file_key, self.checkpoint.position(file_key), complete=True)
+        self.stats['files'] += 1
+        logging.info(f"Finished {path}")
+
+    def _drain_one(self, file_key: str, path: Path, in_flight: deque) -> None:
+        position, batch, future = in_flight.popleft()
+        if future is not None:
+            self._write_batch(path.name, batch, future.result())
+        self.checkpoint.update(file_key, position)
+        logging.info(f"{path.name}: {position} records processed, {self.stats['ingested']} ingested")
+
+    def ingest(self, source: str) -> Dict[str, int]:
+        """Ingest every supported file under source and return run statistics"""
+        files = iter_source_files(source)
+        if self.dedup_threshold and self._near_duplicates is None:
+            # Prime with what is already indexed so near-copies from earlier runs are caught too
+            self._near_duplicates = NearDuplicateIndex(self.dedup_threshold)
+            for page in iter_collection(self.collection, ['documents']):
+                for doc_id, document in zip(page['ids'], page['documents']):
+                    self._near_duplicates.add(doc_id, document or '')
+            if self.offload_store is not None:
+                for doc_id, document, _ in self.offload_store.iter_entries():
+                    self._near_duplicates.add(doc_id, document)
+        logging.info(f"Ingesting {len(files)} files from {source} into the persistent index")
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for path in files:
+                self.ingest_file(path, executor)
+        return dict(self.stats)
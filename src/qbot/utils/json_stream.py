@@ -0,0 +1,113 @@
+"""
+Incremental parsing of a JSON object as it is generated.
+
+The model's output arrives a token at a time. IncrementalJSONParser follows the
+object's structure without re-parsing, decodes one top-level string field (the
+answer) as it streams so it can be shown immediately, and reports the moment the
+top-level object closes so generation can be stopped there.
+"""
+
+import json
+from typing import Any, Dict, Optional
+
+_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+
+class IncrementalJSONParser:
+    """Tracks a streamed JSON object and decodes one of its top-level string fields on the fly"""
+
+    def __init__(self, stream_field: str = 'answer'):
+        self.stream_field = stream_field
+        self.complete = False
+        self._chars = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._unicode: Optional[str] = None
+        self._high_surrogate: Optional[int] = None
+        self._expect_key = False
+        self._key: Optional[str] = None
+        self._key_chars = None
+        self._streaming = False
+        self.field_value = ''
+
+    @property
+    def text(self) -> str:
+        """The object's JSON text so far (anything before the opening brace is dropped)"""
+        return ''.join(self._chars)
+
+    def feed(self, chunk: str) -> str:
+        """Consume a chunk of output; returns the newly decoded part of the streamed field"""
+        delta = []
+        for char in chunk:
+            if self.complete:
+                break
+            if self._depth == 0 and char != '{':
+                continue
+            self._chars.append(char)
+            if self._in_string:
+                decoded = self._string_char(char)
+                if decoded and self._streaming:
+                    delta.append(decoded)
+                elif decoded and self._key_chars is not None:
+                    self._key_chars.append(decoded)
+            else:
+                self._structural_char(char)
+        text = ''.join(delta)
+        self.field_value += text
+        return text
+
+    def _structural_char(self, char: str) -> None:
+        if char in '{[':
+            self._depth += 1
+            self._expect_key = char == '{' and self._depth == 1
+        elif char in '}]':
+            self._depth -= 1
+            if self._depth == 0:
+                self.complete = True
+        elif char == '"':
+            self._in_string = True
+            if self._depth == 1 and self._expect_key:
+                self._key_chars = []
+            elif self._depth == 1 and self._key == self.stream_field:
+                self._streaming = True
+        elif self._depth == 1 and char == ':':
+            self._expect_key = False
+        elif self._depth == 1 and char == ',':
+            self._expect_key = True
+
+    def _string_char(self, char: str) -> str:
+        """Decode one character inside a string, closing the string on an unescaped quote"""
+        if self._unicode is not None:
+            self._unicode += char
+            if len(self._unicode) < 4:
+                return ''
+            code, self._unicode = int(self._unicode, 16), None
+            if 0xD800 <= code < 0xDC00:
+                self._high_surrogate = code
+                return ''
+            if 0xDC00 <= code < 0xE000 and self._high_surrogate is not None:
+                code = 0x10000 + ((self._high_surrogate - 0xD800) << 10) + (code - 0xDC00)
+            self._high_surrogate = None
+            return chr(code)
+        if self._escape:
+            self._escape = False
+            if char == 'u':
+                self._unicode = ''
+                return ''
+            return _ESCAPES.get(char, char)
+        if char == '\\':
+            self._escape = True
+            return ''
+        if char == '"':
+            self._in_string = False
+            self._streaming = False
+            if self._key_chars is not None:
+                self._key = ''.join(self._key_chars)
+                self._key_chars = None
+            return ''
+        return char
+
+    def result(self) -> Dict[str, Any]:
+        """The parsed object; raises json.JSONDecodeError if it is incomplete or malformed"""
+        return json.loads(self.text)
@@ -0,0 +1,163 @@
+"""
+Priority-aware admission control for model server calls.
+
+Every Ollama embedding/generation call takes a slot from the process-wide
+ModelScheduler. Interactive traffic (/ask) may use every slot; batch traffic
+(document ingestion, index rebuilds) is capped at its own limit and only runs
+when no interactive call is waiting. Interactive calls carry a deadline and
+are shed with OverloadedError, rather than queued indefinitely, when they
+cannot be admitted in time.
+"""
+
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+from qbot import OverloadedError
+from qbot.config import (
+    SCHEDULER_BATCH_CONCURRENCY,
+    SCHEDULER_INTERACTIVE_CONCURRENCY,
+    SCHEDULER_INTERACTIVE_DEADLINE,
+    SCHEDULER_MAX_CONCURRENCY
+)
+
+INTERACTIVE = 'interactive'
+BATCH = 'batch'
+PRIORITIES = (INTERACTIVE, BATCH)
+
+_current_priority: contextvars.ContextVar = contextvars.ContextVar('qbot_priority', default=INTERACTIVE)
+
+
+class ModelScheduler:
+    """Admission control for model server calls, by priority class"""
+
+    def __init__(
+            self,
+            max_concurrency: int = SCHEDULER_MAX_CONCURRENCY,
+            interactive_concurrency: int = SCHEDULER_INTERACTIVE_CONCURRENCY,
+            batch_concurrency: int = SCHEDULER_BATCH_CONCURRENCY,
+            interactive_deadline: float = SCHEDULER_INTERACTIVE_DEADLINE
+    ):
+        self.max_concurrency = max(1, max_concurrency)
+        self.limits = {
+            INTERACTIVE: max(1, interactive_concurrency or self.max_concurrency),
+            BATCH: max(1, batch_concurrency)
+        }
+        self.deadlines = {INTERACTIVE: interactive_deadline or None, BATCH: None}
+        self._condition = threading.Condition()
+        self._in_flight = {p: 0 for p in PRIORITIES}
+        self._waiting = {p: 0 for p in PRIORITIES}
+        self._admitted = {p: 0 for p in PRIORITIES}
+        self._shed = {p: 0 for p in PRIORITIES}
+        # EWMA of call duration, used to shed early when the queue cannot drain in time
+        self._service_seconds: Optional[float] = None
+
+    @staticmethod
+    @contextmanager
+    def priority(priority: str) -> Iterator[None]:
+        """Run the enclosed model calls (in this thread/context) under the given priority"""
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority '{priority}', expected one of {PRIORITIES}")
+        token = _current_priority.set(priority)
+        try:
+            yield
+        finally:
+            _current_priority.reset(token)
+
+    @staticmethod
+    def current_priority() -> str:
+        return _current_priority.get()
+
+    def _can_run(self, priority: str) -> bool:
+        if sum(self._in_flight.values()) >= self.max_concurrency:
+            return False
+        if self._in_flight[priority] >= self.limits[priority]:
+            return False
+        # Batch work only uses capacity interactive traffic is not waiting for
+        return priority == INTERACTIVE or self._waiting[INTERACTIVE] == 0
+
+    def _expected_wait(self, priority: str) -> float:
+        if self._service_seconds is None:
+            return 0.0
+        ahead = self._waiting[priority] + (self._waiting[INTERACTIVE] if priority == BATCH else 0)
+        return self._service_seconds * ahead / self.limits[priority]
+
+    def _acquire(self, priority: str, deadline: Optional[float]) -> None:
+        with self._condition:
+            if deadline is not None and time.monotonic() + self._expected_wait(priority) > deadline:
+                self._shed[priority] += 1
+                raise OverloadedError(f"Model server overloaded, {priority} request shed")
+
+            self._waiting[priority] += 1
+            try:
+                while not self._can_run(priority):
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        self._shed[priority] += 1
+                        raise OverloadedError(f"Model server overloaded, {priority} request timed out waiting")
+                    self._condition.wait(remaining)
+            finally:
+                self._waiting[priority] -= 1
+                # A waiting interactive call may have been holding batch work back
+                self._condition.notify_all()
+            self._in_flight[priority] += 1
+            self._admitted[priority] += 1
+
+    def _release(self, priority: str, seconds: float) -> None:
+        with self._condition:
+            self._in_flight[priority] -= 1
+            if self._service_seconds is None:
+                self._service_seconds = seconds
+            else:
+                self._service_seconds = 0.8 * self._service_seconds + 0.2 * seconds
+            self._condition.notify_all()
+
+    def try_acquire(self, priority: str) -> bool:
+        """Take a slot only if one is free right now, e.g. for a hedged duplicate of a call already admitted"""
+        with self._condition:
+            if not self._can_run(priority):
+                return False
+            self._in_flight[priority] += 1
+            self._admitted[priority] += 1
+            return True
+
+    def release(self, priority: str, seconds: float) -> None:
+        """Return a slot taken with try_acquire"""
+        self._release(priority, seconds)
+
+    @contextmanager
+    def slot(self, deadline: Optional[float] = None) -> Iterator[None]:
+        """Hold a model server slot for one call, at the current context's priority"""
+        priority = self.current_priority()
+        if deadline is None and self.deadlines[priority]:
+            deadline = time.monotonic() + self.deadlines[priority]
+        self._acquire(priority, deadline)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(priority, time.monotonic() - start)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._condition:
+            return {
+                'max_concurrency': self.max_concurrency,
+                'service_seconds_ewma': self._service_seconds,
+                'classes': {
+                    p: {
+                        'limit': self.limits[p],
+                        'in_flight': self._in_flight[p],
+                        'waiting': self._waiting[p],
+                        'admitted': self._admitted[p],
+                        'shed': self._shed[p],
+                        'deadline_seconds': self.deadlines[p]
+                    }
+                    for p in PRIORITIES
+                }
+            }
+
+
+# Shared by every backend in the process, since they all contend for the same model server
+model_scheduler = ModelScheduler()
@@ -4,12 +4,18 @@ QBot test suite initialization and configuration.
 
 import os
 import sys
+import tempfile
 import pytest
-from typing import Generator, Any
+from typing import Generator, Any, Dict, List
 
 # Add src directory to Python path for test imports
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
 
+# qbot sets up file logging on import; keep test runs from writing logs/ into the working directory
+os.environ.setdefault('QBOT_LOG_DIR', tempfile.mkdtemp(prefix='qbot-test-logs-'))
+
+from qbot.models import backends
+
 # Test configuration
 TEST_CONFIG = {
     'OLLAMA_HOST': 'localhost',
@@ -32,6 +38,31 @@ MOCK_EMBEDDINGS = [
 ]
 
 
+class FakeEmbedder(backends.Embedder):
+    """Deterministic 3-dimensional embeddings (length, 'a' and 'e' counts), recording every text and batch size"""
+    backend = 'fake'
+
+    def __init__(self, model: str = 'fake-embed'):
+        super().__init__(model)
+        self.texts: List[str] = []
+        self.batches: List[int] = []
+
+    def vector(self, text: str) -> List[float]:
+        return [float(len(text)), float(text.count('a')), float(text.count('e'))]
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        self.texts.extend(texts)
+        self.batches.append(len(texts))
+        return [self.vector(text) for text in texts]
+
+
+class NullGenerator(backends.Generator):
+    """Generator that always answers with an empty string"""
+
+    def generate(self, prompt: str, format: str = '', **options) -> str:
+        return ''
+
+
 @pytest.fixture
 def mock_vector_store() -> Generator[Any, None, None]:
     """Fixture for creating a mock vector store."""
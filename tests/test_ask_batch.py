@@ -0,0 +1,57 @@
+# tests/test_ask_batch.py
+import json
+import time
+
+import pytest
+from qbot.models.backends import Generator
+from qbot.models.vector_store import VectorStore
+from tests import FakeEmbedder
+
+DOCUMENTS = [
+    {'text': 'Llamas are camelids used as pack animals in the Andes.', 'metadata': {'animal': 'llama'}},
+    {'text': 'Alpacas are bred for their soft fibre.', 'metadata': {'animal': 'alpaca'}},
+    {'text': 'Vicunas live wild in the high Andes.', 'metadata': {'animal': 'vicuna'}},
+]
+
+
+class SlowGenerator(Generator):
+    """Answers take as many tenths of a second as the prompt says"""
+
+    def generate(self, prompt, format='', **options):
+        delay = next((int(word) for word in prompt.split() if word.isdigit()), 0)
+        time.sleep(delay / 10)
+        return 'Llamas are camelids.'
+
+
+@pytest.fixture
+def store(tmp_path):
+    path = tmp_path / 'documents.json'
+    path.write_text(json.dumps({'documents': DOCUMENTS}))
+    store = VectorStore(documents_path=str(path), embedder=FakeEmbedder(), generator=SlowGenerator('fake'),
+                        collection_name='ask_batch_test')
+    yield store
+    store.close()
+
+
+def test_batch_retrieval_matches_single_queries(store):
+    queries = store.embedder.embed(['pack animals', 'soft fibre', 'wild'])
+    for where in (None, {'animal': {'$in': ['llama', 'vicuna']}}):
+        batch = store.retrieve_chunks_batch(queries, n_results=2, where=where)
+        for i, query in enumerate(queries):
+            single = store.retrieve_chunks(query, n_results=2, where=where)
+            assert batch['ids'][i] == single['ids'][0]
+            assert batch['distances'][i] == pytest.approx(single['distances'][0], rel=1e-4)
+
+
+def test_answers_stream_in_completion_order_with_timings(store):
+    prompts = ['llamas 3', 'llamas 0', 'llamas 1', 'llamas 0']
+    embedded_before = len(store.embedder.batches)
+    items = list(store.answer_batch(prompts, workers=4, batch_size=3))
+
+    assert sorted(item['index'] for item in items) == [0, 1, 2, 3]
+    assert items[-1]['index'] == 0
+    assert store.embedder.batches[embedded_before:] == [3, 1]
+    for item in items:
+        assert item['prompt'] == prompts[item['index']]
+        assert 'response' in item
+        assert {'embed_ms', 'retrieve_ms', 'queue_ms', 'generate_ms'} <= set(item['timings'])
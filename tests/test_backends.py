@@ -0,0 +1,28 @@
+# tests/test_backends.py
+import pytest
+from qbot import ConfigurationError
+from qbot.models import ModelRegistry
+from qbot.models.backends import get_embedder
+from tests import FakeEmbedder
+
+
+def test_embedder_tracks_dimension_and_throughput():
+    embedder = FakeEmbedder('fake-model')
+    embeddings = embedder.embed(["one", "two"])
+
+    assert len(embeddings) == 2
+    assert embedder.dimension == 3
+    info = embedder.info()
+    assert info['calls'] == 1
+    assert info['kind'] == 'embedding'
+
+
+def test_measure_throughput_reports_dimension():
+    report = ModelRegistry.measure_throughput(FakeEmbedder('fake-model'), batch_size=8)
+    assert report['dimension'] == 3
+    assert report['batch_size'] == 8
+
+
+def test_unknown_backend_is_a_configuration_error():
+    with pytest.raises(ConfigurationError):
+        get_embedder(backend='does-not-exist')
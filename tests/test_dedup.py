@@ -0,0 +1,51 @@
+# tests/test_dedup.py
+import numpy as np
+from qbot.utils.dedup import NearDuplicateIndex, optimal_bands
+from qbot.utils.document_manager import DocumentManager
+
+ARTICLE = ("Llamas are domesticated South American camelids, widely used as meat and pack animals "
+           "by Andean cultures since the pre-Columbian era. They are social animals and live with others as a herd.")
+
+
+def test_near_copies_match_and_unrelated_text_does_not():
+    index = NearDuplicateIndex(threshold=0.7)
+    assert index.check_and_add('a', ARTICLE) is None
+
+    match = index.check_and_add('b', ARTICLE.replace("pre-Columbian era", "pre-Columbian period"))
+    assert match is not None and match[0] == 'a'
+    assert index.check_and_add('c', "Alpacas are bred for their fibre, not as pack animals.") is None
+    assert index.hasher.signature(ARTICLE).dtype == np.uint32
+
+
+def test_bands_track_threshold():
+    bands, rows = optimal_bands(0.85, 128)
+    assert bands * rows == 128
+    assert abs((1 / bands) ** (1 / rows) - 0.85) < 0.1
+
+
+def test_document_manager_skips_and_merges(tmp_path):
+    path = str(tmp_path / 'documents.json')
+    skipping = DocumentManager(path, dedup_threshold=0.7)
+    report = skipping.add_unique_documents([ARTICLE, ARTICLE + " Indeed."])
+    assert report == {'added': 1, 'skipped': 1, 'merged': 0, 'changed': [ARTICLE], 'positions': [0]}
+
+    merging = DocumentManager(path, dedup_threshold=0.7, dedup_policy='merge')
+    report = merging.add_unique_documents([{'text': ARTICLE + " Truly.", 'metadata': {'source': 'feed'}}])
+    assert {k: report[k] for k in ('added', 'skipped', 'merged')} == {'added': 0, 'skipped': 0, 'merged': 1}
+    assert report['changed'] == [{'text': ARTICLE, 'metadata': {'source': 'feed'}}]
+    assert report['positions'] == [0]
+    assert merging.get_documents() == [{'text': ARTICLE, 'metadata': {'source': 'feed'}}]
+    assert merging.add_unique_documents(["Vicunas graze the altiplano."])['positions'] == [1]
+
+
+def test_merges_into_a_document_from_the_same_call_replace_its_entry(tmp_path):
+    manager = DocumentManager(str(tmp_path / 'documents.json'), dedup_threshold=0.7, dedup_policy='merge')
+    report = manager.add_unique_documents([
+        {'text': ARTICLE, 'metadata': {'source': 'wiki'}},
+        {'text': ARTICLE + " Truly.", 'metadata': {'source': 'feed'}}
+    ])
+
+    merged = {'text': ARTICLE, 'metadata': {'source': ['wiki', 'feed']}}
+    assert report['changed'] == [merged]
+    assert report['positions'] == [0]
+    assert manager.get_documents() == [merged]
@@ -0,0 +1,106 @@
+# tests/test_ingestion.py
+import json
+
+import pytest
+from qbot.models.vector_store import VectorStore
+from qbot.utils.ingestion import BulkIngester, IngestCheckpoint, iter_records
+from tests import FakeEmbedder, NullGenerator
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    source = tmp_path / 'corpus'
+    source.mkdir()
+    with open(source / 'a.jsonl', 'w') as f:
+        for doc in ["llamas are camelids",
+                    {"text": "alpacas are smaller", "metadata": {"tags": ["alpaca"]}},
+                    "llamas are camelids"]:
+            f.write(json.dumps(doc) + "\n")
+    (source / 'b.txt').write_text("vicunas live in the Andes\nat high altitude\n\nguanacos are wild\n")
+    return source
+
+
+def test_iter_records_reads_jsonl_and_paragraphs(corpus):
+    assert list(iter_records(corpus / 'a.jsonl')) == [
+        ("llamas are camelids", {}),
+        ("alpacas are smaller", {"tags": ["alpaca"]}),
+        ("llamas are camelids", {})
+    ]
+    assert list(iter_records(corpus / 'b.txt')) == [
+        ("vicunas live in the Andes at high altitude", {}), ("guanacos are wild", {})
+    ]
+
+
+def test_ingest_deduplicates_and_checkpoints(corpus, tmp_path):
+    ingester = BulkIngester(str(tmp_path / 'index'), embedder=FakeEmbedder('fake'), batch_size=2, workers=2)
+
+    stats = ingester.ingest(str(corpus))
+
+    assert stats['ingested'] == 4
+    assert stats['duplicates'] == 1
+    assert ingester.collection.count() == 4
+
+    checkpoint = IngestCheckpoint(str(tmp_path / 'index' / 'ingest_checkpoint_docs.json'))
+    assert checkpoint.is_complete(str((corpus / 'a.jsonl').resolve()))
+
+
+def test_ingest_resumes_from_checkpoint(corpus, tmp_path):
+    index_path = str(tmp_path / 'index')
+    checkpoint = IngestCheckpoint(str(tmp_path / 'index.ckpt'))
+    checkpoint.update(str((corpus / 'a.jsonl').resolve()), 2)
+
+    ingester = BulkIngester(index_path, embedder=FakeEmbedder('fake'), checkpoint_path=checkpoint.path)
+    stats = ingester.ingest(str(corpus))
+
+    # The first two records of a.jsonl were already done; its third is new to this run
+    assert stats['read'] == 3
+    assert stats['ingested'] == 3
+
+
+def test_purge_deletes_persisted_collection_and_checkpoint(corpus, tmp_path):
+    index_path = str(tmp_path / 'index')
+    BulkIngester(index_path, embedder=FakeEmbedder('fake')).ingest(str(corpus))
+    checkpoint_path = tmp_path / 'index' / 'ingest_checkpoint_docs.json'
+    assert checkpoint_path.exists()
+
+    store = VectorStore(documents_path=str(tmp_path / 'missing.json'), persist_directory=index_path,
+                        embedder=FakeEmbedder('fake'), generator=NullGenerator('fake'), allow_empty=True)
+    assert store.collection.count() == 4
+    store.purge()
+
+    assert not checkpoint_path.exists()
+    rebuilt = VectorStore(documents_path=str(tmp_path / 'missing.json'), persist_directory=index_path,
+                          embedder=FakeEmbedder('fake'), generator=NullGenerator('fake'), allow_empty=True)
+    assert rebuilt.collection.count() == 0
+
+
+def test_ingested_documents_are_filterable_by_source(corpus, tmp_path):
+    index_path = str(tmp_path / 'index')
+    BulkIngester(index_path, embedder=FakeEmbedder('fake')).ingest(str(corpus))
+    store = VectorStore(documents_path=str(tmp_path / 'missing.json'), persist_directory=index_path,
+                        embedder=FakeEmbedder('fake'), generator=NullGenerator('fake'), allow_empty=True)
+
+    results = store.retrieve_chunks([20.0, 1.0, 0.0], n_results=4, where={'source': 'a.jsonl'})
+    assert sorted(results['documents'][0]) == ["alpacas are smaller", "llamas are camelids"]
+
+
+@pytest.mark.parametrize('policy', ['offload', 'evict'])
+def test_offloaded_and_evicted_documents_are_not_ingested_again(corpus, tmp_path, monkeypatch, policy):
+    from qbot.models import vector_store
+    monkeypatch.setattr(vector_store, 'VECTOR_STORE_MAX_DOCUMENTS', 1)
+    monkeypatch.setattr(vector_store, 'VECTOR_STORE_EVICTION_POLICY', policy)
+    index_path = str(tmp_path / 'index')
+    documents_path = tmp_path / 'documents.json'
+    documents_path.write_text(json.dumps({'documents': ["llamas are camelids", "guanacos are wild"]}))
+    store = VectorStore(documents_path=str(documents_path), persist_directory=index_path,
+                        embedder=FakeEmbedder('fake'), generator=NullGenerator('fake'))
+    assert store.collection.count() == 1
+    store.close()
+
+    ingester = BulkIngester(index_path, embedder=FakeEmbedder('fake'))
+    stats = ingester.ingest(str(corpus))
+
+    # Both stored documents (one resident, one offloaded or evicted) plus the in-file repeat are duplicates
+    assert stats['duplicates'] == 3
+    assert stats['ingested'] == 2
+    assert ingester.collection.count() == 3
@@ -0,0 +1,77 @@
+# tests/test_json_stream.py
+import json
+
+from qbot.models.backends import Generator
+from qbot.models.vector_store import VectorStore
+from qbot.utils.json_stream import IncrementalJSONParser
+from tests import FakeEmbedder
+
+OBJECT = {"answer": "Llamas \"hum\"\nand spit é \U0001f999", "source": "{not a brace}", "confidence": 0.9}
+
+
+def feed_in_pieces(parser, text, size):
+    return ''.join(parser.feed(text[i:i + size]) for i in range(0, len(text), size))
+
+
+def test_streams_answer_across_any_chunking():
+    text = json.dumps(OBJECT)
+    for size in (1, 2, 3, 7, len(text)):
+        parser = IncrementalJSONParser()
+        assert feed_in_pieces(parser, text, size) == OBJECT['answer']
+        assert parser.complete
+        assert parser.result() == OBJECT
+
+
+def test_stops_at_object_end_and_ignores_padding():
+    parser = IncrementalJSONParser()
+    parser.feed('  {"source": "x", "nested": {"answer": "no"}, "answer": "yes"}\n\n\n   ')
+    assert parser.complete
+    assert parser.field_value == 'yes'
+    assert parser.result()['nested'] == {'answer': 'no'}
+
+
+def test_truncated_object_keeps_partial_answer():
+    parser = IncrementalJSONParser()
+    parser.feed('{"answer": "Llamas are cam')
+    assert not parser.complete
+    assert parser.field_value == 'Llamas are cam'
+
+
+class StreamingGenerator(Generator):
+    """Emits a JSON object a few characters at a time, then endless whitespace padding"""
+
+    def __init__(self, output):
+        super().__init__('fake')
+        self.output = output
+        self.emitted = 0
+        self.options = None
+
+    def generate(self, prompt, format='', **options):
+        return self.output
+
+    def stream(self, prompt, format='', **options):
+        self.options = dict(options, format=format)
+        for i in range(0, len(self.output), 4):
+            self.emitted += 1
+            yield self.output[i:i + 4]
+        while True:
+            self.emitted += 1
+            yield '\n'
+
+
+def test_structured_response_stops_generation_once_object_is_complete(tmp_path):
+    path = tmp_path / 'documents.json'
+    path.write_text(json.dumps({'documents': ['Llamas are camelids from South America.']}))
+    output = json.dumps({"answer": "Llamas are camelids", "source": "Llamas are camelids", "confidence": 0.8})
+    generator = StreamingGenerator(output)
+    store = VectorStore(documents_path=str(path), embedder=FakeEmbedder('fake'), generator=generator,
+                        collection_name='json_stream_test')
+    try:
+        events = list(store.stream_structured_response('What are llamas?'))
+    finally:
+        store.close()
+
+    assert ''.join(e['answer_delta'] for e in events[:-1]) == 'Llamas are camelids'
+    assert events[-1]['result']['answer'] == 'Llamas are camelids.'
+    assert generator.emitted == -(-len(output) // 4)
+    assert generator.options['format'] == 'json' and generator.options['num_predict'] > 0
@@ -0,0 +1,200 @@
+# tests/test_memory.py
+import json
+
+import numpy as np
+import pytest
+from qbot import VectorStoreError
+from qbot.models import vector_store
+from qbot.models.memory import (
+    MemoryTracker,
+    OffloadStore,
+    ResidentVectors,
+    estimate_document_bytes,
+    estimate_retained_bytes
+)
+from qbot.models.vector_store import VectorStore
+from qbot.utils.helpers import content_hash
+from tests import FakeEmbedder, NullGenerator
+
+
+def test_tracker_evicts_least_recently_retrieved_first():
+    tracker = MemoryTracker(max_documents=2)
+    for doc_id in ('a', 'b', 'c'):
+        tracker.add(doc_id, "llamas", dimension=4)
+    tracker.touch(['a'])
+
+    assert tracker.over_budget()
+    assert tracker.coldest() == ['b']
+
+
+def test_tracker_respects_byte_budget():
+    per_doc = estimate_document_bytes("llamas", 4)
+    tracker = MemoryTracker(budget_bytes=per_doc * 2)
+    for doc_id in ('a', 'b', 'c', 'd'):
+        tracker.add(doc_id, "llamas", dimension=4)
+
+    victims = tracker.coldest()
+    assert victims == ['a', 'b']
+    tracker.remove(victims, dimension=4)
+    assert not tracker.over_budget()
+    assert tracker.vector_bytes == 2 * 4 * 4
+
+
+def test_offloaded_documents_stay_counted_for_their_index_entries():
+    metadata = {'source': 'wiki', 'tags': ['llama', 'alpaca']}
+    assert estimate_document_bytes("llamas", 4, metadata) > estimate_document_bytes("llamas", 4)
+    tracker = MemoryTracker(max_documents=1)
+    tracker.add('a', "llamas", dimension=4, metadata=metadata)
+    tracker.add('b', "llamas", dimension=4)
+
+    victims = tracker.coldest(retain=True)
+    assert victims == ['a']
+    tracker.remove(victims, dimension=4, retain=True)
+    assert tracker.retained_bytes == estimate_retained_bytes(metadata)
+    assert tracker.total_bytes == estimate_document_bytes("llamas", 4) + tracker.retained_bytes
+
+
+def test_offload_store_round_trip(tmp_path):
+    store = OffloadStore(str(tmp_path), dimension=2)
+    store.add(['a', 'b'], [[0.0, 0.0], [1.0, 1.0]], ["near", "far"], [{'source_index': 0}, {'source_index': 1}])
+
+    reopened = OffloadStore(str(tmp_path), dimension=2)
+    results = reopened.query([[0.1, 0.0], [0.9, 1.0]], n_results=1)
+
+    assert len(reopened) == 2
+    assert results['ids'] == [['a'], ['b']]
+    assert results['documents'] == [["near"], ["far"]]
+    assert results['metadatas'] == [[{'source_index': 0}], [{'source_index': 1}]]
+    assert results['distances'][0] == [pytest.approx(0.01)]
+
+
+def test_offload_store_batch_query_scans_in_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr(OffloadStore, 'SCAN_ROWS', 3)
+    store = OffloadStore(str(tmp_path), dimension=2)
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(10, 2)).astype(np.float32)
+    ids = [f'd{i}' for i in range(10)]
+    store.add(ids, vectors.tolist(), ids, [{} for _ in ids])
+    queries = rng.normal(size=(4, 2)).astype(np.float32)
+
+    results = store.query(queries, n_results=3)
+    for q, query in enumerate(queries):
+        expected = np.argsort(((vectors - query) ** 2).sum(axis=1))[:3]
+        assert results['ids'][q] == [ids[i] for i in expected]
+
+    filtered = store.query(queries, n_results=3, candidate_ids={'d1', 'd7', 'missing'})
+    assert all(sorted(hits) == ['d1', 'd7'] for hits in filtered['ids'])
+
+
+def test_resident_vectors_stay_contiguous_across_removals():
+    vectors = ResidentVectors(dimension=2, capacity=1)
+    vectors.add(['a', 'b', 'c'], [[0.0, 0.0], [1.0, 1.0], [2.0, 2.0]])
+    vectors.remove(['a'])
+    vectors.add(['b', 'd'], [[5.0, 5.0], [3.0, 3.0]])
+
+    ids, matrix = vectors.take(['d', 'b', 'a', 'c'])
+    assert ids == ['d', 'b', 'c']
+    assert matrix.tolist() == [[3.0, 3.0], [5.0, 5.0], [2.0, 2.0]]
+    assert len(vectors) == 3
+
+
+class WideningEmbedder(FakeEmbedder):
+    """Texts mentioning "wide" come back with an extra dimension"""
+
+    def vector(self, text):
+        return super().vector(text) + ([0.0] if 'wide' in text else [])
+
+
+def build_store(tmp_path, documents, **kwargs):
+    path = tmp_path / 'documents.json'
+    path.write_text(json.dumps({'documents': documents}))
+    return VectorStore(documents_path=str(path), generator=NullGenerator('g'), **kwargs)
+
+
+def test_store_rejects_wrong_dimension_embeddings(tmp_path):
+    store = build_store(tmp_path, ['llamas'], embedder=WideningEmbedder(), collection_name='memory_dimension')
+    try:
+        with pytest.raises(VectorStoreError, match='dimension'):
+            store.index_documents(['a wide llama'])
+    finally:
+        store.close()
+
+
+def test_offloaded_documents_are_still_retrieved(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector_store, 'VECTOR_STORE_MAX_DOCUMENTS', 2)
+    documents = ['a', 'bb', 'ccc', 'dddd']
+    store = build_store(tmp_path, documents, embedder=FakeEmbedder(), collection_name='memory_offload')
+    try:
+        assert len(store.offload_store) == 2 and store.collection.count() == 2
+        results = store.retrieve_chunks([1.0, 1.0, 0.0], n_results=2)
+        assert results['documents'][0] == ['a', 'bb']
+    finally:
+        store.close()
+
+
+def test_evicted_documents_are_not_embedded_again(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector_store, 'VECTOR_STORE_MAX_DOCUMENTS', 2)
+    monkeypatch.setattr(vector_store, 'VECTOR_STORE_EVICTION_POLICY', 'evict')
+    documents = ['a', 'bb', 'ccc', 'dddd']
+    index_path = str(tmp_path / 'index')
+    build_store(tmp_path, documents, embedder=FakeEmbedder(), persist_directory=index_path,
+                collection_name='memory_evict').close()
+
+    embedder = FakeEmbedder()
+    reopened = build_store(tmp_path, documents, embedder=embedder, persist_directory=index_path,
+                           collection_name='memory_evict')
+    # Only the dimension probe was embedded
+    assert embedder.texts == ['dimension probe']
+    assert reopened.collection.count() == 2
+    assert reopened.evicted_ids == {content_hash('a'), content_hash('bb')}
+
+
+def test_near_duplicates_of_offloaded_documents_are_skipped(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector_store, 'VECTOR_STORE_MAX_DOCUMENTS', 1)
+    documents = ['llamas are domesticated camelids used as pack animals by andean cultures',
+                 'alpacas are bred for their soft fleece in the high andes of peru']
+    store = build_store(tmp_path, documents, embedder=FakeEmbedder(), collection_name='memory_near_duplicates')
+    try:
+        assert store.offload_store.ids == [content_hash(documents[0])]
+        assert store.index_documents([documents[0] + ' today']) == 0
+        index = store.near_duplicate_index()
+        assert store.index_documents(['vicunas live wild']) == 1
+        assert store.near_duplicate_index() is index and len(index) == 3
+        assert store.near_duplicates_dropped == 1
+    finally:
+        store.close()
+
+
+def test_uploads_share_the_store_near_duplicate_index(tmp_path):
+    from qbot.utils.document_manager import DocumentManager
+    documents = ['llamas are domesticated camelids used as pack animals by andean cultures']
+    store = build_store(tmp_path, documents, embedder=FakeEmbedder(), collection_name='memory_shared_index')
+    try:
+        index = store.near_duplicate_index()
+        manager = DocumentManager(str(tmp_path / 'documents.json'))
+        report = manager.add_unique_documents([documents[0] + ' today', 'vicunas live wild in the high andes'],
+                                              near_duplicates=index)
+        assert (report['added'], report['skipped']) == (1, 1)
+        assert manager._near_duplicates is None
+
+        assert store.index_documents(report['changed'], positions=report['positions']) == 1
+        assert len(index) == 2 and store.near_duplicates_dropped == 0
+    finally:
+        store.close()
+
+
+def test_merged_metadata_reaches_offloaded_documents(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector_store, 'VECTOR_STORE_MAX_DOCUMENTS', 1)
+    documents = [{'text': 'llamas', 'metadata': {'source': 'wiki'}}, 'alpacas']
+    store = build_store(tmp_path, documents, embedder=FakeEmbedder(), collection_name='memory_offload_merge')
+    try:
+        assert store.offload_store.ids == [content_hash('llamas')]
+        store.index_documents([{'text': 'llamas', 'metadata': {'source': ['wiki', 'feed']}}])
+
+        results = store.retrieve_chunks([6.0, 1.0, 0.0], n_results=1, where={'source': 'feed'})
+        assert results['ids'][0] == [content_hash('llamas')]
+        assert json.loads(results['metadatas'][0][0]['metadata']) == {'source': ['wiki', 'feed']}
+        reopened = OffloadStore(store.offload_store.path, store.dimension)
+        assert json.loads(reopened.metadata(content_hash('llamas'))['metadata']) == {'source': ['wiki', 'feed']}
+    finally:
+        store.close()
@@ -0,0 +1,37 @@
+# tests/test_metadata_index.py
+import pytest
+from qbot.models.metadata_index import MetadataIndex, validate_filter
+
+
+@pytest.fixture
+def index():
+    index = MetadataIndex()
+    index.add('1', {'source': 'wiki', 'tags': ['llama', 'faq'], 'date': '2024-03-01'})
+    index.add('2', {'source': 'blog', 'tags': ['alpaca'], 'date': '2023-05-01'})
+    index.add('3', {'source': 'wiki', 'date': '2025-01-01'})
+    return index
+
+
+def test_equality_and_list_membership(index):
+    assert index.resolve({'source': 'wiki'}) == {'1', '3'}
+    assert index.resolve({'tags': 'llama'}) == {'1'}
+    assert index.resolve({'tags': {'$in': ['llama', 'alpaca']}}) == {'1', '2'}
+    assert index.resolve({'source': {'$ne': 'wiki'}}) == {'2'}
+
+
+def test_date_ranges_and_logical_operators(index):
+    assert index.resolve({'date': {'$gte': '2024-01-01', '$lt': '2025-01-01'}}) == {'1'}
+    assert index.resolve({'$or': [{'source': 'blog'}, {'tags': 'faq'}]}) == {'1', '2'}
+    assert index.resolve({'source': 'wiki', 'date': {'$gt': '2024-06-01'}}) == {'3'}
+
+
+def test_removed_documents_stop_matching(index):
+    index.remove(['1'])
+    assert index.resolve({'source': 'wiki'}) == {'3'}
+    assert index.resolve({'date': {'$gte': '2000-01-01'}}) == {'2', '3'}
+
+
+def test_invalid_filters_are_rejected():
+    for bad in ({'source': {'$regex': 'w.*'}}, {'$not': []}, {'tags': {'$in': 'llama'}}, {'source': ['a']}):
+        with pytest.raises(ValueError):
+            validate_filter(bad)
@@ -0,0 +1,148 @@
+# tests/test_ollama_pool.py
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from qbot.models.backends import OllamaEmbedder, OllamaGenerator
+from qbot.models.ollama_pool import OllamaPool
+from qbot.utils.scheduler import BATCH, INTERACTIVE, model_scheduler
+
+
+class FakeOllama:
+    """Minimal Ollama HTTP API on a local port, with adjustable latency"""
+
+    def __init__(self, name, delay=0.0, port=0):
+        self.name = name
+        self.delay = delay
+        self.calls = 0
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, body):
+                data = json.dumps(body).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self._reply({'models': [{'name': f'{fake.name}-model:latest'}]})
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                fake.calls += 1
+                time.sleep(fake.delay)
+                if self.path == '/api/embed':
+                    self._reply({'embeddings': [[float(len(text)), 1.0] for text in request['input']]})
+                elif self.path == '/api/embeddings':
+                    self._reply({'embedding': [float(len(request['prompt'])), 1.0]})
+                else:
+                    self._reply({'response': f'from {fake.name}', 'done': True})
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.port = self.server.server_port
+        self.host = f'http://127.0.0.1:{self.port}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def servers():
+    fakes = [FakeOllama('a'), FakeOllama('b')]
+    yield fakes
+    for fake in fakes:
+        try:
+            fake.stop()
+        except OSError:
+            pass
+
+
+def test_routes_to_the_faster_endpoint(servers):
+    fast, slow = servers
+    slow.delay = 0.05
+    pool = OllamaPool([fast.host, slow.host], health_interval=0)
+    embedder = OllamaEmbedder('embed', pool=pool)
+    for _ in range(20):
+        assert embedder.embed_one('llama') == [5.0, 1.0]
+    assert fast.calls > 3 * slow.calls
+    assert OllamaGenerator('gen', pool=pool).generate('hi') == 'from a'
+
+
+def test_embeds_a_batch_in_one_request(servers):
+    server = servers[0]
+    embedder = OllamaEmbedder('embed', pool=OllamaPool([server.host], health_interval=0))
+    assert embedder.embed(['a', 'bb', 'ccc']) == [[1.0, 1.0], [2.0, 1.0], [3.0, 1.0]]
+    assert server.calls == 1
+
+
+def test_fails_over_and_recovers_after_health_check(servers):
+    alive, dead = servers
+    pool = OllamaPool([dead.host, alive.host], health_interval=0)
+    dead.stop()
+    for _ in range(3):
+        assert pool.call(lambda client: client.embeddings(model='m', prompt='x'))['embedding'] == [1.0, 1.0]
+    dead_stats, alive_stats = pool.stats()['endpoints']
+    assert not dead_stats['healthy'] and dead_stats['failures'] == 1
+    assert alive.calls == 3
+
+    pool.check_health()
+    assert not pool.endpoints[0].healthy
+    assert pool.endpoints[1].healthy
+
+    # Bring the endpoint back on the same port and make the other one look slow
+    revived = FakeOllama('revived', port=dead.port)
+    servers.append(revived)
+    pool.endpoints[1].latency = 1.0
+    pool.check_health()
+    assert pool.endpoints[0].healthy
+    assert pool.call(lambda client: client.generate(model='m', prompt='hi'))['response'] == 'from revived'
+    assert revived.calls == 1
+
+
+def test_slow_embedding_calls_are_hedged(servers):
+    primary, backup = servers
+    pool = OllamaPool([primary.host, backup.host], hedging=True, hedge_after_ms=50, health_interval=0)
+    # Make the primary look fastest, then stall it
+    pool.endpoints[0].latency, pool.endpoints[1].latency = 0.001, 0.002
+    primary.delay = 1.0
+
+    in_flight = model_scheduler.stats()['classes']['interactive']['in_flight']
+    start = time.monotonic()
+    result = pool.call(lambda client: client.embeddings(model='m', prompt='xy'), hedge=True)
+    assert result['embedding'] == [2.0, 1.0]
+    assert time.monotonic() - start < 0.8
+    assert pool.stats()['hedges'] == 1 and pool.stats()['hedge_wins'] == 1
+
+    # The losing request keeps its endpoint and the hedge's scheduler slot until it finishes
+    assert pool.stats()['hedges_in_flight'] == 1 and pool.endpoints[0].outstanding == 1
+    assert model_scheduler.stats()['classes']['interactive']['in_flight'] == in_flight + 1
+    deadline = time.monotonic() + 3
+    while pool.stats()['hedges_in_flight'] and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert pool.stats()['hedges_in_flight'] == 0 and pool.endpoints[0].outstanding == 0
+    assert model_scheduler.stats()['classes']['interactive']['in_flight'] == in_flight
+    pool.close()
+
+
+@pytest.mark.parametrize('texts, priority', [(['a', 'bb'], INTERACTIVE), (['a'], BATCH)])
+def test_batches_and_batch_priority_calls_are_not_hedged(servers, texts, priority):
+    primary, backup = servers
+    pool = OllamaPool([primary.host, backup.host], hedging=True, hedge_after_ms=20, health_interval=0)
+    pool.endpoints[0].latency, pool.endpoints[1].latency = 0.001, 0.002
+    primary.delay = 0.2
+    embedder = OllamaEmbedder('embed', pool=pool)
+
+    with model_scheduler.priority(priority):
+        assert len(embedder.embed(texts)) == len(texts)
+    assert pool.stats()['hedges'] == 0
+    assert (primary.calls, backup.calls) == (1, 0)
+    pool.close()
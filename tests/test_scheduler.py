@@ -0,0 +1,67 @@
+# tests/test_scheduler.py
+import threading
+import time
+
+import pytest
+from qbot import OverloadedError
+from qbot.utils.scheduler import BATCH, INTERACTIVE, ModelScheduler
+
+
+def hold_slot(scheduler, priority, entered, release):
+    with scheduler.priority(priority):
+        with scheduler.slot():
+            entered.set()
+            release.wait(5)
+
+
+def test_priority_is_scoped_to_the_block():
+    assert ModelScheduler.current_priority() == INTERACTIVE
+    with ModelScheduler.priority(BATCH):
+        assert ModelScheduler.current_priority() == BATCH
+    assert ModelScheduler.current_priority() == INTERACTIVE
+    with pytest.raises(ValueError):
+        with ModelScheduler.priority('urgent'):
+            pass
+
+
+def test_batch_is_capped_and_yields_to_waiting_interactive():
+    scheduler = ModelScheduler(max_concurrency=2, batch_concurrency=1, interactive_deadline=5)
+    entered, release = threading.Event(), threading.Event()
+    holder = threading.Thread(target=hold_slot, args=(scheduler, BATCH, entered, release))
+    holder.start()
+    entered.wait(5)
+
+    # The second batch call exceeds the batch limit even though a slot is free
+    second_batch = threading.Event()
+    waiter = threading.Thread(target=hold_slot, args=(scheduler, BATCH, second_batch, threading.Event()))
+    waiter.start()
+    time.sleep(0.1)
+    assert not second_batch.is_set()
+
+    # Interactive traffic still gets the spare slot immediately
+    with scheduler.slot():
+        assert scheduler.stats()['classes'][INTERACTIVE]['in_flight'] == 1
+
+    release.set()
+    holder.join(5)
+    waiter.join(5)
+    assert second_batch.is_set()
+    assert scheduler.stats()['classes'][BATCH]['admitted'] == 2
+
+
+def test_interactive_is_shed_past_its_deadline():
+    scheduler = ModelScheduler(max_concurrency=1, interactive_deadline=0.1)
+    entered, release = threading.Event(), threading.Event()
+    holder = threading.Thread(target=hold_slot, args=(scheduler, BATCH, entered, release))
+    holder.start()
+    entered.wait(5)
+
+    with pytest.raises(OverloadedError):
+        with scheduler.slot():
+            pass
+    release.set()
+    holder.join(5)
+
+    assert scheduler.stats()['classes'][INTERACTIVE]['shed'] == 1
+    with scheduler.slot():
+        pass
@@ -0,0 +1,90 @@
+# tests/test_snapshot.py
+import json
+
+import numpy as np
+import pytest
+from qbot import VectorStoreError
+from qbot.models.snapshot import Snapshot, write_snapshot
+from qbot.models.vector_store import VectorStore
+from tests import FakeEmbedder, NullGenerator
+
+
+def test_round_trip_is_memory_mapped_and_checksummed(tmp_path):
+    path = str(tmp_path / 'docs.qbs')
+    vectors = np.arange(12, dtype=np.float32).reshape(4, 3)
+    write_snapshot(path, [(['a', 'b'], vectors[:2], ['A', 'B'], [{}, {'k': 1}]),
+                          (['c', 'd'], vectors[2:], ['C', 'D'], [{}, {}])],
+                   model='m', dimension=3, collection_name='docs')
+
+    snapshot = Snapshot(path)
+    assert (snapshot.count, snapshot.dimension, snapshot.model) == (4, 3, 'm')
+    assert isinstance(snapshot.vectors, np.memmap)
+    assert np.array_equal(snapshot.vectors, vectors)
+    ids, batch_vectors, documents, metadatas = next(snapshot.iter_batches(3))
+    assert ids == ['a', 'b', 'c'] and documents == ['A', 'B', 'C'] and metadatas[1] == {'k': 1}
+
+    # Flip one byte of the records section
+    with open(path, 'r+b') as f:
+        f.seek(-3, 2)
+        byte = f.read(1)
+        f.seek(-3, 2)
+        f.write(bytes([byte[0] ^ 0xFF]))
+    with pytest.raises(VectorStoreError, match='checksum'):
+        Snapshot(path)
+
+
+def test_checksums_are_verified_once_per_file(tmp_path, monkeypatch):
+    from qbot.models import snapshot as snapshot_module
+    path = str(tmp_path / 'docs.qbs')
+    write_snapshot(path, [(['a'], np.ones((1, 3), dtype=np.float32), ['A'], [{}])],
+                   model='m', dimension=3, collection_name='docs')
+    hashed = []
+    file_sha256 = snapshot_module._file_sha256
+    monkeypatch.setattr(snapshot_module, '_file_sha256', lambda *args: hashed.append(1) or file_sha256(*args))
+
+    Snapshot(path)
+    Snapshot(path)
+    assert len(hashed) == 2  # one pass over each section, on the first load only
+    Snapshot(path).verify(force=True)
+    assert len(hashed) == 4
+
+    # A rewritten file is verified again
+    write_snapshot(path, [(['b'], np.ones((1, 3), dtype=np.float32), ['B'], [{}])],
+                   model='m', dimension=3, collection_name='docs')
+    Snapshot(path)
+    assert len(hashed) == 6
+
+
+def test_new_store_embeds_only_the_delta(tmp_path):
+    documents_path = tmp_path / 'documents.json'
+    documents_path.write_text(json.dumps({'documents': ['alpacas graze', 'llamas carry packs']}))
+    snapshot_path = str(tmp_path / 'docs.qbs')
+
+    first = VectorStore(documents_path=str(documents_path), embedder=FakeEmbedder(),
+                        generator=NullGenerator('g'), collection_name='snapshot_source')
+    first.export_snapshot(snapshot_path)
+    first.close()
+
+    documents_path.write_text(json.dumps({'documents': ['alpacas graze', 'llamas carry packs', 'vicunas are wild']}))
+    embedder = FakeEmbedder()
+    replica = VectorStore(documents_path=str(documents_path), embedder=embedder, generator=NullGenerator('g'),
+                          collection_name='snapshot_replica', snapshot_path=snapshot_path)
+    try:
+        assert replica.snapshot_loaded == 2
+        assert replica.collection.count() == 3
+        assert replica.memory_stats()['resident_documents'] == 3
+        # Only the dimension probe and the new document were embedded
+        assert embedder.texts[1:] == ['vicunas are wild']
+        query = replica.embedder.embed_one('alpacas graze')
+        assert replica.retrieve_chunks(query, n_results=1)['documents'][0] == ['alpacas graze']
+    finally:
+        replica.close()
+
+    mismatched = VectorStore(documents_path=str(documents_path), embedder=FakeEmbedder('other-model'),
+                             generator=NullGenerator('g'), collection_name='snapshot_mismatch',
+                             snapshot_path=snapshot_path)
+    try:
+        assert mismatched.snapshot_loaded == 0
+        assert mismatched.collection.count() == 3
+    finally:
+        mismatched.close()
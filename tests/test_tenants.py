@@ -0,0 +1,115 @@
+# tests/test_tenants.py
+import pytest
+from qbot import TenantNotFoundError
+from qbot.models import tenants as tenants_module
+from qbot.models.tenants import TenantManager, validate_tenant
+
+
+class FakeStore:
+    persist_directory = None
+
+    def __init__(self, tenant):
+        self.tenant = tenant.name
+        self.closed = False
+        self.resident_bytes = 0
+
+    def close(self):
+        self.closed = True
+
+    def memory_stats(self):
+        return {'estimated_bytes': self.resident_bytes}
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    monkeypatch.setattr(tenants_module, 'TENANT_DOCUMENTS_DIR', str(tmp_path))
+    return TenantManager(max_loaded=2, idle_seconds=0, store_factory=FakeStore)
+
+
+def test_tenant_keys_are_validated():
+    assert validate_tenant('acme-corp_1') == 'acme-corp_1'
+    for bad in ('', '-acme', 'acme/../etc', 'a' * 60):
+        with pytest.raises(ValueError):
+            validate_tenant(bad)
+
+
+def test_unknown_tenant_is_not_found(manager):
+    with pytest.raises(TenantNotFoundError):
+        manager.get_store('nobody')
+
+
+def test_stores_load_lazily_and_evict_lru(manager):
+    for name in ('a', 'b'):
+        manager.tenant(name, create=True)
+    store_a = manager.get_store('a')
+    manager.get_store('b')
+    manager.get_store('a')
+
+    manager.tenant('c', create=True)
+    manager.get_store('c')
+
+    # 'b' was the least recently used of three loaded tenants with room for two
+    stats = {t['tenant']: t for t in manager.stats()['tenants']}
+    assert not stats['b']['loaded']
+    assert stats['a']['loaded'] and stats['c']['loaded']
+    assert stats['a']['requests'] == 2
+    assert manager.get_store('a') is store_a
+
+
+def test_leased_store_outlives_reload_and_unload(manager):
+    manager.tenant('a', create=True)
+    with manager.lease('a') as store:
+        rebuilt = manager.reload('a')
+        assert rebuilt is not store and not store.closed
+    assert store.closed
+
+    with manager.lease('a') as store:
+        assert store is rebuilt
+        manager.unload('a')
+        assert not store.closed
+    assert store.closed
+
+
+def test_busy_tenant_is_not_evicted(tmp_path, monkeypatch):
+    monkeypatch.setattr(tenants_module, 'TENANT_DOCUMENTS_DIR', str(tmp_path))
+    manager = TenantManager(max_loaded=1, idle_seconds=0, store_factory=FakeStore)
+    for name in ('a', 'b', 'c'):
+        manager.tenant(name, create=True)
+
+    with manager.lease('a') as store_a:
+        manager.get_store('b')
+        assert not store_a.closed
+        assert manager.stats()['loaded_tenants'] == 2
+    manager.get_store('c')
+    assert store_a.closed
+
+
+def test_tenants_share_one_memory_budget(tmp_path, monkeypatch):
+    monkeypatch.setattr(tenants_module, 'TENANT_DOCUMENTS_DIR', str(tmp_path))
+    manager = TenantManager(max_loaded=8, idle_seconds=0, store_factory=FakeStore, memory_budget_bytes=1000)
+    for name in ('a', 'b'):
+        manager.tenant(name, create=True)
+
+    with manager.lease('a') as store_a:
+        store_a.resident_bytes = 600
+    with manager.lease('b') as store_b:
+        store_b.resident_bytes = 600
+        assert not store_a.closed
+    # Once b's request has grown its index the two no longer fit, so the least recently used goes
+    assert store_a.closed and not store_b.closed
+    assert manager.stats()['resident_bytes'] == 600
+
+
+def test_clear_deletes_the_tenant_snapshot(manager, tmp_path, monkeypatch):
+    snapshots = tmp_path / 'snapshots'
+    snapshots.mkdir()
+    monkeypatch.setattr(tenants_module, 'SNAPSHOT_PATH', str(snapshots))
+    tenant = manager.tenant('a', create=True)
+    snapshot = snapshots / f'{tenant.collection_name}.qbs'
+    snapshot.write_bytes(b'QBOTSNAP')
+
+    manager.get_store('a')
+    manager.reload('a')
+    assert snapshot.exists()
+    manager.clear('a')
+    assert not snapshot.exists()